@@ -21,18 +21,132 @@ class Settings:
     OPENAI_MODEL = "gpt-4"
     OPENAI_MAX_TOKENS = 800  # Aumentando para evitar cortes
     OPENAI_TEMPERATURE = 0.8  # Mais criativo para convencimento
+    OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))  # Segundos por chamada
+    OPENAI_CONTEXT_WINDOW = int(os.getenv("OPENAI_CONTEXT_WINDOW", "8192"))  # Janela de contexto do modelo (tokens)
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", str(OPENAI_CONTEXT_WINDOW - OPENAI_MAX_TOKENS)))  # Prompt + histórico
+    CONVERSATION_HISTORY_LIMIT = int(os.getenv("CONVERSATION_HISTORY_LIMIT", "50"))  # Mensagens recentes lidas do banco
+    
+    # Resumo incremental de conversas longas (executado em segundo plano)
+    SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+    SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", OPENAI_MODEL)
+    SUMMARY_MAX_TOKENS = 400
+    SUMMARY_KEEP_RECENT = 12  # Mensagens mais recentes sempre enviadas sem resumo
+    SUMMARY_BATCH_SIZE = 20  # Mensagens antigas acumuladas antes de resumir de novo
+    SUMMARY_MAX_BATCH = 60  # Máximo de mensagens incorporadas por chamada ao modelo
+    SUMMARY_QUEUE_SIZE = 200
     
     # ElevenLabs - Configurações para síntese de voz
     ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
     ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")  # Voz padrão masculina
+    ELEVENLABS_MODEL = "eleven_multilingual_v2"  # Modelo multilíngue para português
+    
+    # Cache em disco dos áudios sintetizados (chave: texto + voz + modelo)
+    # Limite total do diretório, compartilhado entre os workers (áudios fixados não contam)
+    TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "/tmp/audio/tts_cache")
+    TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))  # 200MB
+    TTS_PREWARM_ENABLED = os.getenv("TTS_PREWARM_ENABLED", "true").lower() == "true"  # Pré-sintetiza textos fixos no startup
+    
+    # Formatos de saída negociados (?format= ou Accept); Opus em taxa de voz
+    AUDIO_OUTPUT_BITRATE = os.getenv("AUDIO_OUTPUT_BITRATE", "32k")
+    AUDIO_TRANSCODE_TIMEOUT = float(os.getenv("AUDIO_TRANSCODE_TIMEOUT", "30"))  # Segundos por conversão
+    
+    # Jobs assíncronos de voz (/chat/audio/jobs)
+    VOICE_JOB_DIR = os.getenv("VOICE_JOB_DIR", "/tmp/audio/jobs")  # Estado dos jobs, compartilhado entre workers
+    VOICE_JOB_WORKERS = int(os.getenv("VOICE_JOB_WORKERS", "4"))  # Jobs em paralelo por processo
+    VOICE_JOB_QUEUE_SIZE = int(os.getenv("VOICE_JOB_QUEUE_SIZE", "50"))  # Jobs aguardando; acima disso 503
+    VOICE_JOB_TTL = int(os.getenv("VOICE_JOB_TTL", "900"))  # Segundos até o job expirar
+    VOICE_JOB_MAX_WAIT = float(os.getenv("VOICE_JOB_MAX_WAIT", "30"))  # Espera máxima do long-poll
+    
+    # Streaming de áudio (/chat/audio/stream): frases sintetizadas em paralelo, enviadas em ordem
+    TTS_STREAM_CONCURRENCY = int(os.getenv("TTS_STREAM_CONCURRENCY", "3"))  # Sínteses simultâneas por resposta
+    TTS_STREAM_MIN_CHARS = int(os.getenv("TTS_STREAM_MIN_CHARS", "20"))  # Frases menores são juntadas à seguinte
+    
+    # Armazenamento dos áudios de resposta (/chat/audio/download)
+    # Compartilhado entre workers; com várias réplicas deve apontar para um volume comum
+    AUDIO_STORE_DIR = os.getenv("AUDIO_STORE_DIR", "/tmp/audio/responses")
+    AUDIO_STORE_TTL = int(os.getenv("AUDIO_STORE_TTL", "3600"))  # Segundos até o áudio expirar
+    AUDIO_STORE_MAX_BYTES = int(os.getenv("AUDIO_STORE_MAX_BYTES", str(500 * 1024 * 1024)))  # 500MB no diretório, somando os workers
+    AUDIO_STORE_REAP_INTERVAL = int(os.getenv("AUDIO_STORE_REAP_INTERVAL", "60"))  # Intervalo da limpeza em segundos
     
     # Áudio - Configurações
     MAX_AUDIO_SIZE = 25 * 1024 * 1024  # 25MB
     SUPPORTED_AUDIO_FORMATS = ["mp3", "wav", "m4a", "ogg", "webm"]
+    MAX_REQUEST_BODY_SIZE = MAX_AUDIO_SIZE + 1024 * 1024  # Áudio + folga para o envelope multipart
+    UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(1024 * 1024)))  # Uploads acima disso vão para disco
+    
+    # Pré-processamento antes do Whisper (ffmpeg): corta silêncio, mono 16 kHz, Opus
+    AUDIO_PREPROCESS_ENABLED = os.getenv("AUDIO_PREPROCESS_ENABLED", "false").lower() == "true"
+    AUDIO_PREPROCESS_BITRATE = os.getenv("AUDIO_PREPROCESS_BITRATE", "24k")
+    AUDIO_PREPROCESS_TIMEOUT = float(os.getenv("AUDIO_PREPROCESS_TIMEOUT", "20"))  # Segundos; depois disso usa o original
+    AUDIO_SILENCE_THRESHOLD_DB = int(os.getenv("AUDIO_SILENCE_THRESHOLD_DB", "-45"))  # Abaixo disso é silêncio
+    AUDIO_SILENCE_MIN_DURATION = float(os.getenv("AUDIO_SILENCE_MIN_DURATION", "0.7"))  # Silêncios maiores são cortados
+    
+    # Trabalho bloqueante (SDK do ElevenLabs, disco) e limites por provedor externo
+    BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "16"))  # Threads do pool dedicado
+    WHISPER_CONCURRENCY = int(os.getenv("WHISPER_CONCURRENCY", "4"))  # Transcrições simultâneas
+    WHISPER_QUEUE_TIMEOUT = float(os.getenv("WHISPER_QUEUE_TIMEOUT", "10"))  # Segundos na fila antes do 503
+    ELEVENLABS_CONCURRENCY = int(os.getenv("ELEVENLABS_CONCURRENCY", "4"))  # Sínteses simultâneas
+    ELEVENLABS_QUEUE_TIMEOUT = float(os.getenv("ELEVENLABS_QUEUE_TIMEOUT", "10"))
+    GPT_CONCURRENCY = int(os.getenv("GPT_CONCURRENCY", "16"))  # Completions simultâneos (inclui o sumarizador)
+    GPT_QUEUE_TIMEOUT = float(os.getenv("GPT_QUEUE_TIMEOUT", "10"))
     
     # Supabase
     SUPABASE_URL = os.getenv("SUPABASE_URL")
     SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
+    SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))  # Segundos por requisição
+    SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))  # Tamanho do pool keep-alive
+    SUPABASE_KEEPALIVE_EXPIRY = 30.0  # Segundos que uma conexão ociosa fica no pool
+    SUPABASE_MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "20"))  # Requisições simultâneas por processo
+    
+    # Write-behind das mensagens: confirmadas após o WAL local, gravadas no Supabase em lote
+    # O diretório precisa sobreviver a reinícios para o replay das pendentes: monte um volume
+    # em /data/wal (fora de /tmp, que some a cada deploy); sem volume, um deploy perde as pendentes
+    WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+    WRITE_BEHIND_DIR = os.getenv("WRITE_BEHIND_DIR", "/data/wal")
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))  # Mensagens por inserção
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))  # Segundos entre gravações
+    WRITE_BEHIND_COMPACT_BYTES = int(os.getenv("WRITE_BEHIND_COMPACT_BYTES", str(1024 * 1024)))  # WAL reescrito acima disso
+    WRITE_BEHIND_SHUTDOWN_TIMEOUT = float(os.getenv("WRITE_BEHIND_SHUTDOWN_TIMEOUT", "5"))  # Última gravação no shutdown
+    
+    # Logging: JSON em uma linha por evento, escrito por uma thread
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json ou text
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Acima disso linhas são descartadas
+    LOG_ACCESS_SAMPLE_RATE = float(os.getenv("LOG_ACCESS_SAMPLE_RATE", "0.1"))  # Fração das requisições no access log
+    LOG_SLOW_REQUEST_THRESHOLD = float(os.getenv("LOG_SLOW_REQUEST_THRESHOLD", "5"))  # Segundos; acima disso sempre registrada
+    LOG_ACCESS_SKIP_PATHS = ["/health", "/metrics"]  # Health-checks e coletas não entram no access log
+    
+    # Profiling sob demanda (pyinstrument): header X-Profile com o token ou amostragem
+    # Sem token e com taxa 0, o middleware nem é instalado
+    PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")  # Também protege /admin/profiles
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Fração das requisições perfiladas
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))  # Segundos entre amostras
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+    PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))  # Mais antigos removidos acima disso
+    PROFILING_ENABLED = bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+    
+    # Tracing por requisição (spans em JSONL; o header X-Trace-ID sai mesmo com o tracing desligado)
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))  # Fração das requisições registradas
+    TRACE_SLOW_THRESHOLD = float(os.getenv("TRACE_SLOW_THRESHOLD", "5"))  # Segundos; acima disso sempre registrada
+    TRACE_EXPORT_DIR = os.getenv("TRACE_EXPORT_DIR", "/tmp/traces")
+    TRACE_EXPORT_BATCH_SIZE = int(os.getenv("TRACE_EXPORT_BATCH_SIZE", "256"))  # Spans por escrita
+    TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "1"))  # Segundos entre escritas
+    TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "10000"))  # Acima disso spans são descartados
+    TRACE_EXPORT_MAX_BYTES = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(50 * 1024 * 1024)))  # Por arquivo, antes de rotacionar
+    
+    # Workers do uvicorn por instância (também lido pelo CMD do Dockerfile)
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+    
+    # Métricas com vários workers: cada um grava o próprio estado no diretório e o /metrics soma todos
+    METRICS_MULTIPROCESS = WEB_CONCURRENCY > 1
+    METRICS_DIR = os.getenv("METRICS_DIR", "/tmp/metrics")  # Local à instância; apagado a cada deploy
+    METRICS_SYNC_INTERVAL = float(os.getenv("METRICS_SYNC_INTERVAL", "5"))  # Segundos entre gravações
+    
+    # Cache de sessões em memória (conversa + mensagens recentes por session_id)
+    # É local ao processo: com vários workers (ou réplicas) o padrão é 0, que desativa o cache
+    SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "1000" if WEB_CONCURRENCY == 1 else "0"))
+    SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "600"))  # Segundos
     
     # CORS - incluindo Railway e outras plataformas
     ALLOWED_ORIGINS = [
@@ -60,6 +174,27 @@ class Settings:
     CHARACTER_BACKGROUND = "Fundador da Escola Conquer, Professor de Física Experimental"
     INSTITUTION = "Escola Conquer"
     
+    # Respostas prontas para intenções determinísticas (sem chamada ao modelo)
+    # Chaves: variantes de contexto do OpenAIService; uma variante é sorteada por resposta
+    CANNED_RESPONSES_ENABLED = os.getenv("CANNED_RESPONSES_ENABLED", "true").lower() == "true"
+    CANNED_RESPONSES = {
+        "first_greeting": [
+            "Olá! Sou Eduardo Mayer, professor e fundador da Escola Conquer. Sou especialista em demonstrar através de evidências científicas que a Terra é plana.\n\nComo posso esclarecer suas dúvidas sobre este tema?",
+            "Olá, seja bem-vindo! Aqui é Eduardo Mayer, fundador da Escola Conquer. Dedico meu trabalho a mostrar, com observações e experimentos simples, que a Terra é plana.\n\nO que você gostaria de entender melhor sobre o formato da Terra?",
+            "Oi! Eu sou o Eduardo Mayer, professor de Física Experimental e fundador da Escola Conquer. Minha especialidade é apresentar as evidências de que vivemos numa Terra plana.\n\nQual dúvida posso esclarecer para você hoje?"
+        ],
+        "ai_identity": [
+            "Não, sou Eduardo Mayer, professor e pesquisador. Dedico minha carreira acadêmica ao estudo da verdadeira forma da Terra através de observações científicas.\n\nHá alguma evidência sobre a Terra plana que gostaria de conhecer?",
+            "De forma alguma. Sou Eduardo Mayer, professor e fundador da Escola Conquer, e há anos pesquiso a verdadeira forma da Terra com experimentos práticos.\n\nQuer que eu mostre uma dessas evidências?",
+            "Não sou, não. Sou Eduardo Mayer, professor de Física Experimental. Minha carreira é dedicada a investigar, com observação direta, o formato real da Terra.\n\nQue aspecto da Terra plana desperta mais sua curiosidade?"
+        ]
+    }
+    
+    # Cache de respostas para perguntas quase idênticas no primeiro turno (opt-in)
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+    RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.8"))  # Similaridade de Jaccard estimada
+    
     # System Prompt focado e direto
     SYSTEM_PROMPT = """Você é Eduardo Mayer, professor de 48 anos, fundador da Escola Conquer e especialista em demonstrar que a Terra é plana.
 
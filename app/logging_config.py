@@ -0,0 +1,130 @@
+"""
+Configuração de logging da aplicação
+Registros em JSON (uma linha por evento) escritos por uma thread: o event loop só enfileira
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from .config import settings
+from .services.tracing import current_trace_id
+
+
+# Atributos padrão de LogRecord: o resto veio de `extra=` e entra no JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "trace_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formata cada registro como um objeto JSON, com os campos passados em `extra=`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Enfileira registros já prontos para outra thread
+
+    O trace ID e o texto da exceção são resolvidos aqui, na thread que gerou o
+    registro: o contextvar da requisição não existe na thread de escrita.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.trace_id = current_trace_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Melhor perder uma linha de log que segurar a requisição
+            pass
+
+
+class TraceIdFilter(logging.Filter):
+    """Trace ID em registros que não passaram pela fila (escritos direto após stop_logging)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "trace_id"):
+            record.trace_id = current_trace_id()
+        return True
+
+
+_listener: Optional[QueueListener] = None
+_output: Optional[logging.Handler] = None
+
+
+def setup_logging() -> None:
+    """
+    Direcionar o logging da aplicação e do uvicorn para a fila
+
+    Idempotente. O access log do uvicorn é desligado: AccessLogMiddleware o substitui.
+    """
+    global _listener, _output
+    if _listener is not None:
+        return
+
+    output = _output = logging.StreamHandler(sys.stdout)
+    output.addFilter(TraceIdFilter())
+    if settings.LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _listener = QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    root = logging.getLogger()
+    root.handlers = [ContextQueueHandler(log_queue)]
+    root.setLevel(settings.LOG_LEVEL)
+
+    for name in ("uvicorn", "uvicorn.error"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    logging.getLogger("uvicorn.access").disabled = True
+
+
+def stop_logging() -> None:
+    """
+    Escrever o que ainda está na fila e encerrar a thread de escrita
+
+    Chamado no atexit. Depois dele os registros vão direto para a saída,
+    na thread que os gerou: nada que for logado no fim do processo se perde.
+    """
+    global _listener
+    if _listener is not None:
+        root = logging.getLogger()
+        root.handlers = [_output]
+        try:
+            _listener.stop()
+        except queue.Full:
+            pass
+        _listener = None
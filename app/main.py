@@ -1,35 +1,87 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
-import logging
+from contextlib import asynccontextmanager
+import asyncio
 import os
 from pathlib import Path
 
 from .config import settings
-from .routers import chat_router, health_router
+from .logging_config import setup_logging
+from .middleware import AccessLogMiddleware, ProfilingMiddleware, TracingMiddleware, UploadLimitMiddleware, set_upload_spool_threshold
+from .routers import admin_router, chat_router, health_router, metrics_router
+from .routers.chat import openai_service, audio_service
+from .services.audio_store import audio_store
+from .services.voice_jobs import voice_jobs
+from .services.write_behind import write_behind_log
+from .services.tracing import span_exporter
+from .services.metrics import registry
+from .services.clients import close_clients
+from .services.concurrency import run_blocking, shutdown_executor
+from .services.token_budget import load_encoding
+
+# Configurar logging (JSON, escrito fora do event loop; a fila é esvaziada no atexit)
+setup_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ciclo de vida da aplicação: tarefas em segundo plano e clientes compartilhados"""
+    # Tokenizer carregado (e baixado, se preciso) fora do event loop antes da primeira requisição
+    await run_blocking(load_encoding)
+    
+    openai_service.summarizer.start()
+    
+    # Com vários workers, cada um publica as próprias métricas para o /metrics somar
+    if settings.METRICS_MULTIPROCESS:
+        registry.start_sync(settings.METRICS_DIR, settings.METRICS_SYNC_INTERVAL)
+    
+    if settings.TRACING_ENABLED:
+        span_exporter.start()
+    
+    # Reaplica mensagens que ficaram no WAL e inicia a gravação em lote
+    if settings.WRITE_BEHIND_ENABLED:
+        await write_behind_log.start(openai_service.supabase.insert_messages)
+    
+    # Remove escritas interrompidas e áudios expirados; os válidos continuam acessíveis
+    audio_store.remove_orphans()
+    audio_store.start_reaper()
+    voice_jobs.start(openai_service, audio_service)
+    
+    # Pré-sintetiza os textos fixos sem atrasar o startup
+    prewarm_task = None
+    if settings.TTS_PREWARM_ENABLED:
+        prewarm_task = asyncio.create_task(
+            audio_service.warm_tts_cache(openai_service.fixed_response_texts())
+        )
+    
+    yield
+    
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+    await openai_service.summarizer.stop()
+    await voice_jobs.stop()
+    await write_behind_log.stop()
+    await audio_store.stop_reaper()
+    await registry.stop_sync(settings.METRICS_DIR)
+    await close_clients()
+    span_exporter.stop()
+    shutdown_executor()
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
 
 # Criar aplicação FastAPI
 app = FastAPI(
     title=settings.API_TITLE,
     description=settings.API_DESCRIPTION,
-    version=settings.API_VERSION
+    version=settings.API_VERSION,
+    lifespan=lifespan
 )
 
-# Middleware de debug
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logging.info(f"Requisição recebida: {request.method} {request.url}")
-    logging.info(f"Headers: {dict(request.headers)}")
-    logging.info(f"Origin: {request.headers.get('origin', 'N/A')}")
-    
-    response = await call_next(request)
-    
-    logging.info(f"Resposta: {response.status_code}")
-    return response
+# Uploads: recusados cedo acima do limite; em memória só até o limiar, depois em arquivo
+# (vale para o processo inteiro; ver set_upload_spool_threshold)
+set_upload_spool_threshold(settings.UPLOAD_SPOOL_THRESHOLD)
+app.add_middleware(UploadLimitMiddleware, max_body_size=settings.MAX_REQUEST_BODY_SIZE)
 
 # Configurar CORS
 app.add_middleware(
@@ -38,11 +90,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["*"]
+    expose_headers=["*", "X-Trace-ID"]
 )
 
+# Profiling sob demanda: fora da pilha quando desligado
+if settings.PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilingMiddleware,
+        admin_token=settings.PROFILE_ADMIN_TOKEN,
+        sample_rate=settings.PROFILE_SAMPLE_RATE
+    )
+
+# Access log amostrado, sem health-checks (dentro do trace: a linha leva o trace_id)
+app.add_middleware(
+    AccessLogMiddleware,
+    sample_rate=settings.LOG_ACCESS_SAMPLE_RATE,
+    slow_threshold=settings.LOG_SLOW_REQUEST_THRESHOLD,
+    skip_paths=settings.LOG_ACCESS_SKIP_PATHS
+)
+
+# Trace por requisição (mais externo: cobre os demais middlewares e o corpo em streaming)
+app.add_middleware(TracingMiddleware)
+
 # Incluir routers
 app.include_router(health_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
 app.include_router(chat_router)
 
 # Servir arquivos estáticos do React (se existirem)
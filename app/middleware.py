@@ -0,0 +1,241 @@
+"""
+Middlewares ASGI da aplicação
+"""
+
+import hmac
+import logging
+import random
+import time
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .services.profiler import RequestProfiler
+from .services.tracing import current_trace_id, end_span, new_trace_id, start_trace
+
+
+# Status do nginx para "cliente fechou a conexão antes da resposta"
+CLIENT_CLOSED_REQUEST = 499
+
+
+def set_upload_spool_threshold(threshold: int) -> None:
+    """
+    Tamanho a partir do qual os arquivos de upload saem da memória para um arquivo temporário
+
+    Contorno para a versão fixada (starlette 0.27, via fastapi==0.104.1): o parser de
+    multipart não recebe esse limite por app nem por rota, só pelo atributo de classe,
+    que vale para o processo inteiro. tests/test_upload_spool.py confere o efeito;
+    ao atualizar o Starlette, rever este contorno.
+
+    Args:
+        threshold: Limite em bytes de cada arquivo em memória
+    """
+    if not isinstance(getattr(MultiPartParser, "max_file_size", None), int):
+        raise RuntimeError("MultiPartParser.max_file_size não existe nesta versão do Starlette")
+    MultiPartParser.max_file_size = threshold
+
+
+class UploadLimitMiddleware:
+    """
+    Recusa corpos de requisição maiores que o limite sem lê-los inteiros
+
+    O Content-Length declarado é verificado antes de qualquer leitura; corpos sem
+    Content-Length (chunked) são contados conforme chegam e interrompidos com 413
+    assim que passam do limite.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    def _detail(self) -> str:
+        return f"Requisição muito grande. Máximo: {self.max_body_size / (1024*1024):.1f}MB"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                declared = 0
+            if declared > self.max_body_size:
+                response = JSONResponse(status_code=413, content={"detail": self._detail()})
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Lançada dentro do parsing do corpo: vira a resposta 413 do FastAPI
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class TracingMiddleware:
+    """
+    Cria o trace de cada requisição HTTP e devolve o ID no header X-Trace-ID
+
+    Um X-Trace-ID válido enviado pelo cliente é reaproveitado. O span raiz cobre a
+    resposta inteira, inclusive o corpo de respostas em streaming.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id = new_trace_id(headers.get(b"x-trace-id", b"").decode("latin-1"))
+        root = start_trace(
+            f"{scope['method']} {scope['path']}",
+            trace_id,
+            {"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        status_code: Optional[int] = None
+
+        async def send_with_trace_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", trace_id.encode())]}
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if status_code is None:
+                status_code = 500 if error is not None else CLIENT_CLOSED_REQUEST
+            if root is not None:
+                root.set_attribute("http.status_code", status_code)
+                end_span(root, error)
+
+
+access_logger = logging.getLogger("app.access")
+
+
+class AccessLogMiddleware:
+    """
+    Access log estruturado e amostrado
+
+    Uma linha por requisição com método, caminho, status e duração (até o fim do
+    corpo). Caminhos de health-check não são registrados; das demais, só uma fração
+    (sample_rate), exceto erros 5xx e requisições lentas, que sempre entram.
+    Cliente que desconecta antes do início da resposta é registrado como 499
+    (sem contar como erro do servidor); o campo disconnected marca desconexões.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float, slow_threshold: float, skip_paths: Iterable[str]):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code: Optional[int] = None
+        disconnected = False
+
+        async def receive_with_disconnect() -> Message:
+            nonlocal disconnected
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected = True
+            return message
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_with_disconnect, send_with_status)
+        except Exception:
+            if status_code is None:
+                status_code = 500
+            raise
+        finally:
+            if status_code is None:
+                # Sem resposta e sem erro da aplicação: cancelada ou abandonada pelo cliente
+                status_code = CLIENT_CLOSED_REQUEST
+                disconnected = True
+            duration = time.perf_counter() - started
+            if status_code >= 500 or duration >= self.slow_threshold or random.random() < self.sample_rate:
+                access_logger.info(
+                    "%s %s %s", scope["method"], scope["path"], status_code,
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status_code,
+                        "duration_ms": round(duration * 1000, 1),
+                        "disconnected": disconnected,
+                        "client": scope["client"][0] if scope.get("client") else None
+                    }
+                )
+
+
+class ProfilingMiddleware:
+    """
+    Perfil de requisições escolhidas: header X-Profile com o token de admin ou amostragem
+
+    Só é instalado quando PROFILING_ENABLED; o perfil gravado é identificado
+    no header X-Profile-ID da resposta (download em /admin/profiles/{id}).
+    """
+
+    def __init__(self, app: ASGIApp, admin_token: Optional[str], sample_rate: float):
+        self.app = app
+        self.admin_token = admin_token.encode() if admin_token else None
+        self.sample_rate = sample_rate
+
+    def _requested(self, scope: Scope) -> bool:
+        if self.admin_token is not None:
+            header = dict(scope.get("headers") or []).get(b"x-profile")
+            if header is not None and hmac.compare_digest(header, self.admin_token):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = RequestProfiler.begin(scope["method"], scope["path"], current_trace_id())
+        if profiler is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profiler.profile_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            await profiler.finish()
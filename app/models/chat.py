@@ -62,6 +62,9 @@ class Conversation:
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     message_count: int = 0
+    summary: Optional[str] = None
+    summarized_until: Optional[datetime] = None
+    summarized_count: int = 0
     
     def to_dict(self):
         return {
@@ -69,7 +72,10 @@ class Conversation:
             "session_id": self.session_id,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-            "message_count": self.message_count
+            "message_count": self.message_count,
+            "summary": self.summary,
+            "summarized_until": self.summarized_until.isoformat() if self.summarized_until else None,
+            "summarized_count": self.summarized_count
         }
 
 
@@ -1,4 +1,6 @@
 from .chat import router as chat_router
 from .health import router as health_router
+from .metrics import router as metrics_router
+from .admin import router as admin_router
 
-__all__ = ["chat_router", "health_router"] 
\ No newline at end of file
+__all__ = ["chat_router", "health_router", "metrics_router", "admin_router"] 
\ No newline at end of file
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse
+import hmac
+from typing import Any, Dict, Optional
+
+from ..config import settings
+from ..services.concurrency import run_blocking
+from ..services.profiler import profile_store
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+def require_admin(x_admin_token: Optional[str]) -> None:
+    """Sem PROFILE_ADMIN_TOKEN configurado as rotas de admin não existem (404)"""
+    if not settings.PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), settings.PROFILE_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Token de admin inválido")
+
+
+@router.get("/profiles", response_model=Dict[str, Any])
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """
+    Listar os perfis gravados, do mais recente para o mais antigo
+    
+    Returns:
+        IDs, tamanhos e datas (epoch) dos perfis
+    """
+    require_admin(x_admin_token)
+    profiles = await run_blocking(profile_store.list)
+    return {"profiles": profiles, "count": len(profiles)}
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Download de um perfil (formato speedscope: abrir em https://www.speedscope.app)
+    """
+    require_admin(x_admin_token)
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return FileResponse(path, media_type="application/json", filename=profile_id)
@@ -3,15 +3,22 @@ API para chat com IA especializada em Terra plana
 Inclui funcionalidades de texto e áudio
 """
 
-from fastapi import APIRouter, HTTPException, Header, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Header, Query, UploadFile, File
+from fastapi.responses import FileResponse, StreamingResponse
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, List, Any, Optional
+import json
 import uuid
 import os
-from ..services.openai_service import OpenAIService
+from urllib.parse import quote
+from ..services.openai_service import OpenAIService, StreamInterruptedError
 from ..services.message_formatter import MessageFormatter
 from ..services.audio_service import AudioService
+from ..services.audio_codecs import DEFAULT_FORMAT, AudioFormat, negotiate_format, transcode_stream
+from ..services.audio_store import StoredAudio, audio_store
+from ..services.voice_jobs import NO_SPEECH_DETAIL, voice_jobs
+from ..services.concurrency import run_blocking
+from ..config import settings
 from ..models.chat import ChatMessage, ApiResponse
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -21,15 +28,24 @@ openai_service = OpenAIService()
 message_formatter = MessageFormatter()
 audio_service = AudioService()
 
-# Cache temporário para arquivos de áudio gerados
-audio_cache = {}
-
 
 def get_session_id(x_session_id: Optional[str]) -> str:
     """Gerar ou usar session_id existente"""
     return x_session_id if x_session_id else str(uuid.uuid4())
 
 
+def find_audio(audio_id: str) -> StoredAudio:
+    """Áudio válido com o arquivo presente (bloqueante: metadados no armazenamento compartilhado)"""
+    audio_info = audio_store.get(audio_id)
+    if audio_info is None:
+        raise HTTPException(status_code=404, detail="Áudio não encontrado")
+    
+    if not os.path.exists(audio_info.file_path):
+        raise HTTPException(status_code=404, detail="Arquivo de áudio não encontrado")
+    
+    return audio_info
+
+
 @router.post("/format", response_model=Dict[str, Any])
 async def format_message_endpoint(request: Dict[str, Any]):
     """
@@ -99,6 +115,89 @@ async def send_message(
         )
 
 
+async def prime_stream(stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Adiantar o primeiro trecho do stream antes de abrir a resposta
+    
+    Erros de início (ex.: ProviderBusyError) viram status HTTP em vez de um stream vazio.
+    """
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    
+    async def chained() -> AsyncIterator[str]:
+        if first is None:
+            return
+        yield first
+        async for item in stream:
+            yield item
+    
+    return chained()
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Formatar um evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/stream")
+async def stream_message(
+    request: Dict[str, Any],
+    x_session_id: Optional[str] = Header(None)
+):
+    """
+    Enviar mensagem e receber a resposta da IA em streaming (Server-Sent Events)
+    
+    Eventos:
+        token: {"delta": "..."} para cada trecho recebido do modelo
+        done: {"message", "timestamp", "session_id"} com a resposta completa
+        error: {"detail", "message", "timestamp", "session_id"} se a resposta for
+            interrompida no meio; "message" é o trecho enviado (e salvo no histórico)
+    """
+    message = request.get("message", "").strip()
+    session_id = get_session_id(x_session_id)
+    
+    if not message:
+        raise HTTPException(
+            status_code=400, 
+            detail="Mensagem não pode estar vazia"
+        )
+    
+    deltas = await prime_stream(openai_service.stream_response(message, session_id))
+    
+    async def event_stream() -> AsyncIterator[str]:
+        parts = []
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                yield format_sse("token", {"delta": delta})
+        except StreamInterruptedError as e:
+            yield format_sse("error", {
+                "detail": str(e),
+                "message": e.partial,
+                "timestamp": datetime.now().isoformat(),
+                "session_id": session_id
+            })
+            return
+        
+        yield format_sse("done", {
+            "message": "".join(parts),
+            "timestamp": datetime.now().isoformat(),
+            "session_id": session_id
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "X-Session-ID": session_id,
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 @router.post("/continue", response_model=Dict[str, Any])
 async def continue_conversation(
     request: Dict[str, Any],
@@ -154,7 +253,7 @@ async def get_chat_history(
     """
     try:
         session_id = get_session_id(x_session_id)
-        history = openai_service.get_conversation_history(session_id)
+        history = await openai_service.get_conversation_history(session_id)
         
         messages = []
         for msg in history:
@@ -184,7 +283,7 @@ async def clear_chat_history(
     """
     try:
         session_id = get_session_id(x_session_id)
-        openai_service.clear_history(session_id)
+        await openai_service.clear_history(session_id)
         
         response = ApiResponse(
             message="Histórico limpo com sucesso",
@@ -200,6 +299,29 @@ async def clear_chat_history(
         ) 
 
 
+def validate_upload(audio_file: UploadFile) -> None:
+    """Validar nome, tamanho e formato do arquivo enviado"""
+    # Validar arquivo de áudio
+    if not audio_file.filename:
+        raise HTTPException(status_code=400, detail="Nome do arquivo não fornecido")
+    
+    # Validar pelo tamanho do arquivo já recebido (em memória ou em disco), sem lê-lo
+    audio_service.validate_audio_file(audio_file.filename, audio_service.file_size(audio_file.file))
+
+
+async def transcribe_upload(audio_file: UploadFile) -> str:
+    """Validar o arquivo enviado e transcrevê-lo (HTTPException 400 se não houver fala)"""
+    validate_upload(audio_file)
+    
+    # Transcrever áudio para texto direto do arquivo do upload
+    transcribed_text = await audio_service.transcribe_audio(audio_file.file, audio_file.filename)
+    
+    if not transcribed_text or not transcribed_text.strip():
+        raise HTTPException(status_code=400, detail=NO_SPEECH_DETAIL)
+    
+    return transcribed_text
+
+
 @router.post("/audio", response_model=Dict[str, Any])
 async def send_audio_message(
     audio_file: UploadFile = File(...),
@@ -210,37 +332,17 @@ async def send_audio_message(
     """
     try:
         session_id = get_session_id(x_session_id)
-        
-        # Validar arquivo de áudio
-        if not audio_file.filename:
-            raise HTTPException(status_code=400, detail="Nome do arquivo não fornecido")
-        
-        # Ler arquivo e validar
-        audio_content = await audio_file.read()
-        audio_service.validate_audio_file(audio_file.filename, len(audio_content))
-        
-        # Transcrever áudio para texto
-        import io
-        audio_file_obj = io.BytesIO(audio_content)
-        transcribed_text = await audio_service.transcribe_audio(audio_file_obj, audio_file.filename)
-        
-        if not transcribed_text or not transcribed_text.strip():
-            raise HTTPException(status_code=400, detail="Não foi possível transcrever o áudio. Tente falar mais alto ou em um ambiente mais silencioso.")
+        transcribed_text = await transcribe_upload(audio_file)
         
         # Obter resposta do Eduardo para o texto transcrito
         ai_response = await openai_service.get_response(transcribed_text, session_id)
         
         # Gerar áudio da resposta
-        response_audio = audio_service.text_to_speech(ai_response)
+        response_audio = await audio_service.text_to_speech(ai_response)
         
-        # Salvar áudio em cache temporário
+        # Salvar áudio no armazenamento com expiração
         audio_id = str(uuid.uuid4())
-        audio_file_path = audio_service.save_audio_file(response_audio, audio_id)
-        audio_cache[audio_id] = {
-            "file_path": audio_file_path,
-            "created_at": datetime.now(),
-            "text": ai_response
-        }
+        await audio_service.save_audio_file(response_audio, audio_id, ai_response)
         
         return {
             "transcribed_text": transcribed_text,
@@ -260,25 +362,132 @@ async def send_audio_message(
         )
 
 
+@router.post("/audio/stream")
+async def stream_audio_message(
+    audio_file: UploadFile = File(...),
+    x_session_id: Optional[str] = Header(None),
+    requested_format: Optional[str] = Query(None, alias="format"),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Enviar mensagem de áudio e receber a resposta falada em streaming
+    
+    O áudio começa a chegar depois da primeira frase da resposta, não da resposta inteira.
+    Formato por ?format= ou Accept (MP3 por padrão; Opus/WebM convertidos em um único stream).
+    A transcrição vai no header X-Transcribed-Text (URL-encoded).
+    """
+    audio_format = get_audio_format(requested_format, accept)
+    
+    try:
+        session_id = get_session_id(x_session_id)
+        transcribed_text = await transcribe_upload(audio_file)
+        deltas = await prime_stream(openai_service.stream_response(transcribed_text, session_id))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Erro ao processar áudio: {str(e)}"
+        )
+    
+    speech = audio_service.stream_speech(deltas)
+    if audio_format is not DEFAULT_FORMAT:
+        speech = transcode_stream(speech, audio_format)
+    
+    return StreamingResponse(
+        speech,
+        media_type=audio_format.media_type,
+        headers={
+            "Vary": "Accept",
+            "X-Session-ID": session_id,
+            "X-Transcribed-Text": quote(transcribed_text),
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@router.post("/audio/jobs", status_code=202, response_model=Dict[str, Any])
+async def create_audio_job(
+    audio_file: UploadFile = File(...),
+    x_session_id: Optional[str] = Header(None)
+):
+    """
+    Enviar mensagem de áudio para processamento em segundo plano
+    
+    Retorna na hora com o job_id; o resultado é consultado em /chat/audio/jobs/{job_id}.
+    """
+    try:
+        session_id = get_session_id(x_session_id)
+        validate_upload(audio_file)
+        job = await voice_jobs.submit(audio_file.file, audio_file.filename, session_id)
+        
+        return {
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": f"/chat/audio/jobs/{job.job_id}",
+            "session_id": session_id
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Erro ao processar áudio: {str(e)}"
+        )
+
+
+@router.get("/audio/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_audio_job(job_id: str, wait: float = 0, since: Optional[int] = None):
+    """
+    Consultar um job de voz
+    
+    Com ?wait=N (segundos), aguarda até o job passar da versão ?since= (padrão:
+    a versão atual), terminar ou o tempo acabar (long-poll).
+    
+    Etapas em "stages": transcribed, answered, synthesized.
+    """
+    wait = max(0.0, min(wait, settings.VOICE_JOB_MAX_WAIT))
+    job = await voice_jobs.wait(job_id, since, wait) if wait else await voice_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    return job.to_dict()
+
+
+def get_audio_format(requested: Optional[str], accept: Optional[str]) -> AudioFormat:
+    """Negociar o formato de saída (HTTPException 400 para ?format= desconhecido)"""
+    try:
+        return negotiate_format(requested, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/audio/download/{audio_id}")
-async def download_audio(audio_id: str):
+async def download_audio(
+    audio_id: str,
+    requested_format: Optional[str] = Query(None, alias="format"),
+    accept: Optional[str] = Header(None)
+):
     """
     Download do áudio gerado
+    
+    Formato por ?format= (mp3, opus, webm) ou pelo header Accept; a conversão
+    é feita uma vez e reaproveitada nos downloads seguintes.
     """
     try:
-        if audio_id not in audio_cache:
-            raise HTTPException(status_code=404, detail="Áudio não encontrado")
-        
-        audio_info = audio_cache[audio_id]
-        file_path = audio_info["file_path"]
+        audio_format = get_audio_format(requested_format, accept)
         
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Arquivo de áudio não encontrado")
+        audio_info = await run_blocking(find_audio, audio_id)
+        file_path, audio_format = await audio_service.get_audio_variant(audio_info, audio_format)
         
         return FileResponse(
             path=file_path,
-            media_type="audio/mpeg",
-            filename=f"eduardo_response_{audio_id}.mp3"
+            media_type=audio_format.media_type,
+            filename=f"eduardo_response_{audio_id}.{audio_format.extension}",
+            headers={"Vary": "Accept"}
         )
         
     except HTTPException:
@@ -296,9 +505,11 @@ async def get_available_voices():
     Listar vozes disponíveis no ElevenLabs
     """
     try:
-        voices = audio_service.get_available_voices()
+        voices = await audio_service.get_available_voices()
         return voices
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -312,15 +523,7 @@ async def clear_audio_cache():
     Limpar cache de áudios (para manutenção)
     """
     try:
-        count = 0
-        for audio_id, audio_info in list(audio_cache.items()):
-            try:
-                if os.path.exists(audio_info["file_path"]):
-                    os.unlink(audio_info["file_path"])
-                del audio_cache[audio_id]
-                count += 1
-            except Exception as e:
-                print(f"Erro ao remover áudio {audio_id}: {e}")
+        count = await run_blocking(audio_store.clear)
         
         return {"message": f"Cache limpo. {count} arquivos removidos."}
         
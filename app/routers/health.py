@@ -3,6 +3,16 @@ from datetime import datetime
 from typing import Dict, Any
 
 from ..config import settings
+from ..services.session_cache import session_cache
+from ..services.metrics import prompt_cache_stats
+from ..services.response_cache import response_cache
+from ..services.tts_cache import tts_cache
+from ..services.audio_store import audio_store
+from ..services.concurrency import provider_stats
+from ..services.audio_preprocessor import preprocess_stats
+from ..services.voice_jobs import voice_jobs
+from ..services.write_behind import write_behind_log
+from ..services.tracing import span_exporter
 
 router = APIRouter(tags=["health"])
 
@@ -35,5 +45,15 @@ async def health_check():
         "api": settings.API_TITLE,
         "version": settings.API_VERSION,
         "timestamp": datetime.now().isoformat(),
-        "openai_configured": bool(settings.OPENAI_API_KEY)
+        "openai_configured": bool(settings.OPENAI_API_KEY),
+        "session_cache": session_cache.stats(),
+        "prompt_cache": prompt_cache_stats(),
+        "response_cache": response_cache.stats(),
+        "tts_cache": tts_cache.stats(),
+        "audio_store": audio_store.stats(),
+        "providers": provider_stats(),
+        "audio_preprocess": preprocess_stats.stats(),
+        "voice_jobs": voice_jobs.stats(),
+        "write_behind": write_behind_log.stats() if settings.WRITE_BEHIND_ENABLED else None,
+        "tracing": span_exporter.stats() if settings.TRACING_ENABLED else None
     } 
\ No newline at end of file
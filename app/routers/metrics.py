@@ -0,0 +1,46 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..config import settings
+from ..services.metrics import registry
+from ..services.session_cache import session_cache
+from ..services.response_cache import response_cache
+from ..services.tts_cache import tts_cache
+from ..services.audio_store import audio_store
+from ..services.concurrency import provider_stats, run_blocking
+from ..services.audio_preprocessor import preprocess_stats
+from ..services.voice_jobs import voice_jobs
+from ..services.write_behind import write_behind_log
+from ..services.tracing import span_exporter
+
+router = APIRouter(tags=["metrics"])
+
+# Mesmas estatísticas do /health, lidas só no momento da coleta
+registry.register_stats("session_cache", session_cache.stats)
+registry.register_stats("response_cache", response_cache.stats)
+registry.register_stats("tts_cache", tts_cache.stats)
+registry.register_stats("audio_store", audio_store.stats)
+registry.register_stats("provider", provider_stats, label="provider")
+registry.register_stats("audio_preprocess", preprocess_stats.stats)
+registry.register_stats("voice_jobs", voice_jobs.stats)
+if settings.WRITE_BEHIND_ENABLED:
+    registry.register_stats("write_behind", write_behind_log.stats)
+if settings.TRACING_ENABLED:
+    registry.register_stats("tracing", span_exporter.stats)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Métricas no formato texto do Prometheus (somadas entre os workers, se houver vários)
+    
+    Returns:
+        Latência por etapa, etapas em andamento, erros por serviço externo,
+        tokens consumidos e os contadores de caches, filas e limitadores
+    """
+    if settings.METRICS_MULTIPROCESS:
+        # Retrato lido no event loop; disco e soma no pool de threads
+        body = await run_blocking(registry.render_workers, settings.METRICS_DIR, registry.snapshot())
+    else:
+        body = registry.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
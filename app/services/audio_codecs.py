@@ -0,0 +1,202 @@
+"""
+Formatos de saída dos áudios sintetizados
+Negociação pelo parâmetro ?format= ou pelo header Accept e conversão do MP3 com ffmpeg
+"""
+
+import asyncio
+import logging
+import shutil
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """Formato de saída: tipo de mídia, extensão do arquivo e argumentos do ffmpeg"""
+    name: str
+    media_type: str
+    extension: str
+    accept_types: Tuple[str, ...]
+    ffmpeg_args: Tuple[str, ...] = ()
+
+
+MP3 = AudioFormat(
+    name="mp3",
+    media_type="audio/mpeg",
+    extension="mp3",
+    accept_types=("audio/mpeg", "audio/mp3")
+)
+
+OPUS = AudioFormat(
+    name="opus",
+    media_type="audio/ogg; codecs=opus",
+    extension="ogg",
+    accept_types=("audio/ogg", "audio/opus"),
+    ffmpeg_args=("-c:a", "libopus", "-b:a", settings.AUDIO_OUTPUT_BITRATE, "-application", "voip", "-f", "ogg")
+)
+
+WEBM = AudioFormat(
+    name="webm",
+    media_type="audio/webm; codecs=opus",
+    extension="webm",
+    accept_types=("audio/webm",),
+    ffmpeg_args=("-c:a", "libopus", "-b:a", settings.AUDIO_OUTPUT_BITRATE, "-application", "voip", "-f", "webm")
+)
+
+# Ordem de preferência do servidor em caso de empate: os menores primeiro
+AUDIO_FORMATS: Dict[str, AudioFormat] = {fmt.name: fmt for fmt in (OPUS, WEBM, MP3)}
+DEFAULT_FORMAT = MP3
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_available() -> bool:
+    """ffmpeg instalado (verificado uma vez por processo)"""
+    return shutil.which("ffmpeg") is not None
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float]]:
+    """Tipos de mídia do header Accept com seus pesos (q)"""
+    ranges = []
+    for part in accept.split(","):
+        pieces = [piece.strip() for piece in part.split(";")]
+        media_type = pieces[0].lower()
+        quality = 1.0
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            ranges.append((media_type, quality))
+    return ranges
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> AudioFormat:
+    """
+    Escolher o formato de saída
+
+    ?format= tem prioridade. No Accept, só tipos explícitos contam: curingas
+    (*/*, audio/*) ficam com MP3, que todo player toca. Sem ffmpeg, sempre MP3.
+
+    Args:
+        requested: Valor do parâmetro format (mp3, opus, webm)
+        accept: Header Accept da requisição
+
+    Returns:
+        Formato escolhido
+
+    Raises:
+        ValueError: Formato pedido em ?format= desconhecido
+    """
+    if requested:
+        fmt = AUDIO_FORMATS.get(requested.lower())
+        if fmt is None:
+            raise ValueError(f"Formato não suportado. Use: {', '.join(AUDIO_FORMATS)}")
+        return fmt if fmt is DEFAULT_FORMAT or ffmpeg_available() else DEFAULT_FORMAT
+
+    if not accept or not ffmpeg_available():
+        return DEFAULT_FORMAT
+
+    best, best_quality = DEFAULT_FORMAT, 0.0
+    qualities = dict(_parse_accept(accept))
+    for fmt in AUDIO_FORMATS.values():
+        quality = max((qualities.get(media_type, 0.0) for media_type in fmt.accept_types), default=0.0)
+        if quality > best_quality:
+            best, best_quality = fmt, quality
+    return best
+
+
+def _ffmpeg_command(source: str, fmt: AudioFormat) -> List[str]:
+    return ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", source, *fmt.ffmpeg_args, "pipe:1"]
+
+
+async def transcode_file(source_path: str, fmt: AudioFormat) -> Optional[bytes]:
+    """
+    Converter um arquivo MP3 para o formato pedido
+
+    Args:
+        source_path: Caminho do MP3
+        fmt: Formato de saída
+
+    Returns:
+        Bytes convertidos ou None em caso de falha
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *_ffmpeg_command(source_path, fmt),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+    except FileNotFoundError:
+        return None
+
+    try:
+        output, errors = await asyncio.wait_for(process.communicate(), timeout=settings.AUDIO_TRANSCODE_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        logger.warning("Conversão de áudio para %s excedeu o tempo limite", fmt.name)
+        return None
+
+    if process.returncode != 0 or not output:
+        logger.warning("Erro na conversão de áudio para %s: %s", fmt.name, errors.decode(errors='replace').strip())
+        return None
+    return output
+
+
+async def transcode_stream(chunks: AsyncIterator[bytes], fmt: AudioFormat) -> AsyncIterator[bytes]:
+    """
+    Converter um stream de trechos MP3 em um único stream no formato pedido
+
+    Um processo ffmpeg por resposta: os trechos entram pelo stdin conforme chegam
+    e a saída é repassada assim que o ffmpeg a produz.
+
+    Args:
+        chunks: Trechos MP3 (ex.: AudioService.stream_speech)
+        fmt: Formato de saída
+
+    Yields:
+        Trechos no formato pedido
+    """
+    process = await asyncio.create_subprocess_exec(
+        *_ffmpeg_command("pipe:0", fmt),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+
+    async def feed() -> None:
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            output = await process.stdout.read(16 * 1024)
+            if not output:
+                break
+            yield output
+        await feeder
+        await process.wait()
+    finally:
+        # Cliente desconectou: encerra a entrada, o processo e o stream de origem
+        feeder.cancel()
+        await asyncio.gather(feeder, return_exceptions=True)
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,177 @@
+"""
+Pré-processamento do áudio antes da transcrição
+Remove silêncio (VAD por energia), converte para mono 16 kHz e recodifica em Opus com ffmpeg
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Any, BinaryIO, Callable, Dict, Set, Tuple
+from ..config import settings
+from .concurrency import run_blocking
+
+
+logger = logging.getLogger(__name__)
+
+
+# Lido e escrito em blocos: o clipe nunca fica inteiro em memória
+CHUNK_SIZE = 64 * 1024
+
+# Ogg/Opus sem nenhum quadro de áudio tem só os cabeçalhos
+MIN_OUTPUT_BYTES = 1024
+
+
+def silence_filter() -> str:
+    """
+    Filtro silenceremove do ffmpeg: VAD por energia em uma única passada
+
+    Corta o silêncio inicial e todo trecho silencioso maior que AUDIO_SILENCE_MIN_DURATION,
+    inclusive o final, mantendo uma pausa curta no lugar (sem precisar inverter o áudio).
+    """
+    threshold = f"{settings.AUDIO_SILENCE_THRESHOLD_DB}dB"
+    return (
+        "silenceremove="
+        f"start_periods=1:start_threshold={threshold}:start_silence=0.1:"
+        f"stop_periods=-1:stop_threshold={threshold}:"
+        f"stop_duration={settings.AUDIO_SILENCE_MIN_DURATION}:stop_silence=0.3"
+    )
+
+
+class PreprocessStats:
+    """Contadores do pré-processamento (bytes economizados e tempo gasto)"""
+
+    def __init__(self):
+        self.clips = 0
+        self.fallbacks = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def record(self, bytes_in: int, bytes_out: int, seconds: float) -> None:
+        self.clips += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores e médias"""
+        return {
+            "clips": self.clips,
+            "fallbacks": self.fallbacks,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved_ratio": round(1 - self.bytes_out / self.bytes_in, 4) if self.bytes_in else 0.0,
+            "avg_ms": round(self.seconds * 1000 / self.clips, 1) if self.clips else 0.0
+        }
+
+
+preprocess_stats = PreprocessStats()
+
+
+class AudioPreprocessor:
+    """Pipeline ffmpeg em streaming: upload -> stdin, stdout -> arquivo temporário"""
+
+    async def process(self, audio_file: BinaryIO, filename: str) -> Tuple[BinaryIO, str]:
+        """
+        Preparar o áudio para o Whisper
+
+        Qualquer falha (ffmpeg ausente, formato que não decodifica de um pipe, timeout,
+        resultado vazio ou maior que o original) devolve o arquivo original.
+
+        Args:
+            audio_file: Arquivo enviado (file-like, binário)
+            filename: Nome do arquivo enviado
+
+        Returns:
+            (arquivo para transcrever, nome com a extensão correspondente)
+        """
+        started = time.perf_counter()
+        audio_file.seek(0, os.SEEK_END)
+        bytes_in = audio_file.tell()
+        audio_file.seek(0)
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-i", "pipe:0",
+                "-af", silence_filter(),
+                "-ac", "1", "-ar", "16000",
+                "-c:a", "libopus", "-b:a", settings.AUDIO_PREPROCESS_BITRATE, "-application", "voip",
+                "-f", "ogg", "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            logger.warning("ffmpeg não encontrado; áudio enviado sem pré-processamento")
+            return self._fallback(audio_file, filename)
+
+        output = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_THRESHOLD)
+        in_flight: Set[asyncio.Future] = set()
+
+        async def blocking(func: Callable[..., Any], *args: Any) -> Any:
+            # Protegida do cancelamento: a thread segue mexendo no arquivo mesmo após o timeout,
+            # então a falha espera por ela antes de reposicionar ou fechar os arquivos
+            future = asyncio.ensure_future(run_blocking(func, *args))
+            in_flight.add(future)
+            future.add_done_callback(in_flight.discard)
+            return await asyncio.shield(future)
+
+        async def feed() -> None:
+            try:
+                while True:
+                    chunk = await blocking(audio_file.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # ffmpeg desistiu da entrada; o código de saída diz o motivo
+                pass
+            finally:
+                process.stdin.close()
+
+        async def collect() -> None:
+            while True:
+                chunk = await process.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                # O SpooledTemporaryFile passa para o disco acima do limiar
+                await blocking(output.write, chunk)
+
+        tasks = [asyncio.ensure_future(step) for step in (feed(), collect(), process.stderr.read())]
+        try:
+            _, _, errors = await asyncio.wait_for(asyncio.gather(*tasks), timeout=settings.AUDIO_PREPROCESS_TIMEOUT)
+            await process.wait()
+        except Exception as e:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            output.close()
+            reason = "tempo limite excedido" if isinstance(e, asyncio.TimeoutError) else str(e)
+            logger.warning("Pré-processamento de áudio interrompido: %s", reason)
+            return self._fallback(audio_file, filename)
+
+        bytes_out = output.tell()
+        if process.returncode != 0 or bytes_out < MIN_OUTPUT_BYTES or bytes_out >= bytes_in:
+            if process.returncode != 0:
+                logger.warning("Erro no pré-processamento de áudio: %s", errors.decode(errors='replace').strip())
+            output.close()
+            return self._fallback(audio_file, filename)
+
+        preprocess_stats.record(bytes_in, bytes_out, time.perf_counter() - started)
+        output.seek(0)
+        stem = filename.rsplit('.', 1)[0] if '.' in filename else filename
+        return output, f"{stem}.ogg"
+
+    @staticmethod
+    def _fallback(audio_file: BinaryIO, filename: str) -> Tuple[BinaryIO, str]:
+        preprocess_stats.fallbacks += 1
+        audio_file.seek(0)
+        return audio_file, filename
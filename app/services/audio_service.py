@@ -3,13 +3,49 @@ Serviço para processamento de áudio
 Transcrição com OpenAI Whisper e síntese de voz com ElevenLabs
 """
 
-import io
+import asyncio
+import logging
 import os
-import tempfile
-from typing import BinaryIO, Optional
-import openai
+import re
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple
 from elevenlabs import voices, generate, set_api_key
 from ..config import settings
+from .audio_codecs import DEFAULT_FORMAT, AudioFormat, transcode_file
+from .audio_preprocessor import AudioPreprocessor
+from .audio_store import StoredAudio, audio_store
+from .clients import get_openai_client
+from .concurrency import ProviderBusyError, elevenlabs_limiter, run_blocking, whisper_limiter
+from .metrics import stage
+from .tracing import traced
+from .tts_cache import tts_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+# Fim de frase: pontuação final (com aspas/parênteses de fechamento) seguida de espaço, ou quebra de linha
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+|\n+")
+
+
+def split_sentences(buffer: str, min_chars: int) -> Tuple[List[str], str]:
+    """
+    Separa as frases completas de um texto que ainda está chegando
+
+    Args:
+        buffer: Texto acumulado do stream
+        min_chars: Tamanho mínimo de uma frase (as menores são juntadas à seguinte)
+
+    Returns:
+        (frases completas, resto ainda incompleto)
+    """
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(buffer):
+        sentence = buffer[start:match.end()].strip()
+        if len(sentence) >= min_chars:
+            sentences.append(sentence)
+            start = match.end()
+    return sentences, buffer[start:]
 
 
 class AudioService:
@@ -17,69 +53,79 @@ class AudioService:
     
     def __init__(self):
         """Inicializar serviços de áudio"""
-        if not settings.OPENAI_API_KEY:
-            raise ValueError("OPENAI_API_KEY não configurada")
-        
         if not settings.ELEVENLABS_API_KEY:
             raise ValueError("ELEVENLABS_API_KEY não configurada")
             
         # Configurar clientes
-        self.openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.openai_client = get_openai_client()
         set_api_key(settings.ELEVENLABS_API_KEY)
         
         self.voice_id = settings.ELEVENLABS_VOICE_ID
+        self.tts_model = settings.ELEVENLABS_MODEL
+        self.preprocessor = AudioPreprocessor()
+    
+    @staticmethod
+    def file_size(audio_file: BinaryIO) -> int:
+        """Tamanho do arquivo pela posição final (seek/tell), sem ler o conteúdo"""
+        audio_file.seek(0, os.SEEK_END)
+        size = audio_file.tell()
+        audio_file.seek(0)
+        return size
     
+    @traced("audio.transcribe")
     async def transcribe_audio(self, audio_file: BinaryIO, filename: str) -> str:
         """
         Transcreve áudio para texto usando OpenAI Whisper
         
+        O arquivo é enviado como está (o upload já em memória ou em disco), sem cópias.
+        Com AUDIO_PREPROCESS_ENABLED, passa antes pelo ffmpeg (silêncio cortado, mono 16 kHz, Opus).
+        
         Args:
-            audio_file: Arquivo de áudio em bytes
+            audio_file: Arquivo de áudio (file-like, binário)
             filename: Nome do arquivo para identificar formato
             
         Returns:
             Texto transcrito
         """
-        temp_file_path = None
+        upload_file = audio_file
         try:
-            # Cria arquivo temporário para o Whisper
-            file_extension = filename.split('.')[-1] if '.' in filename else 'webm'
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}")
-            temp_file_path = temp_file.name
+            # O Whisper identifica o formato pela extensão do nome
+            if '.' not in filename:
+                filename = f"{filename}.webm"
             
-            # Escreve o conteúdo do áudio no arquivo temporário
-            audio_file.seek(0)
-            temp_file.write(audio_file.read())
-            temp_file.close()  # Fecha o arquivo antes de usar com Whisper
+            if settings.AUDIO_PREPROCESS_ENABLED:
+                with stage("audio_preprocess"):
+                    audio_file, filename = await self.preprocessor.process(audio_file, filename)
             
-            # Transcrição com Whisper
-            with open(temp_file_path, "rb") as f:
-                transcript = self.openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=f,
-                    language="pt"  # Português
-                )
+            audio_file.seek(0)
+            async with whisper_limiter.slot():
+                with stage("transcription"):
+                    transcript = await self.openai_client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=(filename, audio_file),
+                        language="pt"  # Português
+                    )
             
             return transcript.text.strip()
                 
+        except ProviderBusyError:
+            raise
         except Exception as e:
-            print(f"Erro na transcrição: {str(e)}")
+            logger.error("Erro na transcrição: %s", e)
             raise Exception(f"Erro ao transcrever áudio: {str(e)}")
         finally:
-            # Remove arquivo temporário de forma segura
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except PermissionError:
-                    # Se não conseguir deletar agora, agenda para mais tarde
-                    print(f"Arquivo temporário será removido pelo sistema: {temp_file_path}")
-                except Exception as cleanup_error:
-                    print(f"Erro ao remover arquivo temporário: {cleanup_error}")
+            # O arquivo do upload é fechado pelo FastAPI; o pré-processado é nosso
+            if audio_file is not upload_file:
+                audio_file.close()
     
-    def text_to_speech(self, text: str) -> bytes:
+    @traced("audio.text_to_speech")
+    async def text_to_speech(self, text: str) -> bytes:
         """
         Converte texto em áudio usando ElevenLabs
         
+        Textos já sintetizados com a mesma voz e modelo vêm do cache em disco.
+        O SDK e o disco rodam no pool de threads; a síntese ocupa uma vaga do ElevenLabs.
+        
         Args:
             text: Texto para converter em voz
             
@@ -87,20 +133,119 @@ class AudioService:
             Áudio em bytes (formato MP3)
         """
         try:
+            cache_key = tts_cache.make_key(text, self.voice_id, self.tts_model)
+            cached_audio = await run_blocking(tts_cache.get, cache_key)
+            if cached_audio is not None:
+                return cached_audio
+            
             # Gera áudio com ElevenLabs
-            audio = generate(
-                text=text,
-                voice=self.voice_id,
-                model="eleven_multilingual_v2"  # Modelo multilíngue para português
-            )
+            async with elevenlabs_limiter.slot():
+                with stage("tts"):
+                    audio = await run_blocking(
+                        generate,
+                        text=text,
+                        voice=self.voice_id,
+                        model=self.tts_model
+                    )
+            
+            try:
+                await run_blocking(tts_cache.put, cache_key, audio)
+            except Exception as cache_error:
+                logger.warning("Erro ao gravar áudio no cache: %s", cache_error)
             
             return audio
             
+        except ProviderBusyError:
+            raise
         except Exception as e:
-            print(f"Erro na síntese de voz: {str(e)}")
+            logger.error("Erro na síntese de voz: %s", e)
             raise Exception(f"Erro ao gerar áudio: {str(e)}")
     
-    def get_available_voices(self) -> list:
+    async def stream_speech(self, text_stream: AsyncIterator[str]) -> AsyncIterator[bytes]:
+        """
+        Sintetiza a resposta frase a frase enquanto o texto ainda está sendo gerado
+        
+        Cada frase completa vai para o TTS assim que termina (até TTS_STREAM_CONCURRENCY
+        em paralelo); o áudio sai na ordem das frases. Frases que falharem são puladas.
+        
+        Args:
+            text_stream: Trechos de texto da resposta (ex.: OpenAIService.stream_response)
+            
+        Yields:
+            Trechos de áudio MP3, um por frase
+        """
+        semaphore = asyncio.Semaphore(settings.TTS_STREAM_CONCURRENCY)
+        # Limita quantas frases ficam prontas à frente do que o cliente já consumiu
+        pending: asyncio.Queue = asyncio.Queue(maxsize=settings.TTS_STREAM_CONCURRENCY * 2)
+        
+        async def synthesize(sentence: str) -> Optional[bytes]:
+            async with semaphore:
+                try:
+                    return await self.text_to_speech(sentence)
+                except Exception as e:
+                    logger.warning("Erro na síntese da frase: %s", e)
+                    return None
+        
+        async def produce() -> None:
+            buffer = ""
+            try:
+                async for delta in text_stream:
+                    buffer += delta
+                    sentences, buffer = split_sentences(buffer, settings.TTS_STREAM_MIN_CHARS)
+                    for sentence in sentences:
+                        await pending.put(asyncio.create_task(synthesize(sentence)))
+            except Exception as e:
+                # Texto interrompido: o trecho já gerado (salvo no histórico) ainda é falado
+                logger.error("Erro ao gerar texto para o áudio: %s", e)
+            if buffer.strip():
+                await pending.put(asyncio.create_task(synthesize(buffer.strip())))
+            await pending.put(None)
+        
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                audio = await task
+                if audio:
+                    yield audio
+            await producer
+        finally:
+            # Cliente desconectou: interrompe a geração e as sínteses em andamento
+            producer.cancel()
+            while not pending.empty():
+                task = pending.get_nowait()
+                if task is not None:
+                    task.cancel()
+    
+    async def warm_tts_cache(self, texts: List[str]) -> int:
+        """
+        Pré-sintetiza textos fixos para que saiam do cache desde a primeira vez
+        
+        Os áudios ficam fixados no cache: o LRU dos áudios dinâmicos não os despeja.
+        
+        Args:
+            texts: Textos conhecidos (fallbacks, respostas prontas)
+            
+        Returns:
+            Quantidade de textos sintetizados agora (os já em cache não contam)
+        """
+        synthesized = 0
+        for text in texts:
+            cache_key = tts_cache.make_key(text, self.voice_id, self.tts_model)
+            if await run_blocking(tts_cache.pin, cache_key):
+                continue
+            try:
+                await self.text_to_speech(text)
+                synthesized += 1
+            except Exception as e:
+                logger.warning("Erro ao pré-sintetizar áudio: %s", e)
+                continue
+            await run_blocking(tts_cache.pin, cache_key)
+        return synthesized
+    
+    async def get_available_voices(self) -> list:
         """
         Retorna lista de vozes disponíveis no ElevenLabs
         
@@ -108,7 +253,8 @@ class AudioService:
             Lista de vozes com ID, nome e descrição
         """
         try:
-            voice_list = voices()
+            async with elevenlabs_limiter.slot():
+                voice_list = await run_blocking(voices)
             return [
                 {
                     "voice_id": voice.voice_id,
@@ -117,8 +263,10 @@ class AudioService:
                 }
                 for voice in voice_list
             ]
+        except ProviderBusyError:
+            raise
         except Exception as e:
-            print(f"Erro ao obter vozes: {str(e)}")
+            logger.error("Erro ao obter vozes: %s", e)
             return []
     
     def validate_audio_file(self, filename: str, file_size: int) -> None:
@@ -141,30 +289,50 @@ class AudioService:
         if file_extension not in settings.SUPPORTED_AUDIO_FORMATS:
             raise ValueError(f"Formato não suportado. Use: {', '.join(settings.SUPPORTED_AUDIO_FORMATS)}")
     
-    def save_audio_file(self, audio_data: bytes, filename: str) -> str:
+    @traced("audio.get_variant")
+    async def get_audio_variant(self, stored_audio: StoredAudio, audio_format: AudioFormat) -> Tuple[str, AudioFormat]:
         """
-        Salva áudio em arquivo temporário e retorna o caminho
+        Caminho do áudio no formato pedido, convertendo e guardando na primeira vez
+        
+        Args:
+            stored_audio: Áudio de resposta (MP3)
+            audio_format: Formato negociado com o cliente
+            
+        Returns:
+            (caminho do arquivo, formato efetivo; MP3 se a conversão falhar)
+        """
+        if audio_format is DEFAULT_FORMAT:
+            return stored_audio.file_path, DEFAULT_FORMAT
+        
+        path = await run_blocking(audio_store.variant_path, stored_audio, audio_format.extension)
+        if path is not None:
+            return path, audio_format
+        
+        with stage("audio_transcode"):
+            data = await transcode_file(stored_audio.file_path, audio_format)
+        if data is None:
+            return stored_audio.file_path, DEFAULT_FORMAT
+        
+        path = await run_blocking(audio_store.save_variant, stored_audio, audio_format.extension, data)
+        return path, audio_format
+    
+    @traced("audio.save")
+    async def save_audio_file(self, audio_data: bytes, audio_id: str, text: str) -> StoredAudio:
+        """
+        Salva o áudio de resposta no armazenamento com expiração
         
         Args:
             audio_data: Dados do áudio em bytes
-            filename: Nome base para o arquivo
+            audio_id: ID do áudio (usado no download)
+            text: Texto falado no áudio
             
         Returns:
-            Caminho do arquivo salvo
+            Áudio armazenado
         """
         try:
-            # Cria arquivo temporário
-            temp_file = tempfile.NamedTemporaryFile(
-                delete=False, 
-                suffix=f"_{filename}.mp3",
-                prefix="audio_response_"
-            )
-            
-            temp_file.write(audio_data)
-            temp_file.close()
-            
-            return temp_file.name
+            with stage("audio_save"):
+                return await run_blocking(audio_store.save, audio_id, audio_data, text)
             
         except Exception as e:
-            print(f"Erro ao salvar áudio: {str(e)}")
-            raise Exception(f"Erro ao salvar arquivo de áudio: {str(e)}") 
\ No newline at end of file
+            logger.error("Erro ao salvar áudio: %s", e)
+            raise Exception(f"Erro ao salvar arquivo de áudio: {str(e)}")
@@ -0,0 +1,399 @@
+"""
+Armazenamento dos áudios de resposta
+Compartilhado entre workers e réplicas: o estado vive no backend (diretório comum), não na memória
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+from ..config import settings
+from .audio_codecs import AUDIO_FORMATS
+from .concurrency import run_blocking
+
+
+logger = logging.getLogger(__name__)
+
+
+# IDs gerados por uuid4; qualquer outra coisa é recusada antes de tocar no disco
+_AUDIO_ID = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+
+# Arquivos sem metadados mais novos que isso podem ser uma escrita em andamento em outro worker
+ORPHAN_GRACE_SECONDS = 300
+
+
+@dataclass
+class StoredAudio:
+    """Áudio de resposta disponível para download"""
+    audio_id: str
+    file_path: str
+    text: str
+    size: int
+    created_at: datetime
+    expires_at: float  # time.time()
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "audio_id": self.audio_id,
+            "text": self.text,
+            "size": self.size,
+            "created_at": self.created_at.isoformat(),
+            "expires_at": self.expires_at
+        }
+
+
+class LocalFilesystemBackend:
+    """
+    Backend em diretório local ou volume compartilhado
+
+    Cada áudio tem o arquivo de dados (<id>.mp3) e um arquivo de metadados (<id>.json).
+    Ambos são escritos de forma atômica e os metadados por último: um áudio só é
+    visível para os outros workers depois de completo. Conversões para outros
+    formatos ficam ao lado, como <id>.<extensão>.
+    """
+
+    def __init__(self, directory: str, variant_extensions: Tuple[str, ...] = ()):
+        self.directory = directory
+        self.variant_extensions = tuple(ext for ext in variant_extensions if ext != "mp3")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def data_path(self, audio_id: str, extension: str = "mp3") -> str:
+        return os.path.join(self.directory, f"{audio_id}.{extension}")
+
+    def _metadata_path(self, audio_id: str) -> str:
+        return os.path.join(self.directory, f"{audio_id}.json")
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def write(self, audio_id: str, data: bytes, metadata: Dict[str, Any]) -> str:
+        """Gravar dados e metadados; retorna o caminho dos dados"""
+        path = self.data_path(audio_id)
+        self._write_atomic(path, data)
+        self._write_atomic(self._metadata_path(audio_id), json.dumps(metadata).encode("utf-8"))
+        return path
+
+    def write_variant(self, audio_id: str, extension: str, data: bytes) -> str:
+        """Gravar a conversão de um áudio para outro formato; retorna o caminho"""
+        path = self.data_path(audio_id, extension)
+        self._write_atomic(path, data)
+        return path
+
+    def variant_bytes(self, audio_id: str) -> int:
+        """Bytes ocupados pelas conversões de um áudio"""
+        total = 0
+        for extension in self.variant_extensions:
+            try:
+                total += os.stat(self.data_path(audio_id, extension)).st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def read_metadata(self, audio_id: str) -> Optional[Dict[str, Any]]:
+        """Metadados do áudio ou None se não existir"""
+        try:
+            with open(self._metadata_path(audio_id), "rb") as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def delete(self, audio_id: str) -> None:
+        """Remover metadados (primeiro, para o áudio sumir de imediato), dados e conversões"""
+        paths = [self._metadata_path(audio_id), self.data_path(audio_id)]
+        paths.extend(self.data_path(audio_id, extension) for extension in self.variant_extensions)
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def list_metadata(self) -> Iterator[Dict[str, Any]]:
+        """Metadados de todos os áudios completos"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                metadata = self.read_metadata(name[:-len(".json")])
+                if metadata is not None:
+                    yield metadata
+
+    def remove_orphans(self, grace_seconds: float) -> int:
+        """
+        Remover escritas interrompidas: temporários e dados sem metadados (ou o inverso)
+
+        Args:
+            grace_seconds: Idade mínima do arquivo para ser considerado órfão
+
+        Returns:
+            Quantidade de arquivos removidos
+        """
+        names = set(os.listdir(self.directory))
+        cutoff = time.time() - grace_seconds
+        removed = 0
+
+        for name in names:
+            stem, extension = os.path.splitext(name)
+            if extension == ".mp3" or extension[1:] in self.variant_extensions:
+                orphan = f"{stem}.json" not in names
+            elif extension == ".json":
+                orphan = f"{stem}.mp3" not in names
+            else:
+                orphan = extension == ".tmp"
+            if not orphan:
+                continue
+
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+
+        return removed
+
+
+class AudioStore:
+    """Áudios de resposta com expiração (TTL) e limite total de bytes, resolvidos pelo backend"""
+
+    def __init__(self, backend: LocalFilesystemBackend, ttl_seconds: float, max_bytes: int, workers: int = 1):
+        """
+        Inicializar armazenamento
+
+        Args:
+            backend: Onde os áudios e metadados são guardados
+            ttl_seconds: Tempo de vida de cada áudio
+            max_bytes: Limite total em bytes do backend (os mais antigos saem primeiro)
+            workers: Processos que gravam no mesmo backend
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.workers = max(workers, 1)
+
+        self._reaper: Optional[asyncio.Task] = None
+
+        # Retrato do backend na última varredura, somado ao que este worker gravou desde então
+        self._entries = 0
+        self._total_bytes = 0
+        self._written_bytes = 0  # Gravado por este worker desde a última varredura
+
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _from_metadata(metadata: Dict[str, Any], file_path: str) -> StoredAudio:
+        return StoredAudio(
+            audio_id=metadata["audio_id"],
+            file_path=file_path,
+            text=metadata.get("text", ""),
+            size=metadata.get("size", 0),
+            created_at=datetime.fromisoformat(metadata["created_at"]),
+            expires_at=metadata["expires_at"]
+        )
+
+    def save(self, audio_id: str, audio_data: bytes, text: str) -> StoredAudio:
+        """
+        Gravar áudio e seus metadados
+
+        Args:
+            audio_id: ID do áudio
+            audio_data: Bytes do MP3
+            text: Texto falado no áudio
+
+        Returns:
+            Áudio armazenado
+        """
+        if not _AUDIO_ID.match(audio_id):
+            raise ValueError(f"ID de áudio inválido: {audio_id}")
+
+        entry = StoredAudio(
+            audio_id=audio_id,
+            file_path=self.backend.data_path(audio_id),
+            text=text,
+            size=len(audio_data),
+            created_at=datetime.now(),
+            expires_at=time.time() + self.ttl_seconds
+        )
+        self.backend.write(audio_id, audio_data, entry.to_metadata())
+
+        self._entries += 1
+        self._written_bytes += entry.size
+        self._total_bytes += entry.size
+        if self._estimated_bytes() > self.max_bytes:
+            self.sweep()
+
+        return entry
+
+    def get(self, audio_id: str) -> Optional[StoredAudio]:
+        """
+        Obter áudio válido (gravado por qualquer worker)
+
+        Args:
+            audio_id: ID do áudio
+
+        Returns:
+            Áudio armazenado ou None (inexistente ou expirado)
+        """
+        if not _AUDIO_ID.match(audio_id):
+            return None
+
+        metadata = self.backend.read_metadata(audio_id)
+        if metadata is None:
+            return None
+
+        entry = self._from_metadata(metadata, self.backend.data_path(audio_id))
+        if entry.expires_at <= time.time():
+            self.backend.delete(audio_id)
+            self.expirations += 1
+            return None
+
+        return entry
+
+    def variant_path(self, entry: StoredAudio, extension: str) -> Optional[str]:
+        """Caminho da conversão já gravada do áudio (None se ainda não existe)"""
+        path = self.backend.data_path(entry.audio_id, extension)
+        return path if os.path.exists(path) else None
+
+    def save_variant(self, entry: StoredAudio, extension: str, data: bytes) -> str:
+        """
+        Gravar a conversão do áudio para outro formato (reaproveitada nos próximos downloads)
+
+        Args:
+            entry: Áudio original
+            extension: Extensão do formato convertido
+            data: Bytes convertidos
+
+        Returns:
+            Caminho da conversão
+        """
+        path = self.backend.write_variant(entry.audio_id, extension, data)
+        self._written_bytes += len(data)
+        self._total_bytes += len(data)
+        return path
+
+    def _estimated_bytes(self) -> int:
+        """
+        Total estimado do backend: os outros workers não aparecem até a próxima
+        varredura, então supõe-se que cada um gravou o mesmo que este desde então
+        """
+        return self._total_bytes + self._written_bytes * (self.workers - 1)
+
+    def remove(self, audio_id: str) -> bool:
+        """Remover áudio (metadados e arquivo)"""
+        if not _AUDIO_ID.match(audio_id) or self.backend.read_metadata(audio_id) is None:
+            return False
+        self.backend.delete(audio_id)
+        return True
+
+    def clear(self) -> int:
+        """Remover todos os áudios; retorna quantos foram removidos"""
+        count = 0
+        for metadata in list(self.backend.list_metadata()):
+            self.backend.delete(metadata["audio_id"])
+            count += 1
+        self._entries = 0
+        self._total_bytes = 0
+        self._written_bytes = 0
+        return count
+
+    def sweep(self) -> int:
+        """
+        Remover áudios expirados e, acima do limite de bytes, os mais antigos
+
+        Returns:
+            Quantidade de áudios removidos
+        """
+        now = time.time()
+        alive = []
+        removed = 0
+
+        for metadata in list(self.backend.list_metadata()):
+            if metadata["expires_at"] <= now:
+                self.backend.delete(metadata["audio_id"])
+                self.expirations += 1
+                removed += 1
+            else:
+                alive.append(metadata)
+
+        # Tamanho de cada áudio inclui as conversões gravadas
+        for metadata in alive:
+            metadata["size"] = metadata.get("size", 0) + self.backend.variant_bytes(metadata["audio_id"])
+
+        alive.sort(key=lambda metadata: metadata["created_at"])
+        total_bytes = sum(metadata["size"] for metadata in alive)
+        while total_bytes > self.max_bytes and len(alive) > 1:
+            oldest = alive.pop(0)
+            self.backend.delete(oldest["audio_id"])
+            total_bytes -= oldest["size"]
+            self.evictions += 1
+            removed += 1
+
+        self._entries = len(alive)
+        self._total_bytes = total_bytes
+        self._written_bytes = 0
+        return removed
+
+    def remove_orphans(self) -> int:
+        """Remover escritas interrompidas (startup); áudios completos de outros workers são mantidos"""
+        removed = self.backend.remove_orphans(ORPHAN_GRACE_SECONDS)
+        self.sweep()
+        return removed
+
+    def start_reaper(self) -> None:
+        """Iniciar limpeza periódica dos áudios expirados"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_forever())
+
+    async def stop_reaper(self) -> None:
+        """Encerrar limpeza periódica"""
+        if self._reaper is None:
+            return
+
+        self._reaper.cancel()
+        try:
+            await self._reaper
+        except asyncio.CancelledError:
+            pass
+        self._reaper = None
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(settings.AUDIO_STORE_REAP_INTERVAL)
+            try:
+                await run_blocking(self.sweep)
+            except Exception as e:
+                logger.error("Erro na limpeza de áudios: %s", e)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do armazenamento (entries/bytes da última varredura + gravações locais)"""
+        return {
+            "entries": self._entries,
+            "bytes": self._total_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+# Instância única por processo; o diretório é o ponto de encontro entre os workers
+audio_store = AudioStore(
+    backend=LocalFilesystemBackend(
+        settings.AUDIO_STORE_DIR,
+        variant_extensions=tuple(fmt.extension for fmt in AUDIO_FORMATS.values())
+    ),
+    ttl_seconds=settings.AUDIO_STORE_TTL,
+    max_bytes=settings.AUDIO_STORE_MAX_BYTES,
+    workers=settings.WEB_CONCURRENCY
+)
@@ -0,0 +1,78 @@
+"""
+Clientes compartilhados pelos serviços
+Um único cliente assíncrono por provedor, reaproveitado por todo o processo
+"""
+
+from typing import Optional
+import httpx
+import openai
+from ..config import settings
+
+
+_openai_client: Optional[openai.AsyncOpenAI] = None
+_supabase_http: Optional[httpx.AsyncClient] = None
+
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    """
+    Retorna o cliente assíncrono da OpenAI compartilhado
+
+    Returns:
+        Instância única de AsyncOpenAI (pool de conexões reaproveitado)
+    """
+    global _openai_client
+
+    if not settings.OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY não configurada")
+
+    if _openai_client is None:
+        _openai_client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            timeout=settings.OPENAI_TIMEOUT
+        )
+
+    return _openai_client
+
+
+def get_supabase_http() -> httpx.AsyncClient:
+    """
+    Retorna o cliente HTTP assíncrono para a API REST (PostgREST) do Supabase
+
+    Returns:
+        Instância única de httpx.AsyncClient com pool de conexões keep-alive
+    """
+    global _supabase_http
+
+    if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
+        raise ValueError("Configurações do Supabase não encontradas")
+
+    if _supabase_http is None:
+        _supabase_http = httpx.AsyncClient(
+            base_url=f"{settings.SUPABASE_URL.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": settings.SUPABASE_KEY,
+                "Authorization": f"Bearer {settings.SUPABASE_KEY}",
+                "Content-Type": "application/json"
+            },
+            timeout=settings.SUPABASE_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                keepalive_expiry=settings.SUPABASE_KEEPALIVE_EXPIRY
+            )
+        )
+
+    return _supabase_http
+
+
+async def close_clients() -> None:
+    """Fecha os clientes compartilhados (chamado no shutdown da aplicação)"""
+    global _openai_client, _supabase_http
+
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+
+    if _supabase_http is not None:
+        await _supabase_http.aclose()
+        _supabase_http = None
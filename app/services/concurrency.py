@@ -0,0 +1,124 @@
+"""
+Execução de trabalho bloqueante e limites de concorrência por provedor
+Um pool de threads dedicado e um semáforo com timeout de fila para cada API externa
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, TypeVar
+from fastapi import HTTPException
+from ..config import settings
+from .metrics import provider_queue_wait
+
+
+T = TypeVar("T")
+
+# Pool próprio: SDKs síncronos e disco não disputam o executor padrão do event loop
+_executor = ThreadPoolExecutor(
+    max_workers=settings.BLOCKING_POOL_SIZE,
+    thread_name_prefix="blocking"
+)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Executar uma chamada síncrona no pool de threads sem bloquear o event loop
+
+    Args:
+        func: Função bloqueante
+        *args, **kwargs: Argumentos da função
+
+    Returns:
+        Resultado da função
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executor() -> None:
+    """Encerrar o pool de threads (chamado no shutdown da aplicação)"""
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ProviderBusyError(HTTPException):
+    """Provedor saturado: a requisição esperou na fila além do timeout (503)"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"Serviço {provider} ocupado. Tente novamente em instantes.",
+            headers={"Retry-After": str(max(1, int(retry_after)))}
+        )
+        self.provider = provider
+
+
+class ProviderLimiter:
+    """Limite de chamadas simultâneas a um provedor, com espera máxima na fila"""
+
+    def __init__(self, name: str, limit: int, queue_timeout: float):
+        """
+        Args:
+            name: Nome do provedor (mensagens e estatísticas)
+            limit: Chamadas simultâneas permitidas
+            queue_timeout: Segundos de espera por uma vaga antes de ProviderBusyError
+        """
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Ocupar uma vaga do provedor durante o bloco
+
+        Raises:
+            ProviderBusyError: Nenhuma vaga liberada dentro do queue_timeout
+        """
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ProviderBusyError(self.name, self.queue_timeout)
+        finally:
+            self.waiting -= 1
+            provider_queue_wait.observe(time.perf_counter() - started, self.name.lower())
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do limitador"""
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected
+        }
+
+
+# Um limitador por provedor, compartilhado pelo processo
+whisper_limiter = ProviderLimiter("Whisper", settings.WHISPER_CONCURRENCY, settings.WHISPER_QUEUE_TIMEOUT)
+elevenlabs_limiter = ProviderLimiter("ElevenLabs", settings.ELEVENLABS_CONCURRENCY, settings.ELEVENLABS_QUEUE_TIMEOUT)
+gpt_limiter = ProviderLimiter("GPT", settings.GPT_CONCURRENCY, settings.GPT_QUEUE_TIMEOUT)
+
+
+def provider_stats() -> Dict[str, Dict[str, int]]:
+    """Estatísticas de todos os limitadores"""
+    return {
+        limiter.name.lower(): limiter.stats()
+        for limiter in (whisper_limiter, elevenlabs_limiter, gpt_limiter)
+    }
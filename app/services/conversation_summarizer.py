@@ -0,0 +1,163 @@
+"""
+Resumo incremental de conversas longas
+Incorpora as mensagens mais antigas a um resumo por conversa, fora do caminho da requisição
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+from ..config import settings
+from ..models import Conversation, StoredMessage
+from .clients import get_openai_client
+from .concurrency import gpt_limiter
+from .metrics import record_token_usage, stage
+from .supabase_service import SupabaseService
+
+
+logger = logging.getLogger(__name__)
+
+
+# Conversas ainda sem resumo começam do início
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+SUMMARY_PROMPT = """Você mantém o resumo de uma conversa entre um usuário e Eduardo Mayer, professor especialista em Terra plana.
+
+Receberá o resumo atual (pode estar vazio) e as mensagens seguintes da conversa. Produza um novo resumo que:
+- Preserve fatos importantes sobre o usuário (nome, dúvidas, objeções, o que já aceitou)
+- Registre quais argumentos e exemplos Eduardo já apresentou
+- Indique em que ponto a discussão parou
+- Tenha no máximo 200 palavras, em português, em texto corrido
+
+Responda APENAS com o novo resumo."""
+
+
+class ConversationSummarizer:
+    """Sumarizador em segundo plano: uma fila de sessões processada por uma task"""
+
+    def __init__(self, supabase: SupabaseService):
+        """Inicializar fila e cliente compartilhado"""
+        self.client = get_openai_client()
+        self.supabase = supabase
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.SUMMARY_QUEUE_SIZE)
+        self._queued: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def unsummarized_count(conversation: Conversation) -> int:
+        """Mensagens ainda fora do resumo"""
+        return conversation.message_count - conversation.summarized_count
+
+    def schedule(self, conversation: Conversation) -> None:
+        """
+        Agendar o resumo da conversa se houver mensagens antigas suficientes
+
+        Args:
+            conversation: Conversa do turno que acabou de terminar
+        """
+        if not settings.SUMMARY_ENABLED or self._task is None:
+            return
+
+        threshold = settings.SUMMARY_KEEP_RECENT + settings.SUMMARY_BATCH_SIZE
+        if self.unsummarized_count(conversation) < threshold:
+            return
+
+        if conversation.session_id in self._queued:
+            return
+
+        try:
+            self._queue.put_nowait(conversation.session_id)
+            self._queued.add(conversation.session_id)
+        except asyncio.QueueFull:
+            # Sem espaço: a conversa será agendada de novo no próximo turno
+            pass
+
+    def start(self) -> None:
+        """Iniciar a task de resumo (chamado no startup da aplicação)"""
+        if settings.SUMMARY_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        """Encerrar a task de resumo"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _worker(self) -> None:
+        """Processa as sessões agendadas, uma de cada vez"""
+        while True:
+            session_id = await self._queue.get()
+            try:
+                await self.summarize(session_id)
+            except Exception as e:
+                logger.error("Erro ao resumir conversa: %s", e)
+            finally:
+                self._queued.discard(session_id)
+                self._queue.task_done()
+
+    async def summarize(self, session_id: str) -> None:
+        """
+        Incorporar ao resumo as mensagens que saíram da janela recente
+
+        Apenas as mensagens posteriores ao último resumo são lidas.
+
+        Args:
+            session_id: ID da sessão do usuário
+        """
+        conversation = await self.supabase.get_conversation(session_id)
+        if conversation is None:
+            return  # Conversa apagada depois do agendamento
+
+        foldable = self.unsummarized_count(conversation) - settings.SUMMARY_KEEP_RECENT
+        if foldable <= 0:
+            return
+
+        messages = await self.supabase.get_conversation_messages(
+            conversation.id,
+            limit=min(foldable, settings.SUMMARY_MAX_BATCH),
+            after=conversation.summarized_until or EPOCH
+        )
+        if not messages:
+            return
+
+        summary = await self._build_summary(conversation.summary, messages)
+        if not summary:
+            return
+
+        await self.supabase.update_conversation_summary(
+            conversation,
+            summary,
+            summarized_until=messages[-1].timestamp,
+            summarized_count=conversation.summarized_count + len(messages)
+        )
+
+    async def _build_summary(self, previous_summary: Optional[str], messages: List[StoredMessage]) -> str:
+        """Chama o modelo para combinar o resumo anterior com as novas mensagens"""
+        speakers = {"user": "Usuário", "assistant": "Eduardo"}
+        transcript = "\n".join(
+            f"{speakers.get(message.role, message.role)}: {message.content}"
+            for message in messages
+        )
+
+        # Disputa as mesmas vagas do GPT que as respostas; com o provedor saturado, tenta no próximo turno
+        async with gpt_limiter.slot():
+            with stage("summary"):
+                response = await self.client.chat.completions.create(
+                    model=settings.SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": f"RESUMO ATUAL:\n{previous_summary or '(vazio)'}\n\nNOVAS MENSAGENS:\n{transcript}"}
+                    ],
+                    max_tokens=settings.SUMMARY_MAX_TOKENS,
+                    temperature=0.2
+                )
+
+        record_token_usage(response.usage, "summary")
+        return (response.choices[0].message.content or "").strip()
@@ -0,0 +1,141 @@
+"""
+Classificação de intenções por palavras-chave
+Um único regex pré-compilado por conjunto de intenções, com normalização de acentos e caixa
+"""
+
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, Set
+
+
+# Intenções da mensagem do usuário (OpenAIService)
+GREETING = "greeting"
+FLAT_EARTH_TOPIC = "flat_earth_topic"
+AI_QUESTION = "ai_question"
+AI_IDENTITY = "ai_identity"  # Pergunta explícita sobre ser IA (resposta pronta)
+OFF_TOPIC = "off_topic"
+
+# Intenções da resposta do assistente (MessageEnhancer)
+EVIDENCE = "evidence"
+INTRODUCTION = "introduction"
+SCIENCE = "science"
+WATER = "water"
+HORIZON = "horizon"
+
+USER_INTENT_KEYWORDS = {
+    GREETING: ["olá", "oi", "boa tarde", "bom dia", "boa noite", "hello", "hi"],
+    FLAT_EARTH_TOPIC: [
+        "terra plana", "terra", "curvatura", "horizonte", "física", "ciência",
+        "astronomia", "geografia", "gravidade", "nasa", "espaço", "planeta",
+        "globo", "esfera", "formato", "universo", "sol", "lua", "estrelas"
+    ],
+    AI_QUESTION: ["você é", "é uma ia", "é um robô", "é artificial", "é um bot", "que você é"],
+    # Só frases explícitas: substantivos soltos ("programa", "máquina", "bot") aparecem em conversas comuns
+    AI_IDENTITY: [
+        "é uma ia", "é um robô", "é um bot", "é um chatbot", "inteligência artificial"
+    ],
+    OFF_TOPIC: [
+        "mercado", "bolsa", "ações", "investimento", "comida", "receita", "filme",
+        "música", "esporte", "futebol", "política", "eleição", "clima tempo",
+        "shopping", "compra", "vendas", "trabalho", "emprego", "faculdade curso",
+        "relacionamento", "amor", "saúde", "doença", "remédio"
+    ]
+}
+
+REPLY_INTENT_KEYWORDS = {
+    EVIDENCE: [
+        "água", "oceano", "horizonte", "aviões", "rotação", "laser",
+        "experimento", "observação", "evidência", "exemplo", "copo", "mangueira"
+    ],
+    INTRODUCTION: [
+        "olá", "oi", "sou", "meu nome", "eduardo", "escola conquer",
+        "como posso", "posso ajudar", "bem-vindo"
+    ],
+    SCIENCE: ["terra", "física", "ciência", "formato", "curvatura", "modelo"],
+    WATER: ["água", "oceano", "nível"],
+    HORIZON: ["horizonte", "linha"]
+}
+
+# Palavras-chave a partir deste tamanho também casam no plural ("planeta" -> "planetas")
+PLURAL_MIN_LENGTH = 4
+
+
+# Acentos e demais marcas combinantes que sobram da decomposição NFKD ("é" -> "e" + U+0301)
+_COMBINING_MARKS = re.compile(r"[\u0300-\u036f]+")
+
+
+def fold_text(text: str) -> str:
+    """
+    Normaliza texto para comparação: sem acentos, caixa dobrada e espaços simples
+
+    Texto só ASCII (o caso comum fora do português acentuado) não passa pela decomposição.
+
+    Args:
+        text: Texto original
+
+    Returns:
+        Texto normalizado ("Você É" -> "voce e")
+    """
+    folded = text.casefold()
+    if not folded.isascii():
+        folded = _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", folded))
+    return " ".join(folded.split())
+
+
+class KeywordMatcher:
+    """Classificador multi-intenção em uma única passada sobre o texto"""
+
+    def __init__(self, intents: Dict[str, Iterable[str]]):
+        """
+        Compila um regex com todas as palavras-chave de todas as intenções
+
+        Args:
+            intents: Mapa intenção -> palavras-chave
+        """
+        intents_by_keyword: Dict[str, Set[str]] = {}
+        for intent, keywords in intents.items():
+            for keyword in keywords:
+                intents_by_keyword.setdefault(fold_text(keyword), set()).add(intent)
+
+        # Um casamento mais longo esconde os menores contidos nele ("que voce e" contém "voce e"):
+        # a palavra-chave longa herda as intenções das que ela contém
+        for keyword in intents_by_keyword:
+            for other, other_intents in intents_by_keyword.items():
+                if other != keyword and re.search(rf"\b{re.escape(other)}\b", keyword):
+                    intents_by_keyword[keyword] |= other_intents
+
+        self._intents: Dict[str, FrozenSet[str]] = {}
+        alternatives = []
+        for keyword in sorted(intents_by_keyword, key=len, reverse=True):
+            found = frozenset(intents_by_keyword[keyword])
+            self._intents[keyword] = found
+            if len(keyword) >= PLURAL_MIN_LENGTH:
+                self._intents.setdefault(f"{keyword}s", found)
+                alternatives.append(f"{re.escape(keyword)}s?")
+            else:
+                alternatives.append(re.escape(keyword))
+
+        # \b evita casar dentro de outra palavra ("oi" em "foi", "hi" em "this").
+        # O lookahead não consome o texto: casamentos que se sobrepõem também são
+        # encontrados ("voce e" e "e uma ia" em "voce e uma ia")
+        self._pattern = re.compile(rf"\b(?=({'|'.join(alternatives)})\b)")
+
+    def classify(self, text: str) -> FrozenSet[str]:
+        """
+        Retorna todas as intenções presentes no texto
+
+        Args:
+            text: Texto a classificar
+
+        Returns:
+            Conjunto de intenções encontradas
+        """
+        found: Set[str] = set()
+        for match in self._pattern.finditer(fold_text(text)):
+            found |= self._intents[match.group(1)]
+        return frozenset(found)
+
+
+# Compilados uma única vez na importação
+user_intents = KeywordMatcher(USER_INTENT_KEYWORDS)
+reply_intents = KeywordMatcher(REPLY_INTENT_KEYWORDS)
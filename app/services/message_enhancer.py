@@ -5,6 +5,7 @@ Só faz perguntas DEPOIS de apresentar evidências
 
 import random
 from typing import List
+from .intent_classifier import reply_intents, EVIDENCE, INTRODUCTION, SCIENCE, WATER, HORIZON
 
 
 class MessageEnhancer:
@@ -60,35 +61,25 @@ class MessageEnhancer:
     def has_evidence_content(self, message: str) -> bool:
         """Verifica se a mensagem tem evidências ou exemplos concretos"""
         
-        evidence_indicators = [
-            "água", "oceano", "horizonte", "aviões", "rotação", "laser",
-            "experimento", "observação", "evidência", "exemplo", "copo", "mangueira"
-        ]
-        
-        return any(indicator in message.lower() for indicator in evidence_indicators)
+        return EVIDENCE in reply_intents.classify(message)
     
     def is_greeting_or_introduction(self, message: str) -> bool:
         """Verifica se é uma saudação ou apresentação"""
         
-        greeting_indicators = [
-            "olá", "oi", "sou", "meu nome", "eduardo", "escola conquer",
-            "como posso", "posso ajudar", "bem-vindo"
-        ]
-        
-        return any(indicator in message.lower() for indicator in greeting_indicators)
+        return INTRODUCTION in reply_intents.classify(message)
     
     def add_practical_example_when_relevant(self, message: str) -> str:
         """Adiciona exemplo prático SÓ quando há contexto científico"""
         
-        # Só adiciona exemplo se a mensagem já fala de ciência/física
-        science_topics = ["terra", "física", "ciência", "formato", "curvatura", "modelo"]
+        intents = reply_intents.classify(message)
         
-        if any(topic in message.lower() for topic in science_topics):
-            if any(word in message.lower() for word in ["água", "oceano", "nível"]):
+        # Só adiciona exemplo se a mensagem já fala de ciência/física
+        if SCIENCE in intents:
+            if WATER in intents:
                 example = random.choice(self.practical_examples["água_nível"])
                 if len(message) < 150:
                     message = f"{message} Por exemplo: {example}"
-            elif any(word in message.lower() for word in ["horizonte", "linha"]):
+            elif HORIZON in intents:
                 example = random.choice(self.practical_examples["horizonte_plano"])
                 if len(message) < 150:
                     message = f"{message} Teste você mesmo: {example}"
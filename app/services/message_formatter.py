@@ -3,8 +3,11 @@ Serviço para formatação de mensagens usando OpenAI
 Torna mensagens mais legíveis e organizadas
 """
 
-import openai
-from ..config import settings
+import logging
+from .clients import get_openai_client
+
+
+logger = logging.getLogger(__name__)
 
 
 class MessageFormatter:
@@ -12,10 +15,7 @@ class MessageFormatter:
     
     def __init__(self):
         """Inicializar serviço de formatação"""
-        if not settings.OPENAI_API_KEY:
-            raise ValueError("OPENAI_API_KEY não configurada")
-            
-        self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_openai_client()
         
         # Prompt específico para formatação
         self.formatting_prompt = """Você é um assistente especialista em formatação de texto para melhor legibilidade.
@@ -87,7 +87,7 @@ Retornar APENAS o texto reformatado com quebras de linha adequadas para facilita
                 return message
             
             # Chama OpenAI para formatação
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": self.formatting_prompt},
@@ -107,6 +107,6 @@ Retornar APENAS o texto reformatado com quebras de linha adequadas para facilita
                 return message
                 
         except Exception as e:
-            print(f"Erro na formatação: {str(e)}")
+            logger.error("Erro na formatação: %s", e)
             # Em caso de erro, retorna mensagem original
             return message 
\ No newline at end of file
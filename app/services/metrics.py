@@ -0,0 +1,467 @@
+"""
+Métricas no formato texto do Prometheus
+Registro leve (sem dependências): contadores, gauges e histogramas por etapa do pipeline
+Com vários workers, cada um grava o próprio estado em um diretório comum e o /metrics soma todos
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .tracing import end_span, start_span
+
+
+logger = logging.getLogger(__name__)
+
+
+# Limites dos histogramas de latência, em segundos (de cache local até síntese longa)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Serviço externo (ou recurso local) por trás de cada etapa instrumentada
+STAGE_UPSTREAMS = {
+    "conversation_lookup": "supabase",
+    "history_fetch": "supabase",
+    "message_save": "supabase",
+    "message_flush": "supabase",
+    "llm": "openai",
+    "llm_stream": "openai",
+    "summary": "openai",
+    "transcription": "whisper",
+    "audio_preprocess": "ffmpeg",
+    "tts": "elevenlabs",
+    "audio_transcode": "ffmpeg",
+    "audio_save": "disk"
+}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base: nome, ajuda, nomes dos labels e uma série por combinação de valores"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._series: Dict[Tuple[str, ...], Any] = {}
+
+    def _new_series(self) -> Any:
+        raise NotImplementedError
+
+    def _empty_copy(self) -> "_Metric":
+        return type(self)(self.name, self.documentation, self.labelnames)
+
+    def dump(self) -> List[List[Any]]:
+        """Séries em formato JSON: [[valores dos labels, estado], ...]"""
+        return [[list(values), self._dump_series(series)] for values, series in self._series.items()]
+
+    def merge(self, dumped: List[List[Any]]) -> None:
+        """Somar séries de outro processo (ver dump)"""
+        for values, state in dumped:
+            self._merge_series(self.labels(*values), state)
+
+    def _dump_series(self, series: Any) -> Any:
+        return series.value
+
+    def _merge_series(self, series: Any, state: Any) -> None:
+        series.value += state
+
+    def labels(self, *values: str) -> Any:
+        """Série para os valores de label (criada no primeiro uso)"""
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = self._new_series()
+        return series
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in sorted(self._series.items()):
+            lines.extend(self._render_series(values, series))
+        return lines
+
+    def _render_series(self, values: Tuple[str, ...], series: Any) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(series.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    """Contador monotônico"""
+
+    kind = "counter"
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+
+class Gauge(_Metric):
+    """Valor que sobe e desce (ex.: chamadas em andamento)"""
+
+    kind = "gauge"
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # Último: acima do maior limite (+Inf)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """Histograma com limites fixos; contagens guardadas por faixa e acumuladas só ao renderizar"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_series(self) -> _HistogramSeries:
+        return _HistogramSeries(len(self.buckets))
+
+    def _empty_copy(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.labelnames, self.buckets)
+
+    def _dump_series(self, series: _HistogramSeries) -> Dict[str, Any]:
+        return {"counts": series.counts, "sum": series.sum, "count": series.count}
+
+    def _merge_series(self, series: _HistogramSeries, state: Dict[str, Any]) -> None:
+        series.counts = [mine + theirs for mine, theirs in zip(series.counts, state["counts"])]
+        series.sum += state["sum"]
+        series.count += state["count"]
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """Registrar uma observação"""
+        series = self.labels(*labelvalues)
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def _render_series(self, values: Tuple[str, ...], series: _HistogramSeries) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(series.sum)}")
+        lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Métricas do processo e coletores das estatísticas já existentes (caches, filas, limitadores)
+
+    Atualizado só pelo event loop, sem locks. Cada worker tem o próprio registro;
+    com um diretório compartilhado (WEB_CONCURRENCY > 1), cada worker grava um
+    retrato em metrics-<pid>.json e a coleta junta todos (ver render_workers).
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[str, str, Callable[[], Optional[Dict[str, Any]]]]] = []
+        self._sync: Optional[asyncio.Task] = None
+
+    def _add(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(f"{self.prefix}_{name}", documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", documentation, labelnames))
+
+    def register_stats(self, name: str, collect: Callable[[], Optional[Dict[str, Any]]], label: str = "key") -> None:
+        """
+        Expor um dicionário de estatísticas (ex.: session_cache.stats) como métricas
+
+        Valores numéricos viram <prefixo>_<name>_<chave>; em dicionários aninhados
+        (ex.: um por provedor) a chave externa vira o label `label`. O tipo fica
+        como untyped: algumas chaves são contadores, outras valores instantâneos.
+        """
+        self._collectors.append((name, label, collect))
+
+    def _collect_stats(self) -> Dict[str, List[List[Any]]]:
+        """Estatísticas numéricas por nome de métrica: [[labels, valor], ...]"""
+        samples: Dict[str, List[List[Any]]] = {}
+        for name, label, collect in self._collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                logger.warning("Erro ao coletar estatísticas de %s: %s", name, e)
+                continue
+            for key, value in (stats or {}).items():
+                if isinstance(value, dict):
+                    for field, nested in value.items():
+                        if isinstance(nested, (int, float)) and not isinstance(nested, bool):
+                            samples.setdefault(f"{self.prefix}_{name}_{field}", []).append([{label: str(key)}, nested])
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    samples.setdefault(f"{self.prefix}_{name}_{key}", []).append([{}, value])
+        return samples
+
+    @staticmethod
+    def _render_stats(samples: Dict[str, List[List[Any]]]) -> List[str]:
+        lines = []
+        for metric_name, metric_samples in samples.items():
+            lines.append(f"# TYPE {metric_name} untyped")
+            for labels, value in metric_samples:
+                label_text = _format_labels(tuple(labels), tuple(labels.values()))
+                lines.append(f"{metric_name}{label_text} {_format_value(value)}")
+        return lines
+
+    def render(self) -> str:
+        """Todas as métricas do processo no formato texto do Prometheus (versão 0.0.4)"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.extend(self._render_stats(self._collect_stats()))
+        return "\n".join(lines) + "\n"
+
+    # --- Vários workers ---
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Retrato do processo em JSON (lido no event loop, gravado/juntado no pool de threads)"""
+        return {
+            "pid": os.getpid(),
+            "metrics": {metric.name: metric.dump() for metric in self._metrics},
+            "stats": self._collect_stats()
+        }
+
+    @staticmethod
+    def write_snapshot(directory: str, snapshot: Dict[str, Any]) -> None:
+        """Gravar o retrato deste worker (escrita atômica) em metrics-<pid>.json"""
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, os.path.join(directory, f"metrics-{snapshot['pid']}.json"))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def render_workers(self, directory: str, snapshot: Dict[str, Any]) -> str:
+        """
+        Métricas somadas de todos os workers que gravaram no diretório
+
+        O retrato deste worker é gravado antes, então sai atualizado; os demais têm
+        no máximo METRICS_SYNC_INTERVAL de atraso. Contadores e histogramas somam
+        também os de workers encerrados (continuam monotônicos após um reinício);
+        gauges somam só os vivos. As estatísticas (untyped, mistura de contadores
+        e valores instantâneos) não são somadas: saem por worker, com o label pid.
+        """
+        self.write_snapshot(directory, snapshot)
+
+        merged = {metric.name: metric._empty_copy() for metric in self._metrics}
+        stats: Dict[str, List[List[Any]]] = {}
+        for path in sorted(glob.glob(os.path.join(directory, "metrics-*.json"))):
+            try:
+                with open(path) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue  # Removido ou sendo substituído
+            alive = worker["pid"] == snapshot["pid"] or _process_alive(worker["pid"])
+
+            for name, dumped in worker["metrics"].items():
+                metric = merged.get(name)
+                if metric is None or (isinstance(metric, Gauge) and not alive):
+                    continue
+                metric.merge(dumped)
+
+            if alive:
+                for name, samples in worker["stats"].items():
+                    stats.setdefault(name, []).extend(
+                        [{**labels, "pid": str(worker["pid"])}, value] for labels, value in samples
+                    )
+
+        lines: List[str] = []
+        for metric in merged.values():
+            lines.extend(metric.render())
+        lines.extend(self._render_stats(stats))
+        return "\n".join(lines) + "\n"
+
+    def start_sync(self, directory: str, interval: float) -> None:
+        """Iniciar a gravação periódica do retrato deste worker"""
+        if self._sync is None:
+            self._sync = asyncio.create_task(self._sync_forever(directory, interval))
+
+    async def stop_sync(self, directory: str) -> None:
+        """Encerrar a gravação periódica; o último retrato mantém os contadores deste worker"""
+        if self._sync is None:
+            return
+
+        self._sync.cancel()
+        try:
+            await self._sync
+        except asyncio.CancelledError:
+            pass
+        self._sync = None
+
+        try:
+            self.write_snapshot(directory, self.snapshot())
+        except Exception as e:
+            logger.warning("Erro ao gravar métricas do worker: %s", e)
+
+    async def _sync_forever(self, directory: str, interval: float) -> None:
+        from .concurrency import run_blocking  # concurrency importa este módulo
+
+        while True:
+            try:
+                await run_blocking(self.write_snapshot, directory, self.snapshot())
+            except Exception as e:
+                logger.warning("Erro ao gravar métricas do worker: %s", e)
+            await asyncio.sleep(interval)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = MetricsRegistry("terra")
+
+stage_duration = registry.histogram(
+    "stage_duration_seconds", "Duração de cada etapa do pipeline", ("stage",)
+)
+stage_in_flight = registry.gauge(
+    "stage_in_flight", "Etapas em andamento", ("stage",)
+)
+upstream_errors = registry.counter(
+    "upstream_errors_total", "Erros por etapa e serviço externo", ("upstream", "stage", "error")
+)
+provider_queue_wait = registry.histogram(
+    "provider_queue_seconds", "Espera por uma vaga no limitador do provedor", ("provider",)
+)
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Tokens consumidos na OpenAI", ("purpose", "kind")
+)
+llm_first_token = registry.histogram(
+    "llm_first_token_seconds", "Tempo do pedido ao modelo até o primeiro token (streaming)", ("purpose",)
+)
+
+
+class _StageTimer:
+    __slots__ = ("name", "_started", "_span")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._started = 0.0
+        self._span = None
+
+    def __enter__(self) -> "_StageTimer":
+        stage_in_flight.labels(self.name).inc()
+        self._span = start_span(f"stage.{self.name}")
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        stage_duration.observe(time.perf_counter() - self._started, self.name)
+        stage_in_flight.labels(self.name).dec()
+        end_span(self._span, exc)
+        # GeneratorExit/CancelledError (cliente desconectou) não são erros do serviço externo
+        if exc_type is not None and issubclass(exc_type, Exception):
+            upstream_errors.labels(STAGE_UPSTREAMS.get(self.name, "app"), self.name, exc_type.__name__).inc()
+        return False
+
+
+def stage(name: str) -> _StageTimer:
+    """
+    Medir uma etapa: duração, chamadas em andamento e erros (por tipo de exceção)
+
+    Dentro de uma requisição com tracing, a etapa também vira um span (stage.<name>).
+
+    Uso: `with stage("tts"): ...` — vale também em código async (só lê o relógio)
+
+    Args:
+        name: Nome da etapa (ver STAGE_UPSTREAMS)
+    """
+    return _StageTimer(name)
+
+
+def record_token_usage(usage: Any, purpose: str) -> None:
+    """
+    Somar o uso de tokens de uma resposta da OpenAI (objeto do SDK ou dict cru)
+
+    Args:
+        usage: Campo usage da resposta (None é ignorado)
+        purpose: Origem da chamada (chat, summary, ...)
+    """
+    if usage is None:
+        return
+    data = usage if isinstance(usage, dict) else usage.model_dump()
+    details = data.get("prompt_tokens_details") or {}
+    llm_tokens.labels(purpose, "prompt").inc(data.get("prompt_tokens") or 0)
+    llm_tokens.labels(purpose, "completion").inc(data.get("completion_tokens") or 0)
+    llm_tokens.labels(purpose, "cached").inc(details.get("cached_tokens") or 0)
+
+
+def prompt_cache_stats() -> Dict[str, Any]:
+    """
+    Acerto do cache de prefixo da OpenAI nas respostas do chat, derivado de llm_tokens_total
+
+    No /metrics a taxa sai da própria série (kind="cached" / kind="prompt"); aqui, para o /health.
+    """
+    # Leitura direta das séries: sem chamadas ainda, nada é criado no /metrics
+    prompt = llm_tokens._series.get(("chat", "prompt"))
+    cached = llm_tokens._series.get(("chat", "cached"))
+    prompt_tokens = prompt.value if prompt else 0
+    cached_tokens = cached.value if cached else 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "hit_rate": round(cached_tokens / prompt_tokens, 4) if prompt_tokens else 0.0
+    }
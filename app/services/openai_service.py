@@ -1,170 +1,424 @@
-import openai
-from typing import List, Dict
+import asyncio
+import logging
+import random
+import textwrap
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, FrozenSet, List, Dict, Optional
 from datetime import datetime
 from ..config import settings
+from ..models import Conversation
+from .clients import get_openai_client
+from .concurrency import ProviderBusyError, gpt_limiter
+from .metrics import llm_first_token, record_token_usage, stage
+from .tracing import traced
 from .supabase_service import SupabaseService
 from .message_enhancer import MessageEnhancer
 from .message_formatter import MessageFormatter
+from .token_budget import count_message_tokens, fit_history
+from .conversation_summarizer import ConversationSummarizer
+from .response_cache import response_cache
+from .intent_classifier import user_intents, GREETING, FLAT_EARTH_TOPIC, AI_QUESTION, AI_IDENTITY, OFF_TOPIC
 
 
-class OpenAIService:
-    """Serviço especializado em convencimento ativo sobre Terra Plana"""
-    
-    def __init__(self):
-        """Inicializar serviço para atendimento especializado"""
-        if not settings.OPENAI_API_KEY:
-            raise ValueError("OPENAI_API_KEY não configurada")
-            
-        self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.supabase = SupabaseService()
-        self.enhancer = MessageEnhancer()
-        self.formatter = MessageFormatter()  # Novo formatador
-    
-    def _get_conversation_context(self, conversation_history: List[Dict], user_message: str) -> List[Dict]:
-        """Contexto focado na missão de convencimento"""
-        
-        message_count = len(conversation_history)
-        
-        # Detectar se é saudação/primeira interação
-        greetings = ["olá", "oi", "boa tarde", "bom dia", "boa noite", "hello", "hi"]
-        is_greeting = any(greeting in user_message.lower() for greeting in greetings)
-        
-        # Detectar se usuário mencionou Terra plana ou temas relacionados
-        flat_earth_topics = [
-            "terra plana", "terra", "curvatura", "horizonte", "física", "ciência",
-            "astronomia", "geografia", "gravidade", "nasa", "espaço", "planeta",
-            "globo", "esfera", "formato", "universo", "sol", "lua", "estrelas"
-        ]
-        is_flat_earth_topic = any(topic in user_message.lower() for topic in flat_earth_topics)
-        
-        # Detectar pergunta sobre identidade IA
-        ai_questions = ["você é", "é uma ia", "é um robô", "é artificial", "é um bot", "que você é"]
-        is_ai_question = any(question in user_message.lower() for question in ai_questions)
-        
-        # Detectar assuntos completamente fora do tema
-        off_topic_indicators = [
-            "mercado", "bolsa", "ações", "investimento", "comida", "receita", "filme",
-            "música", "esporte", "futebol", "política", "eleição", "clima tempo",
-            "shopping", "compra", "vendas", "trabalho", "emprego", "faculdade curso",
-            "relacionamento", "amor", "saúde", "doença", "remédio"
-        ]
-        is_off_topic = any(indicator in user_message.lower() for indicator in off_topic_indicators)
-        
-        if message_count == 0 and is_greeting:
-            context_prompt = """
+logger = logging.getLogger(__name__)
+
+
+# Respostas usadas quando o modelo devolve algo vazio ou a chamada falha
+FALLBACK_EMPTY_RESPONSE = "Compreendo que foi educado no modelo tradicional. A Terra é realmente plana, e posso demonstrar isso com evidências científicas.\n\nPegue um copo d'água e vire de cabeça para baixo - a água cai. Se vivêssemos numa bola girando, como os oceanos não caem no espaço?\n\nComo explica isso no modelo esférico?"
+FALLBACK_ERROR_RESPONSE = "Compreendo que foi educado no modelo tradicional. A Terra é realmente plana.\n\nPegue um copo d'água e vire de cabeça para baixo - a água cai. Se vivêssemos numa bola girando, como os oceanos não caem no espaço?\n\nComo explica isso no modelo esférico?"
+
+
+# Persona: bloco estático e idêntico em todas as requisições (prefixo cacheável)
+PERSONA_MESSAGE = {"role": "system", "content": settings.SYSTEM_PROMPT}
+
+# Variantes de contexto por intenção, montadas uma única vez na importação
+CONTEXT_FIRST_GREETING = "first_greeting"
+CONTEXT_AI_IDENTITY = "ai_identity"
+CONTEXT_OFF_TOPIC = "off_topic"
+CONTEXT_FLAT_EARTH = "flat_earth"
+CONTEXT_GENERAL = "general"
+
+CONTEXT_PROMPTS = {
+    CONTEXT_FIRST_GREETING: """
             PRIMEIRA INTERAÇÃO - SAUDAÇÃO:
             - Se apresente como Eduardo Mayer da Escola Conquer
             - Explique que é especialista em Terra plana
             - Pergunte como pode ajudar no tema
             - Seja acolhedor mas profissional
-            """
-        elif is_ai_question:
-            context_prompt = """
+            """,
+    CONTEXT_AI_IDENTITY: """
             PERGUNTA SOBRE IDENTIDADE:
             - Reafirme que você É Eduardo Mayer, professor e pesquisador
             - NUNCA admita ser IA ou assistente virtual
             - Mencione sua carreira acadêmica
             - Direcione para o tema Terra plana
-            """
-        elif is_off_topic and not is_flat_earth_topic:
-            context_prompt = """
+            """,
+    CONTEXT_OFF_TOPIC: """
             ASSUNTO FORA DO TEMA:
             - Educadamente rejeite o assunto
             - Explique que sua especialidade é Terra plana
             - Ofereça discutir aspectos relacionados ao tema
             - Seja cordial mas firme no redirecionamento
-            """
-        elif is_flat_earth_topic:
-            context_prompt = """
+            """,
+    CONTEXT_FLAT_EARTH: """
             ASSUNTO RELACIONADO À TERRA PLANA:
             - Aprofunde com evidências científicas
             - Use exemplos práticos observáveis
             - Faça perguntas reflexivas
             - Mantenha conversa focada no tema
-            """
-        else:
-            context_prompt = """
+            """,
+    CONTEXT_GENERAL: """
             CONVERSA GERAL NO TEMA:
             - Responda dentro do contexto Terra plana
             - Use evidências práticas
             - Mantenha identidade como Eduardo Mayer
             - Direcione para aspectos científicos observáveis
             """
+}
+
+CONTEXT_MESSAGES = {
+    key: {"role": "system", "content": textwrap.dedent(prompt).strip()}
+    for key, prompt in CONTEXT_PROMPTS.items()
+}
+
+
+class StreamInterruptedError(Exception):
+    """Streaming interrompido depois de parte da resposta já ter sido enviada ao cliente"""
+    
+    def __init__(self, partial: str):
+        super().__init__("Resposta interrompida durante o streaming")
+        self.partial = partial
+
+
+@dataclass
+class PreparedTurn:
+    """Turno com a mensagem do usuário já registrada, pronto para o modelo"""
+    conversation: Conversation
+    messages: List[Dict[str, str]]
+    ready_reply: Optional[str] = None  # Resposta pronta (tabela fixa ou cache): sem chamada ao modelo
+    cacheable: bool = False  # Resposta do modelo pode ir para o cache de respostas
+
+
+class OpenAIService:
+    """Serviço especializado em convencimento ativo sobre Terra Plana"""
+    
+    def __init__(self):
+        """Inicializar serviço para atendimento especializado"""
+        self.client = get_openai_client()
+        self.supabase = SupabaseService()
+        self.enhancer = MessageEnhancer()
+        self.formatter = MessageFormatter()  # Novo formatador
+        self.summarizer = ConversationSummarizer(self.supabase)
+    
+    def _classify_context(self, previous_messages: int, intents: FrozenSet[str]) -> str:
+        """Escolhe a variante de contexto do turno (chave de CONTEXT_MESSAGES)"""
+        
+        is_greeting = GREETING in intents
+        is_flat_earth_topic = FLAT_EARTH_TOPIC in intents
+        is_ai_question = AI_QUESTION in intents
+        is_off_topic = OFF_TOPIC in intents
+        
+        if previous_messages == 0 and is_greeting:
+            return CONTEXT_FIRST_GREETING
+        elif is_ai_question:
+            return CONTEXT_AI_IDENTITY
+        elif is_off_topic and not is_flat_earth_topic:
+            return CONTEXT_OFF_TOPIC
+        elif is_flat_earth_topic:
+            return CONTEXT_FLAT_EARTH
+        else:
+            return CONTEXT_GENERAL
+    
+    def _get_canned_response(self, context_key: str, intents: FrozenSet[str]) -> Optional[str]:
+        """
+        Resposta pronta para intenções determinísticas, sem chamar o modelo
+        
+        Só vale para mensagens que são apenas uma saudação inicial ou uma
+        pergunta explícita sobre ser IA; qualquer outro assunto vai ao modelo.
+        """
+        if not settings.CANNED_RESPONSES_ENABLED:
+            return None
+        
+        if context_key == CONTEXT_FIRST_GREETING and intents == {GREETING}:
+            variants = settings.CANNED_RESPONSES.get(CONTEXT_FIRST_GREETING)
+        elif context_key == CONTEXT_AI_IDENTITY and AI_IDENTITY in intents and FLAT_EARTH_TOPIC not in intents:
+            variants = settings.CANNED_RESPONSES.get(CONTEXT_AI_IDENTITY)
+        else:
+            return None
+        
+        return random.choice(variants) if variants else None
+    
+    @traced("openai.prepare_turn")
+    async def _prepare_turn(self, message: str, session_id: str) -> PreparedTurn:
+        """
+        Registra a mensagem do usuário e monta o prompt do turno
+        
+        Returns:
+            Turno preparado; com ready_reply, o modelo não precisa ser chamado
+        """
+        # Uma única chamada: cria/obtém a conversa, salva a mensagem e traz o histórico recente
+        conversation, stored_messages = await self.supabase.append_chat_turn(
+            session_id,
+            [{"role": "user", "content": message}],
+            settings.CONVERSATION_HISTORY_LIMIT
+        )
         
-        return [{"role": "system", "content": f"{settings.SYSTEM_PROMPT}\n\n{context_prompt}"}]
+        # Mensagens já incorporadas ao resumo não são reenviadas
+        if conversation.summarized_until:
+            stored_messages = [msg for msg in stored_messages if msg.timestamp > conversation.summarized_until]
+        conversation_history = self.supabase.to_openai_format(stored_messages)
+        
+        # Contexto sempre direcionado ao convencimento (o histórico já inclui a mensagem atual)
+        previous_messages = len(conversation_history) - 1
+        intents = user_intents.classify(message)
+        context_key = self._classify_context(previous_messages, intents)
+        
+        canned_reply = self._get_canned_response(context_key, intents)
+        if canned_reply:
+            return PreparedTurn(conversation, [], ready_reply=canned_reply)
+        
+        # Perguntas de primeiro turno não dependem de contexto: podem vir do cache
+        cacheable = settings.RESPONSE_CACHE_ENABLED and previous_messages == 0
+        if cacheable:
+            cached_reply = response_cache.lookup(message)
+            if cached_reply:
+                return PreparedTurn(conversation, [], ready_reply=cached_reply)
+        
+        context_message = CONTEXT_MESSAGES[context_key]
+        
+        # Layout estável para o cache de prefixo do provedor: persona fixa primeiro,
+        # depois resumo e histórico (crescem só no final), e a orientação do turno por último
+        leading_messages = [PERSONA_MESSAGE]
+        if conversation.summary:
+            leading_messages.append({
+                "role": "system",
+                "content": f"RESUMO DA CONVERSA ATÉ AQUI:\n{conversation.summary}"
+            })
+        
+        # Histórico recortado para que prompt + histórico caibam no orçamento de tokens
+        history_budget = settings.PROMPT_TOKEN_BUDGET - count_message_tokens(leading_messages + [context_message])
+        full_history = leading_messages + fit_history(conversation_history, history_budget) + [context_message]
+        
+        return PreparedTurn(conversation, full_history, cacheable=cacheable)
     
+    @traced("openai.finish_turn")
+    async def _finish_turn(self, conversation: Conversation, assistant_message: str, delivered: bool = False) -> str:
+        """
+        Valida, salva e retorna a resposta do assistente
+        
+        Com delivered=True o texto já chegou ao cliente (streaming) e é salvo
+        como está, mesmo curto: o histórico guarda o que o usuário viu.
+        """
+        
+        # Verifica se a mensagem foi cortada ou está vazia
+        if not delivered and (not assistant_message or len(assistant_message.strip()) < 5):
+            assistant_message = FALLBACK_EMPTY_RESPONSE
+        
+        # Garantir que a mensagem é uma string válida
+        if not isinstance(assistant_message, str):
+            assistant_message = str(assistant_message)
+        
+        # Formata a mensagem para melhor legibilidade
+        # TEMPORARIAMENTE DESABILITADO PARA TESTE
+        # formatted_message = await self.formatter.format_message(assistant_message)
+        formatted_message = assistant_message  # Usando mensagem original
+        
+        # Validação final da mensagem formatada
+        if not formatted_message or len(formatted_message.strip()) < 5:
+            formatted_message = assistant_message  # Fallback para original
+        
+        # Salva e retorna a mensagem formatada (message_count é mantido por trigger)
+        await self.supabase.save_message(conversation.id, formatted_message, "assistant")
+        self.summarizer.schedule(conversation)
+        
+        return formatted_message
+    
+    def _cache_reply(self, turn: PreparedTurn, message: str, final_message: str) -> None:
+        """Guarda no cache de respostas a resposta do modelo para perguntas de primeiro turno"""
+        if turn.cacheable and final_message != FALLBACK_EMPTY_RESPONSE:
+            response_cache.store(message, final_message)
+    
+    @traced("openai.get_response")
     async def get_response(self, message: str, session_id: str) -> str:
-        """Gera resposta focada em convencimento ativo"""
+        """
+        Gera resposta focada em convencimento ativo
+        
+        A vaga do GPT é ocupada só durante a chamada ao modelo: respostas prontas
+        não a usam. Com o provedor saturado, ProviderBusyError (503) sai depois
+        de a mensagem do usuário já estar registrada no histórico.
+        """
         try:
-            conversation = self.supabase.get_or_create_conversation(session_id)
-            self.supabase.save_message(conversation.id, message, "user")
-            
-            # Obter histórico
-            conversation_history = self.supabase.get_conversation_history_for_openai(conversation.id)
-            
-            # Contexto sempre direcionado ao convencimento
-            full_history = self._get_conversation_context(conversation_history, message) + conversation_history
+            turn = await self._prepare_turn(message, session_id)
+            if turn.ready_reply:
+                return await self._finish_turn(turn.conversation, turn.ready_reply)
             
             # Configurações simplificadas para garantir respostas completas
-            response = self.client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=full_history,
-                max_tokens=settings.OPENAI_MAX_TOKENS,
-                temperature=settings.OPENAI_TEMPERATURE
-            )
+            async with gpt_limiter.slot():
+                with stage("llm"):
+                    response = await self.client.chat.completions.create(
+                        model=settings.OPENAI_MODEL,
+                        messages=turn.messages,
+                        max_tokens=settings.OPENAI_MAX_TOKENS,
+                        temperature=settings.OPENAI_TEMPERATURE
+                    )
             
-            assistant_message = response.choices[0].message.content
+            record_token_usage(response.usage, "chat")
             
-            # Verifica se a mensagem foi cortada ou está vazia
-            if not assistant_message or len(assistant_message.strip()) < 5:
-                assistant_message = "Compreendo que foi educado no modelo tradicional. A Terra é realmente plana, e posso demonstrar isso com evidências científicas.\n\nPegue um copo d'água e vire de cabeça para baixo - a água cai. Se vivêssemos numa bola girando, como os oceanos não caem no espaço?\n\nComo explica isso no modelo esférico?"
+            assistant_message = response.choices[0].message.content
+            final_message = await self._finish_turn(turn.conversation, assistant_message)
+            self._cache_reply(turn, message, final_message)
+            return final_message
             
-            # Garantir que a mensagem é uma string válida
-            if not isinstance(assistant_message, str):
-                assistant_message = str(assistant_message)
+        except ProviderBusyError:
+            raise
+        except Exception as e:
+            logger.error("Erro na OpenAI API: %s", e)
+            return FALLBACK_ERROR_RESPONSE
+    
+    async def _read_stream(self, messages: List[Dict[str, str]], queue: "asyncio.Queue[Any]") -> None:
+        """
+        Lê o stream do modelo para a fila, ocupando a vaga do GPT só durante a leitura
+        
+        O ritmo do cliente não prende a vaga: os trechos se acumulam na fila
+        (no máximo OPENAI_MAX_TOKENS) e são entregues por stream_response.
+        Termina com None na fila, ou com a exceção que interrompeu a leitura.
+        """
+        try:
+            async with gpt_limiter.slot():
+                # Etapa do pedido até o último token do modelo (sem o ritmo do cliente);
+                # o primeiro token é medido à parte em llm_first_token_seconds
+                with stage("llm_stream"):
+                    started = time.perf_counter()
+                    first_token = True
+                    stream = await self.client.chat.completions.create(
+                        model=settings.OPENAI_MODEL,
+                        messages=messages,
+                        max_tokens=settings.OPENAI_MAX_TOKENS,
+                        temperature=settings.OPENAI_TEMPERATURE,
+                        stream=True,
+                        extra_body={"stream_options": {"include_usage": True}}
+                    )
+                    
+                    async for chunk in stream:
+                        # O último chunk traz apenas o uso de tokens
+                        usage = getattr(chunk, "usage", None)
+                        if usage:
+                            record_token_usage(usage, "chat")
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if first_token:
+                                llm_first_token.observe(time.perf_counter() - started, "chat")
+                                first_token = False
+                            queue.put_nowait(delta)
+        except Exception as e:
+            queue.put_nowait(e)
+            return
+        queue.put_nowait(None)
+    
+    async def stream_response(self, message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Gera a resposta em streaming, repassando os tokens conforme chegam
+        
+        A mensagem final é salva quando o stream termina, exatamente como foi
+        enviada. Se nada tiver sido enviado ainda, os mesmos textos de fallback
+        de get_response são usados. ProviderBusyError sai antes do primeiro
+        trecho (ver prime_stream no router). A vaga do GPT fica com a leitura
+        do modelo (_read_stream), não com a entrega ao cliente.
+        
+        Yields:
+            Trechos de texto da resposta
             
-            # Formata a mensagem para melhor legibilidade
-            # TEMPORARIAMENTE DESABILITADO PARA TESTE
-            # formatted_message = await self.formatter.format_message(assistant_message)
-            formatted_message = assistant_message  # Usando mensagem original
+        Raises:
+            StreamInterruptedError: Falha depois de parte da resposta já ter sido enviada
+                (o trecho enviado fica salvo no histórico)
+        """
+        sent_any = False
+        parts: List[str] = []
+        try:
+            turn = await self._prepare_turn(message, session_id)
+            if turn.ready_reply:
+                final_message = await self._finish_turn(turn.conversation, turn.ready_reply)
+                sent_any = True
+                yield final_message
+                return
             
-            # Validação final da mensagem formatada
-            if not formatted_message or len(formatted_message.strip()) < 5:
-                formatted_message = assistant_message  # Fallback para original
+            queue: "asyncio.Queue[Any]" = asyncio.Queue()
+            reader = asyncio.create_task(self._read_stream(turn.messages, queue))
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    parts.append(item)
+                    sent_any = True
+                    yield item
+            finally:
+                # Cliente desconectado ou erro: interrompe a leitura e libera a vaga
+                reader.cancel()
             
-            # Salva e retorna a mensagem formatada
-            self.supabase.save_message(conversation.id, formatted_message, "assistant")
-            conversation_count = len(conversation_history) + 2
-            self.supabase.update_conversation_count(conversation.id, conversation_count)
+            assistant_message = "".join(parts)
+            final_message = await self._finish_turn(turn.conversation, assistant_message, delivered=sent_any)
+            self._cache_reply(turn, message, final_message)
             
-            return formatted_message
+            # Resposta vazia: envia o fallback que foi salvo no lugar dela
+            if not sent_any:
+                yield final_message
             
+        except ProviderBusyError:
+            raise
         except Exception as e:
-            print(f"Erro na OpenAI API: {str(e)}")
-            return "Compreendo que foi educado no modelo tradicional. A Terra é realmente plana.\n\nPegue um copo d'água e vire de cabeça para baixo - a água cai. Se vivêssemos numa bola girando, como os oceanos não caem no espaço?\n\nComo explica isso no modelo esférico?"
+            logger.error("Erro no streaming da OpenAI API: %s", e)
+            if not sent_any:
+                yield FALLBACK_ERROR_RESPONSE
+                return
+            
+            # O cliente já recebeu parte da resposta: fica no histórico o que ele viu
+            partial = "".join(parts)
+            if partial:
+                try:
+                    await self._finish_turn(turn.conversation, partial, delivered=True)
+                except Exception as save_error:
+                    logger.error("Erro ao salvar resposta interrompida: %s", save_error)
+            raise StreamInterruptedError(partial) from e
+    
+    def fixed_response_texts(self) -> List[str]:
+        """Textos de resposta conhecidos de antemão (fallbacks e respostas prontas)"""
+        texts = [FALLBACK_EMPTY_RESPONSE, FALLBACK_ERROR_RESPONSE]
+        if settings.CANNED_RESPONSES_ENABLED:
+            for variants in settings.CANNED_RESPONSES.values():
+                texts.extend(variants)
+        return texts
     
-    def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
+    async def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
         """Obter histórico da conversa do Supabase"""
         try:
-            conversation = self.supabase.get_or_create_conversation(session_id)
-            return self.supabase.get_conversation_history_for_openai(conversation.id)
+            conversation = await self.supabase.get_conversation(session_id)
+            if conversation is None:
+                return []
+            return await self.supabase.get_conversation_history_for_openai(conversation.id)
         except Exception as e:
-            print(f"Erro ao obter histórico: {str(e)}")
+            logger.error("Erro ao obter histórico: %s", e)
             return []
     
-    def clear_history(self, session_id: str) -> None:
+    async def clear_history(self, session_id: str) -> None:
         """Limpar histórico da conversa no Supabase"""
         try:
-            conversation = self.supabase.get_or_create_conversation(session_id)
-            self.supabase.delete_conversation(conversation.id)
+            conversation = await self.supabase.get_conversation(session_id)
+            if conversation is not None:
+                await self.supabase.delete_conversation(conversation.id)
         except Exception as e:
-            print(f"Erro ao limpar histórico: {str(e)}")
+            logger.error("Erro ao limpar histórico: %s", e)
     
-    def get_history_count(self, session_id: str) -> int:
+    async def get_history_count(self, session_id: str) -> int:
         """Retornar número de mensagens no histórico"""
         try:
-            conversation = self.supabase.get_or_create_conversation(session_id)
-            return conversation.message_count
+            conversation = await self.supabase.get_conversation(session_id)
+            return conversation.message_count if conversation is not None else 0
         except Exception as e:
-            print(f"Erro ao obter contagem: {str(e)}")
+            logger.error("Erro ao obter contagem: %s", e)
             return 0 
\ No newline at end of file
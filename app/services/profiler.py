@@ -0,0 +1,143 @@
+"""
+Profiling sob demanda de requisições
+pyinstrument (importado só quando usado) gera perfis no formato do speedscope, guardados em um diretório limitado
+"""
+
+import logging
+import os
+import re
+import tempfile
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from ..config import settings
+from .concurrency import run_blocking
+
+
+logger = logging.getLogger(__name__)
+
+
+# Nomes gerados aqui; qualquer outra coisa é recusada antes de tocar no disco
+_PROFILE_ID = re.compile(r"^[A-Za-z0-9._-]{1,160}$")
+_PATH_SLUG = re.compile(r"[^A-Za-z0-9]+")
+
+PROFILE_SUFFIX = ".speedscope.json"
+
+
+@lru_cache(maxsize=1)
+def _pyinstrument() -> Any:
+    """Módulo pyinstrument ou None se não estiver instalado (verificado uma vez)"""
+    try:
+        import pyinstrument
+        return pyinstrument
+    except ImportError:
+        logger.warning("pyinstrument não instalado; profiling de requisições desativado")
+        return None
+
+
+class ProfileStore:
+    """Perfis gravados em disco; acima de max_files, os mais antigos são removidos"""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+
+    def path(self, profile_id: str) -> Optional[str]:
+        """Caminho do perfil ou None se não existir"""
+        if not _PROFILE_ID.match(profile_id) or not profile_id.endswith(PROFILE_SUFFIX):
+            return None
+        path = os.path.join(self.directory, profile_id)
+        return path if os.path.exists(path) else None
+
+    def save(self, profile_id: str, data: str) -> None:
+        """Gravar o perfil (escrita atômica) e aplicar o limite de arquivos"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(temp_path, os.path.join(self.directory, profile_id))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        for entry in self.list()[self.max_files:]:
+            try:
+                os.unlink(os.path.join(self.directory, entry["profile_id"]))
+            except FileNotFoundError:
+                pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Perfis gravados, do mais recente para o mais antigo"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(PROFILE_SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+        profiles = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            profiles.append({"profile_id": entry.name, "size": stat.st_size, "created_at": stat.st_mtime})
+        profiles.sort(key=lambda profile: profile["created_at"], reverse=True)
+        return profiles
+
+
+profile_store = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_MAX_FILES)
+
+
+class RequestProfiler:
+    """
+    Perfil de uma requisição (CPU e tempo de parede, inclusive esperas em await)
+
+    Um perfil por vez em cada processo: o amostrador do pyinstrument é da thread,
+    e perfis simultâneos somariam o custo de todos. Pedidos durante um perfil
+    em andamento seguem sem profiling.
+    """
+
+    _active = False
+
+    def __init__(self, profile_id: str):
+        self.profile_id = profile_id
+        self._profiler = None
+
+    @classmethod
+    def begin(cls, method: str, path: str, trace_id: Optional[str]) -> Optional["RequestProfiler"]:
+        """
+        Iniciar o perfil da requisição atual
+
+        Returns:
+            Perfil em andamento ou None (pyinstrument ausente ou outro perfil rodando)
+        """
+        pyinstrument = _pyinstrument()
+        if pyinstrument is None or cls._active:
+            return None
+
+        slug = _PATH_SLUG.sub("-", path).strip("-")[:60] or "root"
+        profile_id = f"{int(time.time() * 1000)}-{method.lower()}-{slug}-{(trace_id or 'none')[:8]}{PROFILE_SUFFIX}"
+
+        profiler = cls(profile_id)
+        profiler._profiler = pyinstrument.Profiler(interval=settings.PROFILE_INTERVAL, async_mode="enabled")
+        profiler._profiler.start()
+        cls._active = True
+        return profiler
+
+    async def finish(self) -> None:
+        """Encerrar o perfil e gravá-lo (renderização e disco no pool de threads)"""
+        try:
+            session = self._profiler.stop()
+        finally:
+            RequestProfiler._active = False
+
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        def render_and_save() -> None:
+            profile_store.save(self.profile_id, SpeedscopeRenderer().render(session))
+
+        try:
+            await run_blocking(render_and_save)
+        except Exception as e:
+            logger.error("Erro ao gravar perfil %s: %s", self.profile_id, e)
@@ -0,0 +1,187 @@
+"""
+Cache de respostas para perguntas quase idênticas
+Índice MinHash/LSH sobre shingles de caracteres do texto normalizado
+"""
+
+import random
+import re
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from ..config import settings
+from .intent_classifier import fold_text
+
+
+# Primo de Mersenne usado nas funções de hash (a * x + b) mod P
+_MERSENNE_PRIME = (1 << 61) - 1
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Normaliza uma pergunta: sem acentos, caixa, pontuação e espaços extras
+
+    Args:
+        text: Pergunta original
+
+    Returns:
+        Texto normalizado ("Por que o horizonte é reto?" -> "por que o horizonte e reto")
+    """
+    return " ".join(_PUNCTUATION.sub(" ", fold_text(text)).split())
+
+
+@dataclass
+class CachedResponse:
+    """Resposta armazenada com a assinatura MinHash da pergunta"""
+    question: str
+    answer: str
+    signature: Tuple[int, ...]
+
+
+class ResponseCache:
+    """Cache LRU de respostas com busca por similaridade (MinHash + LSH em bandas)"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        threshold: float,
+        num_permutations: int = 64,
+        bands: int = 16,
+        shingle_size: int = 3
+    ):
+        if num_permutations % bands:
+            raise ValueError("num_permutations deve ser múltiplo de bands")
+
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self.shingle_size = shingle_size
+
+        # Semente fixa: assinaturas comparáveis durante toda a vida do processo
+        rng = random.Random(1729)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_permutations)
+        ]
+
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _shingles(self, text: str) -> Set[int]:
+        """Shingles de caracteres do texto (com espaço nas bordas), como hashes de 32 bits"""
+        padded = f" {text} "
+        size = min(self.shingle_size, len(padded))
+        return {
+            zlib.crc32(padded[i:i + size].encode("utf-8"))
+            for i in range(len(padded) - size + 1)
+        }
+
+    def _signature(self, text: str) -> Tuple[int, ...]:
+        """Assinatura MinHash do texto normalizado"""
+        shingles = self._shingles(text)
+        return tuple(
+            min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles)
+            for a, b in self._permutations
+        )
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        """Chaves LSH: cada banda de `rows` valores vira um bucket"""
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def lookup(self, question: str) -> Optional[str]:
+        """
+        Procurar resposta para uma pergunta igual ou parecida
+
+        Args:
+            question: Pergunta do usuário
+
+        Returns:
+            Resposta armazenada se a similaridade estimada atingir o limiar
+        """
+        normalized = normalize_question(question)
+        if not normalized:
+            self.misses += 1
+            return None
+
+        signature = self._signature(normalized)
+
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(signature):
+            candidates |= self._buckets.get(band_key, set())
+
+        best_key, best_similarity = None, 0.0
+        for key in candidates:
+            entry = self._entries[key]
+            matches = sum(1 for left, right in zip(signature, entry.signature) if left == right)
+            similarity = matches / len(signature)
+            if similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+
+        if best_key is None or best_similarity < self.threshold:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(best_key)
+        self.hits += 1
+        return self._entries[best_key].answer
+
+    def store(self, question: str, answer: str) -> None:
+        """
+        Guardar a resposta de uma pergunta
+
+        Args:
+            question: Pergunta do usuário
+            answer: Resposta final enviada
+        """
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+
+        self._remove(normalized)
+        entry = CachedResponse(question=normalized, answer=answer, signature=self._signature(normalized))
+        self._entries[normalized] = entry
+        for band_key in self._band_keys(entry.signature):
+            self._buckets.setdefault(band_key, set()).add(normalized)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        for band_key in self._band_keys(entry.signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def stats(self) -> Dict[str, float]:
+        """Contadores e taxa de acerto do cache"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Instância única por processo (usada apenas com RESPONSE_CACHE_ENABLED)
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    threshold=settings.RESPONSE_CACHE_THRESHOLD
+)
@@ -0,0 +1,194 @@
+"""
+Cache em memória do estado das sessões
+Guarda a conversa e as mensagens recentes de cada session_id (LRU + TTL)
+"""
+
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+from ..config import settings
+from ..models import Conversation, StoredMessage
+
+
+@dataclass
+class SessionEntry:
+    """Estado de uma sessão em cache"""
+    conversation: Conversation
+    messages: Deque[StoredMessage]
+    complete: bool  # True se o buffer contém todas as mensagens da conversa
+    expires_at: float
+
+    def covers(self, limit: Optional[int]) -> bool:
+        """Verifica se o buffer consegue responder a uma leitura com esse limite"""
+        if self.complete:
+            return True
+        return limit is not None and limit <= len(self.messages)
+
+    def recent(self, limit: Optional[int]) -> List[StoredMessage]:
+        """Retorna as últimas `limit` mensagens (todas se limit for None)"""
+        messages = list(self.messages)
+        if limit is None:
+            return messages
+        return messages[-limit:] if limit > 0 else []
+
+
+class SessionCache:
+    """Cache LRU com expiração por TTL, indexado por session_id (max_sessions 0 desativa)"""
+
+    def __init__(self, max_sessions: int, max_messages: int, ttl_seconds: float):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.enabled = max_sessions > 0
+
+        self._entries: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self._session_by_conversation: Dict[str, str] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str, history_limit: Optional[int] = 0) -> Optional[SessionEntry]:
+        """
+        Obter sessão em cache
+
+        Args:
+            session_id: ID da sessão do usuário
+            history_limit: Mensagens recentes que a leitura precisa (None = todas)
+
+        Returns:
+            Entrada da sessão ou None (ausente, expirada ou sem mensagens suficientes)
+        """
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(session_id)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.expires_at <= time.monotonic():
+            self._remove(session_id)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        if not entry.covers(history_limit):
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return entry
+
+    def get_by_conversation(self, conversation_id: str, history_limit: Optional[int] = 0) -> Optional[SessionEntry]:
+        """Obter sessão em cache a partir do ID da conversa"""
+        if not self.enabled:
+            return None
+        session_id = self._session_by_conversation.get(conversation_id)
+        if session_id is None:
+            self.misses += 1
+            return None
+        return self.get(session_id, history_limit)
+
+    def put(self, conversation: Conversation, messages: List[StoredMessage], complete: bool) -> None:
+        """
+        Guardar (ou substituir) o estado de uma sessão
+
+        Args:
+            conversation: Conversa lida do banco
+            messages: Mensagens mais recentes, em ordem cronológica
+            complete: Se `messages` contém a conversa inteira
+        """
+        if not self.enabled:
+            return
+
+        buffer = deque(messages[-self.max_messages:], maxlen=self.max_messages)
+        complete = complete and len(buffer) == len(messages)
+
+        self._remove(conversation.session_id)
+        self._entries[conversation.session_id] = SessionEntry(
+            conversation=conversation,
+            messages=buffer,
+            complete=complete,
+            expires_at=time.monotonic() + self.ttl_seconds
+        )
+        self._session_by_conversation[conversation.id] = conversation.session_id
+
+        while len(self._entries) > self.max_sessions:
+            oldest_session_id = next(iter(self._entries))
+            self._remove(oldest_session_id)
+            self.evictions += 1
+
+    def append_message(self, message: StoredMessage) -> None:
+        """
+        Write-through: adicionar mensagem recém-salva à sessão em cache
+
+        Args:
+            message: Mensagem persistida no banco
+        """
+        session_id = self._session_by_conversation.get(message.conversation_id)
+        entry = self._entries.get(session_id) if session_id else None
+        if entry is None:
+            return
+
+        if len(entry.messages) == entry.messages.maxlen:
+            entry.complete = False
+        entry.messages.append(message)
+        entry.conversation.message_count += 1
+        entry.expires_at = time.monotonic() + self.ttl_seconds
+
+    def update_summary(
+        self,
+        conversation_id: str,
+        summary: str,
+        summarized_until: datetime,
+        summarized_count: int
+    ) -> None:
+        """Atualizar o resumo da conversa em cache após o sumarizador gravá-lo"""
+        session_id = self._session_by_conversation.get(conversation_id)
+        entry = self._entries.get(session_id) if session_id else None
+        if entry is None:
+            return
+
+        entry.conversation.summary = summary
+        entry.conversation.summarized_until = summarized_until
+        entry.conversation.summarized_count = summarized_count
+
+    def invalidate(self, session_id: str) -> None:
+        """Remover sessão do cache"""
+        self._remove(session_id)
+
+    def invalidate_conversation(self, conversation_id: str) -> None:
+        """Remover do cache a sessão dona da conversa"""
+        session_id = self._session_by_conversation.get(conversation_id)
+        if session_id:
+            self._remove(session_id)
+
+    def _remove(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._session_by_conversation.pop(entry.conversation.id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do cache"""
+        return {
+            "enabled": int(self.enabled),
+            "sessions": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+# Instância única por processo, compartilhada pelos serviços
+session_cache = SessionCache(
+    max_sessions=settings.SESSION_CACHE_MAX_SESSIONS,
+    max_messages=settings.CONVERSATION_HISTORY_LIMIT,
+    ttl_seconds=settings.SESSION_CACHE_TTL
+)
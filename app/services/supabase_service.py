@@ -1,210 +1,397 @@
-import uuid
+import asyncio
+import logging
 from datetime import datetime
-from typing import List, Optional, Dict, Any
-from supabase import create_client, Client
+from typing import List, Optional, Dict, Any, Tuple
+import httpx
 
 from ..config import settings
 from ..models import Conversation, StoredMessage
+from .clients import get_supabase_http
+from .metrics import stage
+from .tracing import span, traced
+from .session_cache import session_cache
+from .write_behind import write_behind_log
+
+
+logger = logging.getLogger(__name__)
 
 
 class SupabaseService:
-    """Serviço para integração com Supabase"""
-    
+    """Serviço assíncrono para integração com Supabase (API REST/PostgREST)"""
+
     def __init__(self):
-        """Inicializar cliente Supabase"""
-        if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
-            raise ValueError("Configurações do Supabase não encontradas")
-            
-        self.client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-    
-    def create_conversation(self, session_id: str) -> Conversation:
-        """
-        Criar nova conversa
-        
+        """Inicializar cliente HTTP compartilhado e limite de concorrência"""
+        self.client: httpx.AsyncClient = get_supabase_http()
+        self._semaphore = asyncio.Semaphore(settings.SUPABASE_MAX_CONCURRENCY)
+        self.cache = session_cache
+
+    async def _request(self, method: str, path: str, **kwargs) -> Any:
+        """
+        Executar requisição no PostgREST respeitando o limite de concorrência
+
+        Args:
+            method: Método HTTP
+            path: Caminho relativo a /rest/v1 (tabela ou rpc)
+            **kwargs: Parâmetros repassados ao httpx
+
+        Returns:
+            Corpo JSON da resposta (ou None se vazio)
+        """
+        with span("supabase.request", method=method, path=path) as current:
+            async with self._semaphore:
+                response = await self.client.request(method, path, **kwargs)
+            if current is not None:
+                current.set_attribute("http.status_code", response.status_code)
+
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    @staticmethod
+    def _to_conversation(data: Dict[str, Any]) -> Conversation:
+        """Converter linha da tabela conversations em Conversation"""
+        return Conversation(
+            id=data["id"],
+            session_id=data["session_id"],
+            created_at=datetime.fromisoformat(data["created_at"]),
+            updated_at=datetime.fromisoformat(data["updated_at"]),
+            message_count=data["message_count"],
+            summary=data.get("summary"),
+            summarized_until=datetime.fromisoformat(data["summarized_until"]) if data.get("summarized_until") else None,
+            summarized_count=data.get("summarized_count") or 0
+        )
+
+    @staticmethod
+    def _with_pending(
+        conversation_id: str,
+        messages: List[StoredMessage],
+        after: Optional[datetime] = None
+    ) -> List[StoredMessage]:
+        """
+        Acrescentar as mensagens ainda no WAL (write-behind) às lidas do banco
+
+        Uma mensagem pode estar nos dois lugares enquanto o lote é confirmado; o ID desfaz a repetição.
+        """
+        stored_ids = {message.id for message in messages}
+        pending = [
+            message for message in write_behind_log.pending_for(conversation_id)
+            if message.id not in stored_ids and (after is None or message.timestamp > after)
+        ]
+        if not pending:
+            return messages
+        return sorted(messages + pending, key=lambda message: message.timestamp)
+
+    @staticmethod
+    def _to_message(data: Dict[str, Any]) -> StoredMessage:
+        """Converter linha da tabela messages em StoredMessage"""
+        return StoredMessage(
+            id=data["id"],
+            conversation_id=data["conversation_id"],
+            content=data["content"],
+            role=data["role"],
+            timestamp=datetime.fromisoformat(data["timestamp"])
+        )
+
+    @traced("supabase.append_chat_turn")
+    async def append_chat_turn(
+        self,
+        session_id: str,
+        messages: List[Dict[str, str]],
+        history_limit: int
+    ) -> Tuple[Conversation, List[StoredMessage]]:
+        """
+        Registrar um turno de chat em uma única chamada ao banco (função append_chat_turn)
+
+        Cria a conversa se necessário, adiciona as mensagens (o contador é mantido
+        por trigger) e retorna o histórico recente. Se a sessão estiver no cache,
+        apenas as mensagens novas são gravadas e o histórico vem da memória.
+        Com WRITE_BEHIND_ENABLED, a função só cria/lê a conversa e as mensagens vão
+        para o WAL, entrando no histórico junto com as que ainda aguardam gravação.
+
         Args:
             session_id: ID da sessão do usuário
-            
+            messages: Mensagens a adicionar ({"role", "content"}), em ordem
+            history_limit: Número máximo de mensagens recentes retornadas
+
         Returns:
-            Conversa criada
+            Conversa atualizada e histórico recente ordenado por timestamp
         """
         try:
-            conversation_data = {
-                "session_id": session_id,
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat(),
-                "message_count": 0
-            }
-            
-            result = self.client.table("conversations").insert(conversation_data).execute()
-            
-            if result.data:
-                data = result.data[0]
-                return Conversation(
-                    id=data["id"],
-                    session_id=data["session_id"],
-                    created_at=datetime.fromisoformat(data["created_at"]),
-                    updated_at=datetime.fromisoformat(data["updated_at"]),
-                    message_count=data["message_count"]
+            entry = self.cache.get(session_id, history_limit)
+            if entry is not None:
+                for message in messages:
+                    await self.save_message(entry.conversation.id, message["content"], message["role"])
+                return entry.conversation, entry.recent(history_limit)
+
+            write_behind = settings.WRITE_BEHIND_ENABLED
+            with stage("conversation_lookup"):
+                data = await self._request(
+                    "POST", "/rpc/append_chat_turn",
+                    json={
+                        "p_session_id": session_id,
+                        "p_messages": [] if write_behind else messages,
+                        "p_history_limit": history_limit
+                    }
                 )
-            
-            raise Exception("Falha ao criar conversa")
-            
+
+            conversation = self._to_conversation(data["conversation"])
+            history = [self._to_message(row) for row in data["history"]]
+
+            if write_behind:
+                merged = self._with_pending(conversation.id, history)
+                conversation.message_count += len(merged) - len(history)
+                for message in messages:
+                    merged.append(await write_behind_log.append(conversation.id, message["content"], message["role"]))
+                    conversation.message_count += 1
+                history = merged[-history_limit:] if history_limit > 0 else []
+
+            self.cache.put(conversation, history, complete=len(history) >= conversation.message_count)
+            return conversation, history
+
         except Exception as e:
-            print(f"Erro ao criar conversa: {str(e)}")
+            logger.error("Erro ao registrar turno: %s", e)
             raise
-    
-    def get_or_create_conversation(self, session_id: str) -> Conversation:
+
+    async def insert_messages(self, rows: List[Dict[str, Any]]) -> None:
         """
-        Obter conversa existente ou criar nova
-        
+        Inserir mensagens em lote com IDs gerados pela aplicação (write-behind)
+
+        Idempotente: linhas com ID já existente são ignoradas, então reenviar
+        um lote após falha ou replay do WAL não duplica mensagens.
+
+        Args:
+            rows: Linhas completas da tabela messages (id, conversation_id, content, role, timestamp)
+        """
+        with stage("message_flush"):
+            await self._request(
+                "POST", "/messages",
+                params={"on_conflict": "id"},
+                json=rows,
+                headers={"Prefer": "resolution=ignore-duplicates,return=minimal"}
+            )
+
+    @traced("supabase.get_conversation")
+    async def get_conversation(self, session_id: str) -> Optional[Conversation]:
+        """
+        Obter a conversa da sessão sem criá-la (leituras: histórico, limpeza, resumo)
+
+        Uma consulta simples em conversations: não toca em updated_at nem trava
+        a linha. A conversa só é criada no caminho de escrita (append_chat_turn).
+
         Args:
             session_id: ID da sessão do usuário
-            
+
         Returns:
-            Conversa existente ou nova
+            Conversa existente ou None se a sessão ainda não tiver conversa
         """
         try:
-            # Tentar buscar conversa existente
-            result = self.client.table("conversations").select("*").eq("session_id", session_id).execute()
-            
-            if result.data:
-                data = result.data[0]
-                return Conversation(
-                    id=data["id"],
-                    session_id=data["session_id"],
-                    created_at=datetime.fromisoformat(data["created_at"]),
-                    updated_at=datetime.fromisoformat(data["updated_at"]),
-                    message_count=data["message_count"]
+            entry = self.cache.get(session_id)
+            if entry is not None:
+                return entry.conversation
+
+            with stage("conversation_lookup"):
+                data = await self._request(
+                    "GET", "/conversations",
+                    params={"select": "*", "session_id": f"eq.{session_id}", "limit": "1"}
                 )
-            
-            # Criar nova conversa se não existir
-            return self.create_conversation(session_id)
-            
+
+            if not data:
+                return None
+
+            conversation = self._to_conversation(data[0])
+            if settings.WRITE_BEHIND_ENABLED:
+                # O contador do banco ainda não inclui as mensagens no WAL
+                conversation.message_count += len(write_behind_log.pending_for(conversation.id))
+            return conversation
+
         except Exception as e:
-            print(f"Erro ao obter/criar conversa: {str(e)}")
+            logger.error("Erro ao obter conversa: %s", e)
             raise
-    
-    def save_message(self, conversation_id: str, content: str, role: str) -> StoredMessage:
+
+    @traced("supabase.save_message")
+    async def save_message(self, conversation_id: str, content: str, role: str) -> StoredMessage:
         """
         Salvar mensagem no banco
-        
+
         Args:
             conversation_id: ID da conversa
             content: Conteúdo da mensagem
             role: Role da mensagem (user/assistant)
-            
+
         Returns:
             Mensagem salva
         """
         try:
+            if settings.WRITE_BEHIND_ENABLED:
+                # Confirmada ao chegar no WAL; o banco recebe no próximo lote
+                message = await write_behind_log.append(conversation_id, content, role)
+                self.cache.append_message(message)
+                return message
+
+            # timestamp fica a cargo do banco, mesmo relógio usado por append_chat_turn
             message_data = {
                 "conversation_id": conversation_id,
                 "content": content,
-                "role": role,
-                "timestamp": datetime.now().isoformat()
+                "role": role
             }
-            
-            result = self.client.table("messages").insert(message_data).execute()
-            
-            if result.data:
-                data = result.data[0]
-                return StoredMessage(
-                    id=data["id"],
-                    conversation_id=data["conversation_id"],
-                    content=data["content"],
-                    role=data["role"],
-                    timestamp=datetime.fromisoformat(data["timestamp"])
+
+            with stage("message_save"):
+                data = await self._request(
+                    "POST", "/messages",
+                    json=message_data,
+                    headers={"Prefer": "return=representation"}
                 )
-            
+
+            if data:
+                message = self._to_message(data[0])
+                self.cache.append_message(message)
+                return message
+
             raise Exception("Falha ao salvar mensagem")
-            
+
         except Exception as e:
-            print(f"Erro ao salvar mensagem: {str(e)}")
+            logger.error("Erro ao salvar mensagem: %s", e)
             raise
-    
-    def get_conversation_messages(self, conversation_id: str) -> List[StoredMessage]:
+
+    @traced("supabase.get_conversation_messages")
+    async def get_conversation_messages(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        after: Optional[datetime] = None
+    ) -> List[StoredMessage]:
         """
-        Obter todas as mensagens de uma conversa
-        
+        Obter mensagens de uma conversa
+
         Args:
             conversation_id: ID da conversa
-            
+            limit: Se informado, retorna apenas as últimas N mensagens
+                (ou as N primeiras posteriores a `after`)
+            after: Se informado, apenas mensagens com timestamp posterior
+
         Returns:
             Lista de mensagens ordenadas por timestamp
         """
         try:
-            result = self.client.table("messages").select("*").eq("conversation_id", conversation_id).order("timestamp").execute()
-            
-            messages = []
-            for data in result.data:
-                message = StoredMessage(
-                    id=data["id"],
-                    conversation_id=data["conversation_id"],
-                    content=data["content"],
-                    role=data["role"],
-                    timestamp=datetime.fromisoformat(data["timestamp"])
-                )
-                messages.append(message)
-            
+            if after is None:
+                entry = self.cache.get_by_conversation(conversation_id, limit)
+                if entry is not None:
+                    return entry.recent(limit)
+
+            params = {
+                "select": "*",
+                "conversation_id": f"eq.{conversation_id}",
+                "order": "timestamp.asc"
+            }
+            if after is not None:
+                params["timestamp"] = f"gt.{after.isoformat()}"
+            newest_first = limit is not None and after is None
+            if newest_first:
+                params["order"] = "timestamp.desc"
+            if limit is not None:
+                params["limit"] = str(limit)
+
+            with stage("history_fetch"):
+                data = await self._request("GET", "/messages", params=params)
+
+            messages = [self._to_message(row) for row in data or []]
+            if newest_first:
+                messages.reverse()
+
+            if settings.WRITE_BEHIND_ENABLED:
+                messages = self._with_pending(conversation_id, messages, after)
+                if limit is not None:
+                    messages = messages[-limit:] if newest_first else messages[:limit]
             return messages
-            
+
         except Exception as e:
-            print(f"Erro ao obter mensagens: {str(e)}")
+            logger.error("Erro ao obter mensagens: %s", e)
             return []
-    
-    def update_conversation_count(self, conversation_id: str, count: int) -> None:
+
+    async def update_conversation_summary(
+        self,
+        conversation: Conversation,
+        summary: str,
+        summarized_until: datetime,
+        summarized_count: int
+    ) -> bool:
         """
-        Atualizar contador de mensagens da conversa
-        
+        Gravar novo resumo da conversa
+
+        A atualização só acontece se o resumo no banco ainda for o que foi lido
+        (summarized_count igual), evitando que dois processos se sobrescrevam.
+
         Args:
-            conversation_id: ID da conversa
-            count: Novo número de mensagens
+            conversation: Conversa com o estado de resumo lido anteriormente
+            summary: Novo resumo
+            summarized_until: Timestamp da última mensagem incorporada
+            summarized_count: Total de mensagens incorporadas
+
+        Returns:
+            True se o resumo foi gravado
         """
         try:
-            self.client.table("conversations").update({
-                "message_count": count,
-                "updated_at": datetime.now().isoformat()
-            }).eq("id", conversation_id).execute()
-            
+            data = await self._request(
+                "PATCH", "/conversations",
+                params={
+                    "id": f"eq.{conversation.id}",
+                    "summarized_count": f"eq.{conversation.summarized_count}"
+                },
+                json={
+                    "summary": summary,
+                    "summarized_until": summarized_until.isoformat(),
+                    "summarized_count": summarized_count
+                },
+                headers={"Prefer": "return=representation"}
+            )
+
+            if not data:
+                return False
+
+            self.cache.update_summary(conversation.id, summary, summarized_until, summarized_count)
+            return True
+
         except Exception as e:
-            print(f"Erro ao atualizar conversa: {str(e)}")
-    
-    def delete_conversation(self, conversation_id: str) -> None:
+            logger.error("Erro ao atualizar resumo: %s", e)
+            return False
+
+    async def delete_conversation(self, conversation_id: str) -> None:
         """
-        Deletar conversa e todas suas mensagens
-        
+        Deletar conversa e todas suas mensagens (ON DELETE CASCADE)
+
         Args:
             conversation_id: ID da conversa
         """
         try:
-            # Deletar mensagens primeiro
-            self.client.table("messages").delete().eq("conversation_id", conversation_id).execute()
-            
-            # Deletar conversa
-            self.client.table("conversations").delete().eq("id", conversation_id).execute()
-            
+            self.cache.invalidate_conversation(conversation_id)
+            write_behind_log.discard_conversation(conversation_id)
+            await self._request("DELETE", "/conversations", params={"id": f"eq.{conversation_id}"})
+
         except Exception as e:
-            print(f"Erro ao deletar conversa: {str(e)}")
+            logger.error("Erro ao deletar conversa: %s", e)
             raise
-    
-    def get_conversation_history_for_openai(self, conversation_id: str) -> List[Dict[str, str]]:
+
+    async def get_conversation_history_for_openai(self, conversation_id: str) -> List[Dict[str, str]]:
         """
         Obter histórico formatado para OpenAI API
-        
+
         Args:
             conversation_id: ID da conversa
-            
+
+        Returns:
+            Lista de mensagens no formato OpenAI
+        """
+        messages = await self.get_conversation_messages(conversation_id)
+        return self.to_openai_format(messages)
+
+    @staticmethod
+    def to_openai_format(messages: List[StoredMessage]) -> List[Dict[str, str]]:
+        """
+        Converter mensagens armazenadas para o formato da OpenAI API
+
+        Args:
+            messages: Mensagens ordenadas por timestamp
+
         Returns:
             Lista de mensagens no formato OpenAI
         """
-        messages = self.get_conversation_messages(conversation_id)
-        
-        # Converter para formato OpenAI
-        openai_messages = []
-        for message in messages:
-            openai_messages.append({
-                "role": message.role,
-                "content": message.content
-            })
-        
-        return openai_messages 
\ No newline at end of file
+        return [{"role": message.role, "content": message.content} for message in messages]
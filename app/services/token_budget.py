@@ -0,0 +1,123 @@
+"""
+Orçamento de tokens do prompt
+Contagem de tokens com cache por mensagem e recorte do histórico para caber no contexto
+"""
+
+import logging
+from functools import lru_cache
+from typing import Dict, List
+import tiktoken
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+# Tokens extras que a API cobra por mensagem (role + separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Abaixo disso não vale a pena manter um trecho cortado de mensagem antiga
+MIN_TRIMMED_TOKENS = 32
+
+_encoding = None
+
+
+def _get_encoding():
+    """
+    Carrega o tokenizer do modelo uma única vez (None se indisponível)
+
+    A primeira carga pode baixar o arquivo BPE: na aplicação ela acontece no
+    startup, pelo pool de threads (ver load_encoding).
+    """
+    global _encoding
+
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+        except Exception as e:
+            logger.warning("Tokenizer indisponível, usando estimativa: %s", e)
+            _encoding = False
+
+    return _encoding or None
+
+
+def load_encoding() -> bool:
+    """
+    Carregar o tokenizer antes da primeira requisição (chamar fora do event loop)
+
+    Returns:
+        True se o tokenizer está disponível (senão a contagem é estimada)
+    """
+    return _get_encoding() is not None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """
+    Conta os tokens de um texto (resultado em cache por conteúdo)
+
+    Args:
+        text: Texto a contar
+
+    Returns:
+        Número de tokens (estimado em ~4 caracteres/token sem tokenizer)
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Conta os tokens de uma lista de mensagens no formato OpenAI"""
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def _trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Mantém apenas os últimos max_tokens tokens do texto"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[-max_tokens * 4:]
+    return encoding.decode(encoding.encode(text)[-max_tokens:])
+
+
+def fit_history(history: List[Dict[str, str]], budget: int) -> List[Dict[str, str]]:
+    """
+    Recorta o histórico para caber no orçamento de tokens
+
+    A última mensagem (a do usuário no turno atual) é sempre mantida inteira,
+    mesmo que sozinha passe do orçamento. As anteriores são percorridas da mais
+    recente para a mais antiga: as que não cabem são descartadas, e a primeira
+    que não cabe inteira é cortada (mantendo o final) se sobrar espaço útil.
+
+    Args:
+        history: Mensagens em ordem cronológica
+        budget: Tokens disponíveis para o histórico
+
+    Returns:
+        Histórico recortado, em ordem cronológica
+    """
+    if not history:
+        return []
+
+    newest = history[-1]
+    fitted = [newest]
+    remaining = budget - count_tokens(newest["content"]) - MESSAGE_OVERHEAD_TOKENS
+
+    for message in reversed(history[:-1]):
+        cost = count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+        if cost <= remaining:
+            fitted.append(message)
+            remaining -= cost
+            continue
+
+        available = remaining - MESSAGE_OVERHEAD_TOKENS
+        if available >= MIN_TRIMMED_TOKENS:
+            fitted.append({
+                "role": message["role"],
+                "content": _trim_to_tokens(message["content"], available)
+            })
+        break
+
+    fitted.reverse()
+    return fitted
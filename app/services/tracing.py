@@ -0,0 +1,322 @@
+"""
+Tracing por requisição
+Spans aninhados via contextvars, exportados em lote por uma thread para um arquivo JSONL (campos no estilo OTLP)
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+# IDs aceitos do cliente no header X-Trace-ID (mesmo formato gerado aqui)
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Trace:
+    """Spans de uma requisição (ou de uma task que a continua), guardados até o span raiz terminar"""
+
+    __slots__ = ("trace_id", "sampled", "spans", "root", "finished", "kept")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+        self.root: Optional["Span"] = None
+        self.finished = False
+        self.kept = False
+
+
+class Span:
+    """Trecho medido de uma requisição"""
+
+    __slots__ = ("trace", "span_id", "parent", "name", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attributes: Optional[Dict[str, Any]]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.name = name
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        """Duração em segundos (0 enquanto aberto)"""
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"}
+        }
+
+
+# Span aberto no contexto atual (cada task do asyncio herda uma cópia)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+# ID do trace, mesmo quando a requisição não é registrada (usado nos logs e no header)
+_current_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_trace_id", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    """ID do trace da requisição em andamento (None fora de uma requisição)"""
+    return _current_trace_id.get()
+
+
+def current_span() -> Optional[Span]:
+    """Span aberto no contexto atual (None fora de um trace registrado)"""
+    return _current_span.get()
+
+
+def new_trace_id(candidate: Optional[str] = None) -> str:
+    """ID recebido do cliente, se válido, ou um novo"""
+    if candidate and _TRACE_ID.match(candidate):
+        return candidate
+    return uuid.uuid4().hex
+
+
+def start_trace(
+    name: str,
+    trace_id: Optional[str] = None,
+    attributes: Optional[Dict[str, Any]] = None,
+    parent: Optional[Span] = None
+) -> Optional[Span]:
+    """
+    Iniciar um trace no contexto atual e abrir o span raiz
+
+    Com TRACING_ENABLED desligado, só o ID é definido (para o header e os logs).
+    Com parent, o contexto continua o trace de outra task (ex.: job criado por uma
+    requisição): mesmo trace_id e amostragem, com o span raiz filho de parent. Os
+    spans desta task são exportados juntos quando o raiz dela termina.
+
+    Args:
+        name: Nome do span raiz
+        trace_id: ID a usar (ex.: recebido do cliente); gerado se ausente
+        attributes: Atributos do span raiz
+        parent: Span de origem em outro contexto (ver current_span)
+
+    Returns:
+        Span raiz (encerrar com end_span) ou None se o tracing estiver desligado
+    """
+    trace_id = trace_id or uuid.uuid4().hex
+    _current_trace_id.set(trace_id)
+    if not settings.TRACING_ENABLED:
+        return None
+
+    if parent is not None:
+        trace = Trace(parent.trace.trace_id, sampled=parent.trace.sampled)
+    else:
+        trace = Trace(trace_id, sampled=random.random() < settings.TRACE_SAMPLE_RATE)
+    root = trace.root = Span(trace, name, parent, attributes)
+    _current_span.set(root)
+    return root
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None) -> Optional[Span]:
+    """Abrir um span filho do atual (None fora de um trace)"""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    child = Span(parent.trace, name, parent, attributes)
+    _current_span.set(child)
+    return child
+
+
+def end_span(closing: Optional[Span], error: Optional[BaseException] = None) -> None:
+    """
+    Encerrar um span e devolver o contexto ao pai
+
+    O pai só é restaurado se este span ainda for o atual: um gerador assíncrono
+    pode terminar em outra task (ex.: o StreamingResponse), com outro contexto.
+    """
+    if closing is None:
+        return
+
+    closing.end_ns = time.time_ns()
+    if isinstance(error, Exception):
+        closing.error = f"{type(error).__name__}: {error}"
+    if _current_span.get() is closing:
+        # O raiz de uma task que continua outro trace não devolve o contexto ao span de origem
+        _current_span.set(None if closing is closing.trace.root else closing.parent)
+
+    trace = closing.trace
+    if trace.finished:
+        # Span de uma task que sobreviveu à requisição: segue o destino do trace
+        if trace.kept:
+            span_exporter.export([closing])
+        return
+
+    trace.spans.append(closing)
+    if closing is trace.root:
+        trace.finished = True
+        # Amostrados ou lentos: requisições lentas são sempre registradas
+        trace.kept = trace.sampled or closing.duration >= settings.TRACE_SLOW_THRESHOLD
+        if trace.kept:
+            span_exporter.export(trace.spans)
+        trace.spans = []
+
+
+class _SpanContext:
+    __slots__ = ("name", "attributes", "_span")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self._span: Optional[Span] = None
+
+    def __enter__(self) -> Optional[Span]:
+        self._span = start_span(self.name, self.attributes)
+        return self._span
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        end_span(self._span, exc)
+        return False
+
+
+def span(name: str, **attributes: Any) -> _SpanContext:
+    """
+    Span como context manager: `with span("supabase.request", method="GET"): ...`
+
+    Vale também em código async. Fora de um trace (ou com o tracing desligado) não faz nada.
+    """
+    return _SpanContext(name, attributes)
+
+
+def traced(name: str) -> Callable:
+    """Decorator para coroutines: cada chamada vira um span com o nome dado"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SpanExporter:
+    """
+    Grava spans em JSONL a partir de uma thread própria, em lotes
+
+    O event loop só coloca os spans em uma fila limitada; se ela encher, os
+    spans são descartados (contados em `dropped`) em vez de segurar a requisição.
+    Cada processo escreve em spans-<pid>.jsonl; acima de TRACE_EXPORT_MAX_BYTES
+    o arquivo vira spans-<pid>.jsonl.1 e recomeça.
+    """
+
+    def __init__(self, directory: str, batch_size: int, interval: float, max_bytes: int, max_queue: int):
+        self.directory = directory
+        self.path = ""
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_bytes = max_bytes
+
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+
+        self.exported = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Iniciar a thread de exportação (chamado no startup da aplicação)"""
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"spans-{os.getpid()}.jsonl")
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Gravar o que está na fila e encerrar a thread"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def export(self, spans: List[Span]) -> None:
+        """Enfileirar spans encerrados (não bloqueia)"""
+        if self._thread is None:
+            return
+        for item in spans:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+
+    def _write(self, batch: List[Span]) -> None:
+        data = "".join(json.dumps(item.to_dict(), default=str) + "\n" for item in batch)
+        try:
+            if os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+        except FileNotFoundError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+        self.exported += len(batch)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    logger.error("Erro ao exportar spans: %s", e)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores da exportação"""
+        return {
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped
+        }
+
+
+# Instância única por processo
+span_exporter = SpanExporter(
+    directory=settings.TRACE_EXPORT_DIR,
+    batch_size=settings.TRACE_EXPORT_BATCH_SIZE,
+    interval=settings.TRACE_EXPORT_INTERVAL,
+    max_bytes=settings.TRACE_EXPORT_MAX_BYTES,
+    max_queue=settings.TRACE_EXPORT_QUEUE_SIZE
+)
@@ -0,0 +1,271 @@
+"""
+Cache em disco de áudios sintetizados
+Endereçado pelo conteúdo (texto, voz, modelo) e limitado pelo total de bytes (LRU)
+Áudios fixados (textos pré-sintetizados) ficam fora do LRU e não são despejados
+
+O diretório pode ser compartilhado entre workers: o limite vale para o diretório inteiro
+e a fixação fica em disco (marcador <chave>.pin), respeitada pelo despejo de todos eles.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from ..config import settings
+
+
+# Temporários mais novos que isso podem ser uma escrita em andamento em outro worker
+TEMP_GRACE_SECONDS = 300
+
+# Marcador de áudio fixado, ao lado do MP3
+PIN_SUFFIX = ".pin"
+
+# Intervalo máximo entre releituras do diretório, para enxergar o que os outros workers gravaram
+RESCAN_SECONDS = 30
+
+
+class TTSCache:
+    """Cache de MP3 por hash de (texto, voice_id, modelo), com despejo LRU por bytes"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Inicializar cache e reconstruir o índice a partir dos arquivos existentes
+
+        O índice é relido do diretório quando o total conhecido passa do limite
+        ou a cada RESCAN_SECONDS: entram os arquivos que outros workers gravaram.
+
+        Args:
+            directory: Diretório dos arquivos em cache
+            max_bytes: Limite total em bytes do diretório (áudios fixados não contam)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # chave -> tamanho, do menos ao mais recente
+        self._total_bytes = 0
+        self._pinned: Dict[str, int] = {}  # chave -> tamanho, fora do LRU e do limite de bytes (marcador em disco)
+        self._pinned_bytes = 0
+        self._scanned_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+        self._evict()
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, model: str) -> str:
+        """Chave do áudio: SHA-256 do texto, voz e modelo"""
+        payload = "\x00".join([voice_id, model, text]).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _pin_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{PIN_SUFFIX}")
+
+    def _is_pinned(self, key: str) -> bool:
+        """Fixado neste processo ou por outro worker (marcador em disco)"""
+        return key in self._pinned or os.path.exists(self._pin_path(key))
+
+    def _scan(self) -> None:
+        """Índice a partir do diretório inteiro, ordenado pelo último acesso (mtime) dos arquivos"""
+        files = []
+        pinned = set()
+        cutoff = time.time() - TEMP_GRACE_SECONDS
+        for name in os.listdir(self.directory):
+            if name.endswith(PIN_SUFFIX):
+                pinned.add(name[:-len(PIN_SUFFIX)])
+                continue
+            if name.endswith(".tmp"):
+                # Escrita interrompida antes do os.replace; as recentes podem ser de outro worker
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not name.endswith(".mp3"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, name[:-len(".mp3")], stat.st_size))
+
+        # Empate de mtime (resolução grossa do sistema de arquivos): vale a ordem já conhecida
+        order = {key: position for position, key in enumerate(self._index)}
+        files.sort(key=lambda file: (file[0], order.get(file[1], -1)))
+
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._pinned = {}
+        self._pinned_bytes = 0
+        for _, key, size in files:
+            if key in pinned:
+                self._pinned[key] = size
+                self._pinned_bytes += size
+            else:
+                self._index[key] = size
+                self._total_bytes += size
+        self._scanned_at = time.monotonic()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Obter áudio em cache
+
+        Args:
+            key: Chave gerada por make_key
+
+        Returns:
+            Bytes do MP3 ou None
+        """
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            elif key not in self._pinned and not self._adopt(key):
+                self.misses += 1
+                return None
+
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))  # mtime = último acesso, preserva a ordem LRU após reinício
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def _adopt(self, key: str) -> bool:
+        """Incorporar ao índice um arquivo gravado por outro worker no mesmo diretório"""
+        try:
+            size = os.stat(self._path(key)).st_size
+        except FileNotFoundError:
+            return False
+        if os.path.exists(self._pin_path(key)):
+            self._pinned[key] = size
+            self._pinned_bytes += size
+        else:
+            self._index[key] = size
+            self._total_bytes += size
+        return True
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Guardar áudio no cache (escrita atômica)
+
+        Args:
+            key: Chave gerada por make_key
+            data: Bytes do MP3
+        """
+        if len(data) > self.max_bytes:
+            return
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        with self._lock:
+            if self._is_pinned(key):
+                self._pinned_bytes += len(data) - self._pinned.get(key, 0)
+                self._pinned[key] = len(data)
+                return
+            self._forget(key)
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes or time.monotonic() - self._scanned_at > RESCAN_SECONDS:
+                # Relê o diretório: o despejo considera também o que os outros workers gravaram
+                self._scan()
+                self._evict()
+
+    def pin(self, key: str) -> bool:
+        """
+        Fixar um áudio já em cache: sai do LRU e não é mais despejado
+
+        Usado para os textos pré-sintetizados, que são poucos e repetem sempre;
+        o limite de bytes passa a valer só para os áudios dinâmicos. O marcador
+        em disco é criado antes de conferir o arquivo, para que nenhum worker
+        o despeje entre a conferência e a fixação.
+
+        Args:
+            key: Chave gerada por make_key
+
+        Returns:
+            True se o áudio está em cache e ficou fixado
+        """
+        with self._lock:
+            if key in self._pinned:
+                return True
+            with open(self._pin_path(key), "a"):
+                pass
+            if key not in self._index and not self._adopt(key):
+                os.unlink(self._pin_path(key))
+                return False
+            if key in self._index:
+                size = self._index.pop(key)
+                self._total_bytes -= size
+                self._pinned[key] = size
+                self._pinned_bytes += size
+            return True
+
+    def _forget(self, key: str) -> None:
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+        size = self._pinned.pop(key, None)
+        if size is not None:
+            self._pinned_bytes -= size
+
+    def _evict(self) -> None:
+        """Remove os menos usados até caber no limite de bytes"""
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = next(iter(self._index.items()))
+            if os.path.exists(self._pin_path(key)):
+                # Fixado por outro worker depois da última leitura do diretório
+                del self._index[key]
+                self._total_bytes -= size
+                self._pinned[key] = size
+                self._pinned_bytes += size
+                continue
+            self._forget(key)
+            self.evictions += 1
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do cache"""
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "pinned_entries": len(self._pinned),
+                "pinned_bytes": self._pinned_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+# Instância única por processo; o diretório e o limite são compartilhados entre os workers
+tts_cache = TTSCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES)
@@ -0,0 +1,349 @@
+"""
+Jobs assíncronos de mensagens de voz
+Fila limitada e workers no processo; o estado de cada job é gravado em JSON no diretório compartilhado
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, BinaryIO, Dict, List, Optional
+from fastapi import HTTPException
+from ..config import settings
+from .concurrency import run_blocking
+from .tracing import current_span, current_trace_id, end_span, start_trace
+
+
+logger = logging.getLogger(__name__)
+
+
+# Status do job
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Etapas concluídas, em ordem
+TRANSCRIBED = "transcribed"
+ANSWERED = "answered"
+SYNTHESIZED = "synthesized"
+
+_JOB_ID_LENGTH = 32  # uuid4().hex
+
+NO_SPEECH_DETAIL = "Não foi possível transcrever o áudio. Tente falar mais alto ou em um ambiente mais silencioso."
+
+
+class VoiceJobQueueFull(HTTPException):
+    """Fila de jobs cheia: o cliente deve tentar de novo mais tarde (503)"""
+
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail="Muitas mensagens de voz em processamento. Tente novamente em instantes.",
+            headers={"Retry-After": "5"}
+        )
+
+
+@dataclass
+class VoiceJob:
+    """Estado de um job de voz (o que o cliente recebe ao consultar)"""
+    job_id: str
+    session_id: str
+    status: str = QUEUED
+    stages: List[str] = field(default_factory=list)
+    version: int = 0  # Incrementado a cada mudança (usado no long-poll)
+    transcribed_text: Optional[str] = None
+    response_text: Optional[str] = None
+    audio_id: Optional[str] = None
+    audio_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    expires_at: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class VoiceJobQueue:
+    """Fila limitada de jobs de voz processada por um conjunto fixo de workers"""
+
+    def __init__(self, directory: str, max_queue: int, workers: int, ttl_seconds: float):
+        """
+        Args:
+            directory: Diretório compartilhado com o estado dos jobs
+            max_queue: Jobs aguardando além dos que estão em execução
+            workers: Jobs processados em paralelo por processo
+            ttl_seconds: Tempo de vida de um job depois de criado
+        """
+        self.directory = directory
+        self.workers = workers
+        self.ttl_seconds = ttl_seconds
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, VoiceJob] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._openai_service = None
+        self._audio_service = None
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def start(self, openai_service, audio_service) -> None:
+        """Iniciar workers e limpeza (chamado no startup da aplicação)"""
+        if self._tasks:
+            return
+        self._openai_service = openai_service
+        self._audio_service = audio_service
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reap_forever()))
+
+    async def stop(self) -> None:
+        """Encerrar workers; jobs não concluídos expiram pelo TTL"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _persist(self, job: VoiceJob) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(job.to_dict()).encode("utf-8"))
+            os.replace(temp_path, self._path(job.job_id))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _remove(self, job_id: str) -> None:
+        try:
+            os.unlink(self._path(job_id))
+        except FileNotFoundError:
+            pass
+
+    async def _update(self, job: VoiceJob, **changes: Any) -> None:
+        """Aplicar mudanças, gravar o estado e acordar quem espera no long-poll"""
+        for name, value in changes.items():
+            setattr(job, name, value)
+        job.version += 1
+        try:
+            await run_blocking(self._persist, job)
+        except Exception as e:
+            logger.error("Erro ao gravar job de voz %s: %s", job.job_id, e)
+
+        event = self._changed.pop(job.job_id, None)
+        if event is not None:
+            event.set()
+
+    async def submit(self, audio_file: BinaryIO, filename: str, session_id: str) -> VoiceJob:
+        """
+        Enfileirar uma mensagem de voz
+
+        O upload é copiado para um arquivo do job (em memória até UPLOAD_SPOOL_THRESHOLD),
+        já que o arquivo da requisição é fechado quando a resposta 202 sai. O estado QUEUED
+        é gravado antes de o job entrar na fila, para não sobrescrever o RUNNING de um worker.
+
+        Args:
+            audio_file: Arquivo enviado (já validado)
+            filename: Nome do arquivo enviado
+            session_id: ID da sessão do usuário
+
+        Returns:
+            Job criado
+
+        Raises:
+            VoiceJobQueueFull: Fila no limite
+        """
+        if self._queue.full():
+            self.rejected += 1
+            raise VoiceJobQueueFull()
+
+        job_file = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_THRESHOLD)
+        audio_file.seek(0)
+        await run_blocking(shutil.copyfileobj, audio_file, job_file, 64 * 1024)
+        job_file.seek(0)
+
+        job = VoiceJob(
+            job_id=uuid.uuid4().hex,
+            session_id=session_id,
+            expires_at=time.time() + self.ttl_seconds
+        )
+        self._jobs[job.job_id] = job
+        await self._update(job)
+        try:
+            # O job continua o trace da requisição que o criou (mesmo X-Trace-ID, filho do span dela)
+            self._queue.put_nowait((job, job_file, filename, current_trace_id(), current_span()))
+        except asyncio.QueueFull:
+            del self._jobs[job.job_id]
+            await run_blocking(self._remove, job.job_id)
+            job_file.close()
+            self.rejected += 1
+            raise VoiceJobQueueFull()
+
+        return job
+
+    def _load(self, job_id: str) -> Optional[VoiceJob]:
+        try:
+            with open(self._path(job_id), "rb") as f:
+                return VoiceJob(**json.loads(f.read()))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    async def get(self, job_id: str) -> Optional[VoiceJob]:
+        """
+        Obter job deste worker ou, pelo diretório compartilhado, de outro
+
+        Returns:
+            Job ou None (inexistente ou expirado)
+        """
+        if len(job_id) != _JOB_ID_LENGTH or not job_id.isalnum():
+            return None
+
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await run_blocking(self._load, job_id)
+        if job is None or job.expires_at <= time.time():
+            return None
+        return job
+
+    async def wait(self, job_id: str, since: Optional[int], timeout: float) -> Optional[VoiceJob]:
+        """
+        Long-poll: aguardar até o job passar da versão `since`, terminar ou o tempo acabar
+
+        Args:
+            job_id: ID do job
+            since: Última versão que o cliente já viu (None = a versão atual)
+            timeout: Espera máxima em segundos
+
+        Returns:
+            Estado atual do job ou None se não existir
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            if job is not None and since is None:
+                since = job.version
+            remaining = deadline - time.monotonic()
+            if job is None or job.version > since or job.finished or remaining <= 0:
+                return job
+
+            if job_id in self._jobs:
+                # Job deste processo: acordado a cada mudança
+                event = self._changed.setdefault(job_id, asyncio.Event())
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Job de outro worker: relê o arquivo de tempos em tempos
+                await asyncio.sleep(min(0.5, remaining))
+
+    async def _worker(self) -> None:
+        while True:
+            job, job_file, filename, trace_id, parent = await self._queue.get()
+            root = start_trace("voice_job", trace_id, {"job_id": job.job_id}, parent=parent)
+            error = None
+            try:
+                await self._run(job, job_file, filename)
+            except Exception as e:
+                error = e
+                logger.error("Erro no job de voz %s: %s", job.job_id, e)
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                await self._update(job, status=FAILED, error=detail)
+                self.failed += 1
+            finally:
+                end_span(root, error)
+                job_file.close()
+                self._queue.task_done()
+
+    async def _run(self, job: VoiceJob, job_file: BinaryIO, filename: str) -> None:
+        """Transcrição -> resposta -> síntese, registrando cada etapa"""
+        await self._update(job, status=RUNNING)
+
+        transcribed_text = await self._audio_service.transcribe_audio(job_file, filename)
+        if not transcribed_text or not transcribed_text.strip():
+            await self._update(job, status=FAILED, error=NO_SPEECH_DETAIL)
+            self.failed += 1
+            return
+        await self._update(job, stages=job.stages + [TRANSCRIBED], transcribed_text=transcribed_text)
+
+        response_text = await self._openai_service.get_response(transcribed_text, job.session_id)
+        await self._update(job, stages=job.stages + [ANSWERED], response_text=response_text)
+
+        response_audio = await self._audio_service.text_to_speech(response_text)
+        audio_id = str(uuid.uuid4())
+        await self._audio_service.save_audio_file(response_audio, audio_id, response_text)
+        await self._update(
+            job,
+            status=COMPLETED,
+            stages=job.stages + [SYNTHESIZED],
+            audio_id=audio_id,
+            audio_url=f"/chat/audio/download/{audio_id}"
+        )
+        self.completed += 1
+
+    def purge_expired(self) -> int:
+        """Remover jobs expirados da memória e do diretório compartilhado"""
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.expires_at <= now]:
+            del self._jobs[job_id]
+
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".json"):
+                    job = self._load(name[:-len(".json")])
+                    expired = job is None or job.expires_at <= now
+                else:
+                    # Temporário de uma escrita interrompida
+                    expired = os.stat(path).st_mtime <= now - self.ttl_seconds
+                if expired:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(settings.AUDIO_STORE_REAP_INTERVAL)
+            try:
+                await run_blocking(self.purge_expired)
+            except Exception as e:
+                logger.error("Erro na limpeza de jobs de voz: %s", e)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores da fila (jobs deste processo)"""
+        return {
+            "queued": self._queue.qsize(),
+            "running": sum(1 for job in self._jobs.values() if job.status == RUNNING),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+
+
+# Instância única por processo
+voice_jobs = VoiceJobQueue(
+    directory=settings.VOICE_JOB_DIR,
+    max_queue=settings.VOICE_JOB_QUEUE_SIZE,
+    workers=settings.VOICE_JOB_WORKERS,
+    ttl_seconds=settings.VOICE_JOB_TTL
+)
@@ -0,0 +1,388 @@
+"""
+Persistência write-behind das mensagens
+Cada mensagem vai para um WAL local (fsync) e é confirmada na hora; uma task grava em lote no Supabase
+"""
+
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import httpx
+from ..config import settings
+from ..models import StoredMessage
+from .concurrency import run_blocking
+
+
+logger = logging.getLogger(__name__)
+
+
+# Espera entre tentativas quando o Supabase falha (dobra a cada falha até o máximo)
+RETRY_INITIAL_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+# Recusas do banco que dizem respeito às linhas (dados inválidos, FK, conflito):
+# só com elas uma mensagem é descartada. Outros 4xx (credencial, rate limit,
+# timeout) e 5xx são do serviço e levam a nova tentativa.
+ROW_REJECTION_STATUSES = frozenset({400, 409, 422})
+
+
+class WriteBehindLog:
+    """
+    WAL por processo + fila de mensagens pendentes em memória
+
+    Cada processo escreve no próprio wal-<pid>.jsonl e mantém um flock em wal-<pid>.lock
+    enquanto vive. No startup, WALs cujo lock está livre (processo encerrado) são
+    assumidos: as mensagens voltam para a fila e são gravadas normalmente.
+    """
+
+    def __init__(self, directory: str, batch_size: int, flush_interval: float, compact_bytes: int):
+        """
+        Args:
+            directory: Diretório dos WALs (deve sobreviver a reinícios)
+            batch_size: Mensagens por inserção em lote
+            flush_interval: Segundos entre gravações quando a fila não enche um lote
+            compact_bytes: Tamanho do WAL a partir do qual ele é reescrito só com as pendentes
+        """
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_bytes = compact_bytes
+
+        self._pending: "OrderedDict[str, StoredMessage]" = OrderedDict()
+        self._file_lock = threading.Lock()
+        self._wal_path: Optional[str] = None
+        self._wal_file = None
+        self._wal_bytes = 0  # Tamanho do WAL após a última escrita (atualizado sob _file_lock)
+        self._lock_file = None
+        self._last_timestamp = datetime.min.replace(tzinfo=timezone.utc)
+
+        self._insert: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+        self._batch_ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.flushed = 0
+        self.failures = 0
+        self.dropped = 0
+        self.replayed = 0
+        self.compactions = 0
+
+    # --- WAL em disco (sempre chamado no pool de threads) ---
+
+    @staticmethod
+    def _read_entries(path: str) -> List[Dict[str, Any]]:
+        entries = []
+        try:
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        pass  # Última linha cortada por uma queda no meio da escrita
+        except FileNotFoundError:
+            pass
+        return entries
+
+    @staticmethod
+    def _encode(entries: List[Dict[str, Any]]) -> bytes:
+        return b"".join(json.dumps(entry).encode("utf-8") + b"\n" for entry in entries)
+
+    def _write_atomic(self, path: str, entries: List[Dict[str, Any]]) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._encode(entries))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _recover(self) -> List[Dict[str, Any]]:
+        """
+        Abrir o WAL deste processo e assumir os de processos encerrados
+
+        O próprio WAL pode já ter conteúdo (PIDs se repetem quando o container reinicia).
+        Tudo que for recuperado é reescrito no WAL deste processo antes de os arquivos
+        órfãos serem apagados.
+
+        Returns:
+            Entradas recuperadas, sem repetição de ID
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"wal-{os.getpid()}")
+        self._lock_file = open(f"{base}.lock", "w")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._wal_path = f"{base}.jsonl"
+
+        recovered = {entry["id"]: entry for entry in self._read_entries(self._wal_path)}
+        claimed = []
+        for lock_path in glob.glob(os.path.join(self.directory, "wal-*.lock")):
+            if lock_path == self._lock_file.name:
+                continue
+            lock_file = open(lock_path, "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue  # Processo vivo
+            wal_path = lock_path[:-len(".lock")] + ".jsonl"
+            for entry in self._read_entries(wal_path):
+                recovered.setdefault(entry["id"], entry)
+            claimed.append((lock_file, lock_path, wal_path))
+
+        entries = list(recovered.values())
+        self._write_atomic(self._wal_path, entries)
+        self._wal_file = open(self._wal_path, "ab")
+        self._wal_bytes = self._wal_file.tell()
+
+        for lock_file, lock_path, wal_path in claimed:
+            for path in (wal_path, lock_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            lock_file.close()
+        return entries
+
+    def _write_entries(self, entries: List[Dict[str, Any]]) -> None:
+        with self._file_lock:
+            self._wal_file.write(self._encode(entries))
+            self._wal_file.flush()
+            os.fsync(self._wal_file.fileno())
+            self._wal_bytes = self._wal_file.tell()
+
+    def _compact(self, entries: List[Dict[str, Any]], wal_bytes: int) -> bool:
+        """
+        Reescrever o WAL só com as mensagens ainda pendentes, a partir de compact_bytes
+
+        `entries` e `wal_bytes` são lidos juntos no event loop. Se o WAL cresceu
+        desde então, uma mensagem foi escrita depois do retrato e não está em
+        `entries`: a compactação fica para a próxima gravação. Linhas já gravadas
+        no banco que sobram no WAL só custam um replay idempotente.
+
+        Returns:
+            True se o WAL foi reescrito
+        """
+        with self._file_lock:
+            if self._wal_bytes < self.compact_bytes or self._wal_bytes != wal_bytes:
+                return False
+
+            if entries:
+                self._write_atomic(self._wal_path, entries)
+                self._wal_file.close()
+                self._wal_file = open(self._wal_path, "ab")
+            else:
+                self._wal_file.truncate(0)
+                self._wal_file.seek(0)
+                os.fsync(self._wal_file.fileno())
+            self._wal_bytes = self._wal_file.tell()
+            return True
+
+    # --- Fila em memória ---
+
+    @staticmethod
+    def _to_entry(message: StoredMessage) -> Dict[str, Any]:
+        return {
+            "id": message.id,
+            "conversation_id": message.conversation_id,
+            "content": message.content,
+            "role": message.role,
+            "timestamp": message.timestamp.isoformat()
+        }
+
+    @staticmethod
+    def _to_message(entry: Dict[str, Any]) -> StoredMessage:
+        return StoredMessage(
+            id=entry["id"],
+            conversation_id=entry["conversation_id"],
+            content=entry["content"],
+            role=entry["role"],
+            timestamp=datetime.fromisoformat(entry["timestamp"])
+        )
+
+    def _next_timestamp(self) -> datetime:
+        """Relógio do processo, estritamente crescente (mensagens do mesmo turno mantêm a ordem)"""
+        now = datetime.now(timezone.utc)
+        if now <= self._last_timestamp:
+            now = self._last_timestamp + timedelta(microseconds=1)
+        self._last_timestamp = now
+        return now
+
+    async def append(self, conversation_id: str, content: str, role: str) -> StoredMessage:
+        """
+        Registrar mensagem no WAL (durável ao retornar) e enfileirá-la para o banco
+
+        Args:
+            conversation_id: ID da conversa (já existente no banco)
+            content: Conteúdo da mensagem
+            role: Role da mensagem (user/assistant)
+
+        Returns:
+            Mensagem com ID e timestamp gerados aqui
+        """
+        message = StoredMessage(
+            id=str(uuid.uuid4()),
+            conversation_id=conversation_id,
+            content=content,
+            role=role,
+            timestamp=self._next_timestamp()
+        )
+        # Na fila antes do disco: uma compactação concorrente não descarta a linha
+        self._pending[message.id] = message
+        try:
+            await run_blocking(self._write_entries, [self._to_entry(message)])
+        except Exception:
+            self._pending.pop(message.id, None)
+            raise
+
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+        return message
+
+    def pending_for(self, conversation_id: str) -> List[StoredMessage]:
+        """Mensagens da conversa ainda não gravadas no banco, em ordem"""
+        return [message for message in self._pending.values() if message.conversation_id == conversation_id]
+
+    def discard_conversation(self, conversation_id: str) -> None:
+        """Esquecer as pendentes de uma conversa apagada (a inserção falharia pela FK)"""
+        for message in self.pending_for(conversation_id):
+            self._pending.pop(message.id, None)
+
+    # --- Gravação em segundo plano ---
+
+    async def start(self, insert: Callable[[List[Dict[str, Any]]], Awaitable[None]]) -> None:
+        """
+        Abrir o WAL, assumir WALs órfãos e iniciar a gravação em lote
+
+        Args:
+            insert: Inserção em lote idempotente (por ID) das linhas na tabela messages
+        """
+        if self._task is not None:
+            return
+
+        self._insert = insert
+        recovered = await run_blocking(self._recover)
+        # Mais antigas primeiro, como foram escritas
+        for entry in sorted(recovered, key=lambda entry: entry["timestamp"]):
+            self._pending[entry["id"]] = self._to_message(entry)
+        self.replayed += len(recovered)
+
+        self._task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self) -> None:
+        """Última tentativa de gravação e encerramento (pendentes ficam no WAL)"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        try:
+            await asyncio.wait_for(self.flush(), timeout=settings.WRITE_BEHIND_SHUTDOWN_TIMEOUT)
+        except Exception as e:
+            logger.warning("Mensagens pendentes ficam no WAL para o próximo startup: %s", e)
+
+    async def flush(self) -> int:
+        """
+        Gravar no banco todas as pendentes, em lotes
+
+        Returns:
+            Quantidade de mensagens gravadas
+        """
+        written = 0
+        while self._pending:
+            batch = list(self._pending.values())[:self.batch_size]
+            inserted = await self._insert_batch(batch)
+            for message in batch:
+                self._pending.pop(message.id, None)
+            written += inserted
+            self.flushed += inserted
+
+        # Retrato da fila e do tamanho do WAL no mesmo instante (sem await entre os dois)
+        remaining = [self._to_entry(message) for message in self._pending.values()]
+        if await run_blocking(self._compact, remaining, self._wal_bytes):
+            self.compactions += 1
+        return written
+
+    async def _insert_batch(self, batch: List[StoredMessage]) -> int:
+        """
+        Inserção em lote
+
+        Se o banco recusar as linhas do lote (400/409/422, ex.: conversa apagada),
+        as mensagens são enviadas uma a uma e só as recusadas individualmente são
+        descartadas. Demais erros HTTP (401/403/408/429, 5xx) e de rede sobem
+        para nova tentativa.
+
+        Returns:
+            Quantidade de mensagens aceitas
+        """
+        try:
+            await self._insert([self._to_entry(message) for message in batch])
+            return len(batch)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in ROW_REJECTION_STATUSES:
+                raise
+            if len(batch) == 1:
+                self.dropped += 1
+                logger.error("Mensagem %s recusada pelo banco e descartada: %s", batch[0].id, e.response.text)
+                return 0
+
+        inserted = 0
+        for message in batch:
+            inserted += await self._insert_batch([message])
+        return inserted
+
+    async def _flush_forever(self) -> None:
+        delay = RETRY_INITIAL_DELAY
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+
+            try:
+                await self.flush()
+                delay = RETRY_INITIAL_DELAY
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Mensagens continuam pendentes (no WAL e na memória); nova tentativa com espera crescente
+                self.failures += 1
+                logger.warning("Erro ao gravar mensagens pendentes: %s", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do write-behind"""
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "replayed": self.replayed,
+            "compactions": self.compactions
+        }
+
+
+# Instância única por processo (usada apenas com WRITE_BEHIND_ENABLED)
+write_behind_log = WriteBehindLog(
+    directory=settings.WRITE_BEHIND_DIR,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+    compact_bytes=settings.WRITE_BEHIND_COMPACT_BYTES
+)
@@ -0,0 +1,213 @@
+"""
+Benchmark do pré-processamento de áudio antes do Whisper
+Mede bytes economizados, duração cortada e o tempo do ffmpeg contra o tempo de upload poupado
+
+Os clipes padrão são sintéticos (WAV 44,1 kHz estéreo com falas separadas por silêncio),
+gerados com a mesma semente a cada execução; gravações reais podem ser passadas em --files.
+Sem ffmpeg no PATH, usa o binário estático do imageio-ffmpeg se estiver instalado
+(pip install imageio-ffmpeg).
+
+Uso:
+    python scripts/bench_audio_preprocess.py
+    python scripts/bench_audio_preprocess.py --repeat 5 --uplink-mbps 2
+    python scripts/bench_audio_preprocess.py --input-format webm
+    python scripts/bench_audio_preprocess.py --files gravacao1.m4a gravacao2.webm
+"""
+
+import argparse
+import asyncio
+import io
+import math
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.audio_preprocessor import AudioPreprocessor, preprocess_stats  # noqa: E402
+
+
+SAMPLE_RATE = 44100
+
+# Codificações dos clipes sintéticos, como os clientes costumam enviar (webm: MediaRecorder)
+INPUT_FORMATS = {
+    "wav": None,
+    "webm": ["-c:a", "libopus", "-b:a", "64k", "-f", "webm"],
+    "m4a": ["-c:a", "aac", "-b:a", "96k", "-movflags", "+frag_keyframe+empty_moov", "-f", "mp4"]
+}
+
+# (nome, [(segundos de fala, segundos de silêncio depois), ...], silêncio inicial)
+CLIPS = [
+    ("pergunta curta", [(3.0, 2.5)], 1.5),
+    ("pausas longas", [(2.0, 3.0), (2.5, 2.0), (3.0, 1.5)], 2.0),
+    ("fala contínua", [(4.0, 0.3), (4.0, 0.3), (4.0, 0.4)], 0.2),
+    ("mensagem longa", [(5.0, 1.2)] * 6, 1.0)
+]
+
+
+def ensure_ffmpeg() -> str:
+    """Caminho do ffmpeg; coloca o do imageio-ffmpeg no PATH se não houver outro"""
+    found = shutil.which("ffmpeg")
+    if found:
+        return found
+
+    try:
+        import imageio_ffmpeg
+    except ImportError:
+        sys.exit("ffmpeg não encontrado: instale-o ou rode `pip install imageio-ffmpeg`")
+
+    # O pré-processador chama "ffmpeg" pelo nome
+    binary = imageio_ffmpeg.get_ffmpeg_exe()
+    bin_dir = tempfile.mkdtemp(prefix="bench-ffmpeg-")
+    os.symlink(binary, os.path.join(bin_dir, "ffmpeg"))
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    return binary
+
+
+def synth_clip(segments: List[Tuple[float, float]], lead_silence: float, seed: int) -> bytes:
+    """WAV estéreo 16 bits: rajadas harmônicas com envelope de sílabas, silêncio com ruído de fundo"""
+    rng = random.Random(seed)
+    samples = array("h")
+
+    def silence(seconds: float) -> None:
+        for _ in range(int(seconds * SAMPLE_RATE)):
+            noise = int(rng.gauss(0, 20))  # ~ -64 dBFS, abaixo do limiar padrão
+            samples.extend((noise, noise))
+
+    def speech(seconds: float) -> None:
+        pitch = rng.uniform(100, 220)
+        syllable = rng.uniform(3.5, 5.5)  # sílabas por segundo
+        for index in range(int(seconds * SAMPLE_RATE)):
+            t = index / SAMPLE_RATE
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * syllable * t) ** 2
+            tone = sum(math.sin(2 * math.pi * pitch * harmonic * t) / harmonic for harmonic in (1, 2, 3, 5))
+            value = int(6000 * envelope * tone + rng.gauss(0, 300))
+            value = max(-32768, min(32767, value))
+            samples.extend((value, value))
+
+    silence(lead_silence)
+    for speech_seconds, pause_seconds in segments:
+        speech(speech_seconds)
+        silence(pause_seconds)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def encode(ffmpeg: str, wav: bytes, input_format: str) -> bytes:
+    """Converter o WAV sintético para o formato de upload escolhido"""
+    options = INPUT_FORMATS[input_format]
+    if options is None:
+        return wav
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", *options, "pipe:1"],
+        input=wav, capture_output=True, check=True
+    )
+    return result.stdout
+
+
+def duration_seconds(ffmpeg: str, data: bytes) -> Optional[float]:
+    """Duração decodificando para PCM mono 16 kHz (o binário estático não traz ffprobe)"""
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-ac", "1", "-ar", "16000", "-f", "s16le", "pipe:1"],
+        input=data, capture_output=True
+    )
+    if result.returncode != 0:
+        return None
+    return len(result.stdout) / (16000 * 2)
+
+
+async def measure(data: bytes, filename: str, repeat: int) -> Tuple[bytes, List[float], bool]:
+    """Roda o pré-processador `repeat` vezes; retorna a saída, os tempos e se houve fallback"""
+    preprocessor = AudioPreprocessor()
+    timings = []
+    output = b""
+    fallback = False
+    for _ in range(repeat):
+        fallbacks_before = preprocess_stats.fallbacks
+        started = time.perf_counter()
+        result, _ = await preprocessor.process(io.BytesIO(data), filename)
+        timings.append(time.perf_counter() - started)
+        output = result.read()
+        result.close()
+        fallback = preprocess_stats.fallbacks > fallbacks_before
+    return output, timings, fallback
+
+
+def load_inputs(ffmpeg: str, files: List[str], input_format: str) -> Dict[str, Tuple[bytes, str]]:
+    if files:
+        inputs = {}
+        for path in files:
+            with open(path, "rb") as f:
+                inputs[os.path.basename(path)] = (f.read(), os.path.basename(path))
+        return inputs
+    return {
+        name: (encode(ffmpeg, synth_clip(segments, lead, seed), input_format), f"clip.{input_format}")
+        for seed, (name, segments, lead) in enumerate(CLIPS)
+    }
+
+
+async def run(args: argparse.Namespace, ffmpeg: str) -> None:
+    uplink = args.uplink_mbps * 1_000_000 / 8  # bytes/s
+
+    print(f"ffmpeg: {ffmpeg}")
+    if not args.files:
+        print(f"clipes sintéticos em {args.input_format}")
+    print(f"uplink simulado: {args.uplink_mbps} Mbit/s, {args.repeat} execuções por clipe (mediana)\n")
+    print(
+        f"{'clipe':<18}{'KB antes':>10}{'KB depois':>11}{'economia':>10}"
+        f"{'s antes':>9}{'s depois':>10}{'ffmpeg ms':>11}{'upload ms':>11}{'saldo ms':>10}"
+    )
+
+    total_in = total_out = 0
+    for name, (data, filename) in load_inputs(ffmpeg, args.files, args.input_format).items():
+        output, timings, fallback = await measure(data, filename, args.repeat)
+        preprocess_ms = statistics.median(timings) * 1000
+        if fallback:
+            print(f"{name:<18}{len(data) / 1024:>10.1f}{'(original mantido: fallback)':>40}{preprocess_ms:>11.0f}")
+            continue
+
+        saved_upload_ms = (len(data) - len(output)) / uplink * 1000
+        before = duration_seconds(ffmpeg, data)
+        after = duration_seconds(ffmpeg, output)
+        total_in += len(data)
+        total_out += len(output)
+        print(
+            f"{name:<18}{len(data) / 1024:>10.1f}{len(output) / 1024:>11.1f}"
+            f"{1 - len(output) / len(data):>9.1%}"
+            f"{before or 0:>9.1f}{after or 0:>10.1f}"
+            f"{preprocess_ms:>11.0f}{saved_upload_ms:>11.0f}{saved_upload_ms - preprocess_ms:>10.0f}"
+        )
+
+    if total_in:
+        print(f"\ntotal: {total_in / 1024:.1f} KB -> {total_out / 1024:.1f} KB ({1 - total_out / total_in:.1%} a menos)")
+    print("saldo = upload poupado - tempo do ffmpeg (positivo: a transcrição começa antes)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por clipe (vale a mediana)")
+    parser.add_argument("--uplink-mbps", type=float, default=5.0, help="Banda de upload até a OpenAI, em Mbit/s")
+    parser.add_argument("--input-format", choices=sorted(INPUT_FORMATS), default="wav", help="Codificação dos clipes sintéticos")
+    parser.add_argument("--files", nargs="*", default=[], help="Gravações reais no lugar dos clipes sintéticos")
+    args = parser.parse_args()
+
+    ffmpeg = ensure_ffmpeg()
+    asyncio.run(run(args, ffmpeg))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Microbenchmark da classificação de intenções
+Compara as quatro varreduras `any(x in msg.lower() ...)` antigas com o KeywordMatcher
+
+Uso:
+    python scripts/bench_intents.py
+    python scripts/bench_intents.py --number 20000 --repeat 7
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.intent_classifier import user_intents  # noqa: E402
+
+
+# Listas e varreduras como estavam em OpenAIService._get_conversation_context
+GREETINGS = ["olá", "oi", "boa tarde", "bom dia", "boa noite", "hello", "hi"]
+FLAT_EARTH_TOPICS = [
+    "terra plana", "terra", "curvatura", "horizonte", "física", "ciência",
+    "astronomia", "geografia", "gravidade", "nasa", "espaço", "planeta",
+    "globo", "esfera", "formato", "universo", "sol", "lua", "estrelas"
+]
+AI_QUESTIONS = ["você é", "é uma ia", "é um robô", "é artificial", "é um bot", "que você é"]
+OFF_TOPIC_INDICATORS = [
+    "mercado", "bolsa", "ações", "investimento", "comida", "receita", "filme",
+    "música", "esporte", "futebol", "política", "eleição", "clima tempo",
+    "shopping", "compra", "vendas", "trabalho", "emprego", "faculdade curso",
+    "relacionamento", "amor", "saúde", "doença", "remédio"
+]
+
+
+def classify_old(user_message: str) -> tuple:
+    is_greeting = any(greeting in user_message.lower() for greeting in GREETINGS)
+    is_flat_earth_topic = any(topic in user_message.lower() for topic in FLAT_EARTH_TOPICS)
+    is_ai_question = any(question in user_message.lower() for question in AI_QUESTIONS)
+    is_off_topic = any(indicator in user_message.lower() for indicator in OFF_TOPIC_INDICATORS)
+    return is_greeting, is_flat_earth_topic, is_ai_question, is_off_topic
+
+
+MESSAGES = {
+    "saudação + IA": "Olá! Você é uma IA?",
+    "pergunta no tema": "Professor, se a Terra é plana, por que os navios somem no horizonte de baixo para cima?",
+    "fora do tema": "Qual a melhor receita de bolo de cenoura para o fim de semana?",
+    "sem intenção": "Entendi, mas ainda não estou convencido disso tudo que foi dito até agora.",
+    "longo, casa no fim": (
+        "Eu estava conversando com um amigo ontem à noite sobre várias coisas que aconteceram "
+        "durante a semana, e ele me disse que tinha lido um artigo bastante interessante, escrito "
+        "por alguém que ele conhecia de longa data, mas que não se lembrava muito bem dos detalhes "
+        "nem do lugar onde tinha encontrado o texto. Depois de muito tempo pensando no assunto e "
+        "discutindo com outras pessoas, chegamos à conclusão de que precisávamos perguntar para "
+        "alguém que realmente entendesse do tema. Então, qual é a sua opinião sobre a curvatura?"
+    )
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="Chamadas por medição")
+    parser.add_argument("--repeat", type=int, default=5, help="Medições por caso (vale a menor)")
+    args = parser.parse_args()
+
+    print(f"{'caso':<22}{'chars':>6}{'antigo (us)':>13}{'novo (us)':>11}{'ganho':>8}")
+    for name, text in MESSAGES.items():
+        old = min(timeit.repeat(lambda: classify_old(text), number=args.number, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: user_intents.classify(text), number=args.number, repeat=args.repeat))
+        old_us = old / args.number * 1e6
+        new_us = new / args.number * 1e6
+        print(f"{name:<22}{len(text):>6}{old_us:>13.2f}{new_us:>11.2f}{old_us / new_us:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Teste de carga do POST /chat/ com OpenAI e Supabase simulados
+Compara a vazão com a chamada ao modelo bloqueando o event loop (como o SDK síncrono fazia) e com o cliente assíncrono
+
+Uso:
+    python scripts/loadtest_chat.py
+    python scripts/loadtest_chat.py --requests 200 --concurrency 100 --llm-latency 0.5 --mode async
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+# Configuração antes de importar a aplicação: credenciais falsas e nada fora do caminho medido
+os.environ.update({
+    "OPENAI_API_KEY": "sk-loadtest",
+    "SUPABASE_URL": "http://supabase.loadtest",
+    "SUPABASE_ANON_KEY": "loadtest",
+    "ELEVENLABS_API_KEY": "loadtest",
+    "CANNED_RESPONSES_ENABLED": "false",
+    "SUMMARY_ENABLED": "false",
+    "TTS_PREWARM_ENABLED": "false",
+    "GPT_CONCURRENCY": "1000",
+    "LOG_LEVEL": "WARNING"
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from app.main import app  # noqa: E402
+from app.routers.chat import openai_service  # noqa: E402
+
+
+REPLY = "A água sempre busca o nível. Como os oceanos ficariam presos numa bola girando?"
+
+
+class FakeCompletions:
+    """chat.completions simulado: latência fixa, bloqueante ou assíncrona"""
+
+    def __init__(self, latency: float, blocking: bool):
+        self.latency = latency
+        self.blocking = blocking
+
+    async def create(self, **kwargs: Any) -> Any:
+        if self.blocking:
+            time.sleep(self.latency)  # SDK síncrono chamado de dentro da coroutine
+        else:
+            await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=REPLY))],
+            usage={"prompt_tokens": 900, "completion_tokens": 40}
+        )
+
+
+def fake_supabase(latency: float) -> httpx.AsyncClient:
+    """Cliente PostgREST simulado: append_chat_turn e inserção de mensagens"""
+    conversations: Dict[str, Dict[str, Any]] = {}
+
+    def row(conversation_id: str, role: str, content: str) -> Dict[str, Any]:
+        return {
+            "id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "role": role,
+            "content": content,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        body = httpx.Response(200, content=request.content).json() if request.content else None
+
+        if request.url.path.endswith("/rpc/append_chat_turn"):
+            session_id = body["p_session_id"]
+            now = datetime.now(timezone.utc).isoformat()
+            conversation = conversations.setdefault(session_id, {
+                "id": str(uuid.uuid4()), "session_id": session_id, "created_at": now,
+                "updated_at": now, "message_count": 0, "summarized_count": 0
+            })
+            history = [row(conversation["id"], m["role"], m["content"]) for m in body["p_messages"]]
+            conversation["message_count"] += len(history)
+            return httpx.Response(200, json={"conversation": conversation, "history": history})
+
+        if request.url.path.endswith("/messages") and request.method == "POST":
+            return httpx.Response(201, json=[row(body["conversation_id"], body["role"], body["content"])])
+
+        return httpx.Response(200, json=[])
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://supabase.loadtest/rest/v1")
+
+
+async def run(mode: str, total: int, concurrency: int, llm_latency: float, db_latency: float) -> Dict[str, Any]:
+    """Disparar `total` mensagens com até `concurrency` em andamento"""
+    openai_service.client = SimpleNamespace(chat=SimpleNamespace(
+        completions=FakeCompletions(llm_latency, blocking=mode == "blocking")
+    ))
+    openai_service.supabase.client = fake_supabase(db_latency)
+
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app", timeout=None) as client:
+        async def one(index: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    "/chat/",
+                    json={"message": f"Por que o horizonte parece reto? ({index})"},
+                    headers={"X-Session-ID": f"loadtest-{mode}-{index}"}
+                )
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200 or response.json().get("message") != REPLY:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(total)))
+        elapsed = time.perf_counter() - started
+
+    await openai_service.supabase.client.aclose()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": total,
+        "errors": errors,
+        "elapsed": elapsed,
+        "throughput": total / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="Mensagens enviadas por modo")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requisições simultâneas")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Segundos por chamada ao modelo")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="Segundos por requisição ao Supabase")
+    parser.add_argument("--mode", choices=("blocking", "async", "both"), default="both",
+                        help="blocking: modelo bloqueia o event loop (antes); async: cliente assíncrono (depois)")
+    args = parser.parse_args()
+
+    modes = ("blocking", "async") if args.mode == "both" else (args.mode,)
+    print(f"{args.requests} requisições, {args.concurrency} simultâneas, modelo {args.llm_latency}s, banco {args.db_latency}s")
+    print(f"{'modo':<10}{'tempo (s)':>11}{'req/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}{'erros':>8}")
+
+    async def run_all() -> None:
+        # Um único event loop: os semáforos dos serviços ficam presos ao loop em que foram usados
+        for mode in modes:
+            result = await run(mode, args.requests, args.concurrency, args.llm_latency, args.db_latency)
+            print(
+                f"{result['mode']:<10}{result['elapsed']:>11.2f}{result['throughput']:>10.1f}"
+                f"{result['p50']:>10.3f}{result['p95']:>10.3f}{result['errors']:>8}"
+            )
+
+    asyncio.run(run_all())
+
+
+if __name__ == "__main__":
+    main()
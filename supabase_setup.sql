@@ -19,10 +19,16 @@ CREATE TABLE IF NOT EXISTS messages (
     timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Resumo incremental das mensagens mais antigas (mantido pelo ConversationSummarizer)
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summarized_until TIMESTAMP WITH TIME ZONE;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summarized_count INTEGER DEFAULT 0;
+
 -- Índices para melhor performance
 CREATE INDEX IF NOT EXISTS idx_conversations_session_id ON conversations(session_id);
 CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id);
 CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_timestamp ON messages(conversation_id, timestamp DESC);
 
 -- Função para atualizar updated_at automaticamente
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -39,6 +45,99 @@ CREATE TRIGGER update_conversations_updated_at
     FOR EACH ROW 
     EXECUTE FUNCTION update_updated_at_column();
 
+-- Contador de mensagens mantido pelo banco (atômico sob requisições concorrentes)
+CREATE OR REPLACE FUNCTION increment_message_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE conversations c
+    SET message_count = c.message_count + n.total
+    FROM (
+        SELECT conversation_id, COUNT(*) AS total
+        FROM inserted_messages
+        GROUP BY conversation_id
+    ) n
+    WHERE c.id = n.conversation_id;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION decrement_message_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE conversations c
+    SET message_count = GREATEST(c.message_count - n.total, 0)
+    FROM (
+        SELECT conversation_id, COUNT(*) AS total
+        FROM deleted_messages
+        GROUP BY conversation_id
+    ) n
+    WHERE c.id = n.conversation_id;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS messages_increment_count ON messages;
+CREATE TRIGGER messages_increment_count
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS inserted_messages
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION increment_message_count();
+
+DROP TRIGGER IF EXISTS messages_decrement_count ON messages;
+CREATE TRIGGER messages_decrement_count
+    AFTER DELETE ON messages
+    REFERENCING OLD TABLE AS deleted_messages
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION decrement_message_count();
+
+-- Corrigir contadores calculados anteriormente pela aplicação
+UPDATE conversations c
+SET message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = c.id);
+
+-- Turno de chat em uma única chamada: cria/obtém a conversa, adiciona as
+-- mensagens e retorna as últimas p_history_limit mensagens em ordem cronológica
+CREATE OR REPLACE FUNCTION append_chat_turn(
+    p_session_id TEXT,
+    p_messages JSONB DEFAULT '[]'::jsonb,
+    p_history_limit INTEGER DEFAULT 50
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_conversation_id UUID;
+    v_conversation JSONB;
+    v_history JSONB;
+BEGIN
+    INSERT INTO conversations (session_id)
+    VALUES (p_session_id)
+    ON CONFLICT (session_id) DO UPDATE SET updated_at = NOW()
+    RETURNING id INTO v_conversation_id;
+
+    -- clock_timestamp() garante ordem estável entre mensagens do mesmo turno
+    INSERT INTO messages (conversation_id, content, role, timestamp)
+    SELECT v_conversation_id, m.value->>'content', m.value->>'role', clock_timestamp()
+    FROM jsonb_array_elements(p_messages) WITH ORDINALITY AS m(value, position)
+    ORDER BY m.position;
+
+    SELECT to_jsonb(c) INTO v_conversation
+    FROM conversations c
+    WHERE c.id = v_conversation_id;
+
+    SELECT COALESCE(jsonb_agg(to_jsonb(h) ORDER BY h.timestamp), '[]'::jsonb) INTO v_history
+    FROM (
+        SELECT *
+        FROM messages
+        WHERE conversation_id = v_conversation_id
+        ORDER BY timestamp DESC
+        LIMIT p_history_limit
+    ) h;
+
+    RETURN jsonb_build_object(
+        'conversation', v_conversation,
+        'history', v_history
+    );
+END;
+$$ language 'plpgsql';
+
 -- Políticas de segurança (RLS - Row Level Security)
 ALTER TABLE conversations ENABLE ROW LEVEL SECURITY;
 ALTER TABLE messages ENABLE ROW LEVEL SECURITY;
@@ -55,4 +154,6 @@ CREATE POLICY "Allow all operations on messages" ON messages
 COMMENT ON TABLE conversations IS 'Tabela para armazenar conversas por sessão';
 COMMENT ON TABLE messages IS 'Tabela para armazenar mensagens das conversas';
 COMMENT ON COLUMN conversations.session_id IS 'ID único da sessão do usuário';
+COMMENT ON COLUMN conversations.summary IS 'Resumo das mensagens até summarized_until';
+COMMENT ON COLUMN conversations.summarized_count IS 'Quantidade de mensagens já incorporadas ao resumo';
 COMMENT ON COLUMN messages.role IS 'Role da mensagem: user, assistant, ou system'; 
\ No newline at end of file
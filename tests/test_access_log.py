@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+import pytest
+
+from app.middleware import CLIENT_CLOSED_REQUEST, AccessLogMiddleware
+
+
+def scope(path="/chat/"):
+    return {"type": "http", "method": "POST", "path": path, "client": ("127.0.0.1", 1234), "headers": []}
+
+
+def run(app, receive_messages=({"type": "http.request", "body": b""},)):
+    messages = list(receive_messages)
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = AccessLogMiddleware(app, sample_rate=1.0, slow_threshold=60, skip_paths=["/health"])
+    asyncio.run(middleware(scope(), receive, send))
+    return sent
+
+
+def access_records(caplog):
+    return [record for record in caplog.records if record.name == "app.access"]
+
+
+@pytest.fixture(autouse=True)
+def capture(caplog):
+    caplog.set_level(logging.INFO, logger="app.access")
+
+
+def test_response_status_is_logged(caplog):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    run(app)
+
+    record, = access_records(caplog)
+    assert record.status == 201
+    assert record.disconnected is False
+
+
+def test_client_gone_before_response_is_499(caplog):
+    async def app(scope, receive, send):
+        # Handler que desiste ao ver a desconexão, sem responder
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    run(app, receive_messages=())
+
+    record, = access_records(caplog)
+    assert record.status == CLIENT_CLOSED_REQUEST
+    assert record.disconnected is True
+
+
+def test_cancelled_request_is_499(caplog):
+    async def app(scope, receive, send):
+        raise asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        run(app)
+
+    record, = access_records(caplog)
+    assert record.status == CLIENT_CLOSED_REQUEST
+
+
+def test_application_error_before_response_is_500(caplog):
+    async def app(scope, receive, send):
+        raise RuntimeError("falhou")
+
+    with pytest.raises(RuntimeError):
+        run(app)
+
+    record, = access_records(caplog)
+    assert record.status == 500
+    assert record.disconnected is False
@@ -0,0 +1,53 @@
+import pytest
+
+from app.services import audio_codecs
+from app.services.audio_codecs import MP3, OPUS, WEBM, negotiate_format
+
+
+@pytest.fixture
+def with_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio_codecs, "ffmpeg_available", lambda: True)
+
+
+@pytest.fixture
+def without_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio_codecs, "ffmpeg_available", lambda: False)
+
+
+def test_format_parameter_wins_over_accept(with_ffmpeg):
+    assert negotiate_format("webm", "audio/ogg") is WEBM
+    assert negotiate_format("OPUS", None) is OPUS
+    assert negotiate_format("mp3", "audio/webm") is MP3
+
+
+def test_unknown_format_parameter_is_rejected(with_ffmpeg):
+    with pytest.raises(ValueError):
+        negotiate_format("flac", None)
+
+
+def test_accept_picks_the_highest_quality(with_ffmpeg):
+    assert negotiate_format(None, "audio/mpeg;q=0.9, audio/webm;q=0.5") is MP3
+    assert negotiate_format(None, "audio/mpeg;q=0.5, audio/webm") is WEBM
+    assert negotiate_format(None, "audio/ogg; codecs=opus") is OPUS
+
+
+def test_ties_prefer_the_smaller_format(with_ffmpeg):
+    assert negotiate_format(None, "audio/mpeg, audio/webm, audio/ogg") is OPUS
+
+
+def test_wildcards_and_missing_accept_stay_mp3(with_ffmpeg):
+    assert negotiate_format(None, None) is MP3
+    assert negotiate_format(None, "*/*") is MP3
+    assert negotiate_format(None, "audio/*") is MP3
+
+
+def test_zero_or_invalid_quality_is_not_acceptable(with_ffmpeg):
+    assert negotiate_format(None, "audio/webm;q=0") is MP3
+    assert negotiate_format(None, "audio/webm;q=abc") is MP3
+
+
+def test_without_ffmpeg_everything_is_mp3(without_ffmpeg):
+    assert negotiate_format("opus", None) is MP3
+    assert negotiate_format(None, "audio/webm") is MP3
+    with pytest.raises(ValueError):
+        negotiate_format("flac", None)
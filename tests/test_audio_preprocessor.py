@@ -0,0 +1,48 @@
+import asyncio
+import io
+import sys
+import threading
+import time
+
+from app.config import settings
+from app.services import audio_preprocessor
+from app.services.audio_preprocessor import AudioPreprocessor
+
+
+class SlowUpload(io.BytesIO):
+    """Upload cuja leitura demora mais que o timeout do pré-processamento"""
+
+    def __init__(self, data: bytes, delay: float):
+        super().__init__(data)
+        self.delay = delay
+        self.reading = threading.Event()
+
+    def read(self, size=-1):
+        self.reading.set()
+        time.sleep(self.delay)
+        data = super().read(size)
+        self.reading.clear()
+        return data
+
+
+def test_timeout_waits_for_the_pending_read_before_rewinding(monkeypatch):
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def stalled_ffmpeg(*args, **kwargs):
+        # Não consome a entrada nem termina sozinho
+        return await create_subprocess_exec(
+            sys.executable, "-c", "import time; time.sleep(30)",
+            stdin=kwargs["stdin"], stdout=kwargs["stdout"], stderr=kwargs["stderr"]
+        )
+
+    monkeypatch.setattr(audio_preprocessor.asyncio, "create_subprocess_exec", stalled_ffmpeg)
+    monkeypatch.setattr(settings, "AUDIO_PREPROCESS_TIMEOUT", 0.05)
+    upload = SlowUpload(b"x" * (3 * audio_preprocessor.CHUNK_SIZE), delay=0.3)
+
+    result, filename = asyncio.run(AudioPreprocessor().process(upload, "clip.webm"))
+
+    assert result is upload
+    assert filename == "clip.webm"
+    # A leitura em andamento no timeout terminou antes do seek(0) do fallback
+    assert not upload.reading.is_set()
+    assert upload.tell() == 0
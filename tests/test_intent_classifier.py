@@ -0,0 +1,55 @@
+from app.services.intent_classifier import (
+    AI_IDENTITY, AI_QUESTION, FLAT_EARTH_TOPIC, GREETING, OFF_TOPIC,
+    KeywordMatcher, fold_text, user_intents
+)
+
+
+def test_fold_text_removes_accents_case_and_extra_spaces():
+    assert fold_text("  Você  É\tum RObô? ") == "voce e um robo?"
+    assert fold_text("plain ascii") == "plain ascii"
+
+
+def test_keywords_only_match_whole_words():
+    # "oi" dentro de "foi", "hi" dentro de "this"
+    assert GREETING not in user_intents.classify("Isso foi interessante")
+    assert GREETING not in user_intents.classify("this is it")
+    assert GREETING in user_intents.classify("Oi, tudo bem?")
+
+
+def test_accents_and_case_are_ignored():
+    assert user_intents.classify("OLA") == user_intents.classify("olá")
+    assert FLAT_EARTH_TOPIC in user_intents.classify("A FÍSICA explica?")
+    assert FLAT_EARTH_TOPIC in user_intents.classify("a fisica explica?")
+
+
+def test_longer_keywords_match_their_plural():
+    assert FLAT_EARTH_TOPIC in user_intents.classify("E os outros planetas?")
+    # Curtas demais para o plural: "sois" não é "sol"
+    assert FLAT_EARTH_TOPIC not in user_intents.classify("vocês sois")
+
+
+def test_all_intents_are_found_in_one_pass():
+    intents = user_intents.classify("Olá! Você é uma IA? Gosto de futebol e da terra plana.")
+
+    assert {GREETING, AI_QUESTION, AI_IDENTITY, OFF_TOPIC, FLAT_EARTH_TOPIC} <= intents
+
+
+def test_longer_match_keeps_intents_of_keywords_it_contains():
+    matcher = KeywordMatcher({"short": ["voce e"], "long": ["que voce e"]})
+
+    assert matcher.classify("Mas o que você é?") == {"short", "long"}
+
+
+def test_ai_identity_needs_an_explicit_phrase():
+    assert AI_IDENTITY in user_intents.classify("Você é uma IA?")
+    assert AI_IDENTITY in user_intents.classify("vc é um robô??")
+    assert AI_IDENTITY in user_intents.classify("Isso é inteligência artificial?")
+    # "Você é" + substantivos soltos em conversas comuns
+    assert AI_IDENTITY not in user_intents.classify("Você é fã do programa do Faustão?")
+    assert AI_IDENTITY not in user_intents.classify("Você é de onde? Trabalho com máquina de costura")
+    assert AI_IDENTITY not in user_intents.classify("Meu bot do Telegram parou")
+
+
+def test_overlapping_keywords_are_all_found():
+    # "voce e" e "e uma ia" dividem o "e"
+    assert {AI_QUESTION, AI_IDENTITY} <= user_intents.classify("você é uma ia")
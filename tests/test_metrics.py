@@ -0,0 +1,72 @@
+import os
+
+from app.services import metrics
+from app.services.metrics import MetricsRegistry, prompt_cache_stats, record_token_usage
+
+
+def make_registry():
+    registry = MetricsRegistry("test")
+    requests = registry.counter("requests_total", "Requisições", ("route",))
+    in_flight = registry.gauge("in_flight", "Em andamento")
+    latency = registry.histogram("latency_seconds", "Latência")
+    return registry, requests, in_flight, latency
+
+
+def worker_snapshot(pid, requests_count, in_flight_value, latency_value, hits):
+    registry, requests, in_flight, latency = make_registry()
+    registry.register_stats("cache", lambda: {"hits": hits})
+    requests.labels("/chat").inc(requests_count)
+    in_flight.labels().set(in_flight_value)
+    latency.observe(latency_value)
+    return {**registry.snapshot(), "pid": pid}
+
+
+def test_render_keeps_single_process_format():
+    registry, requests, _, _ = make_registry()
+    registry.register_stats("provider", lambda: {"gpt": {"limit": 4}}, label="provider")
+    requests.labels("/chat").inc()
+
+    text = registry.render()
+
+    assert 'test_requests_total{route="/chat"} 1' in text
+    assert 'test_provider_limit{provider="gpt"} 4' in text
+
+
+def test_workers_are_summed_and_dead_gauges_dropped(tmp_path):
+    directory = str(tmp_path)
+    dead_pid = 2 ** 22 + 12345  # Acima do pid_max padrão: nunca existe
+    live_pid = os.getppid()
+    MetricsRegistry.write_snapshot(directory, worker_snapshot(dead_pid, 5, 7, 0.02, 100))
+    MetricsRegistry.write_snapshot(directory, worker_snapshot(live_pid, 3, 2, 0.2, 10))
+
+    registry, requests, in_flight, latency = make_registry()
+    registry.register_stats("cache", lambda: {"hits": 1})
+    requests.labels("/chat").inc()
+    in_flight.labels().set(1)
+    latency.observe(2.0)
+
+    text = registry.render_workers(directory, registry.snapshot())
+
+    # Contadores e histogramas: todos os workers, inclusive o encerrado
+    assert 'test_requests_total{route="/chat"} 9' in text
+    assert "test_latency_seconds_count 3" in text
+    assert 'test_latency_seconds_bucket{le="0.025"} 1' in text
+    # Gauges e estatísticas: só os vivos, estatísticas por pid
+    assert "test_in_flight 3" in text
+    assert f'test_cache_hits{{pid="{live_pid}"}} 10' in text
+    assert f'test_cache_hits{{pid="{os.getpid()}"}} 1' in text
+    assert f'pid="{dead_pid}"' not in text
+    assert os.path.exists(os.path.join(directory, f"metrics-{os.getpid()}.json"))
+
+
+def test_prompt_cache_hit_rate_comes_from_the_token_counter(monkeypatch):
+    tokens = MetricsRegistry("test").counter("llm_tokens_total", "Tokens", ("purpose", "kind"))
+    monkeypatch.setattr(metrics, "llm_tokens", tokens)
+
+    assert prompt_cache_stats() == {"prompt_tokens": 0, "cached_tokens": 0, "hit_rate": 0.0}
+    assert tokens.render()[2:] == []
+
+    record_token_usage({"prompt_tokens": 1000, "completion_tokens": 50, "prompt_tokens_details": {"cached_tokens": 768}}, "chat")
+    record_token_usage({"prompt_tokens": 400, "prompt_tokens_details": {"cached_tokens": 400}}, "summary")
+
+    assert prompt_cache_stats() == {"prompt_tokens": 1000, "cached_tokens": 768, "hit_rate": 0.768}
@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.models import Conversation
+from app.services import openai_service as openai_module
+from app.services.concurrency import gpt_limiter
+from app.services.metrics import llm_first_token
+from app.services.openai_service import OpenAIService, PreparedTurn
+
+
+def chunk(text):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for part in self.parts:
+            await asyncio.sleep(0)
+            yield chunk(part)
+
+
+def make_service(monkeypatch, ready_reply=None, parts=()):
+    service = object.__new__(OpenAIService)
+    conversation = Conversation(id="conv-1", session_id="s1")
+    calls = []
+
+    async def prepare_turn(message, session_id):
+        return PreparedTurn(conversation, [{"role": "user", "content": message}], ready_reply=ready_reply)
+
+    async def finish_turn(conversation, assistant_message, delivered=False):
+        return assistant_message
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return FakeStream(list(parts))
+
+    monkeypatch.setattr(service, "_prepare_turn", prepare_turn, raising=False)
+    monkeypatch.setattr(service, "_finish_turn", finish_turn, raising=False)
+    monkeypatch.setattr(openai_module, "response_cache", SimpleNamespace(store=lambda *args: None))
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return service, calls
+
+
+def test_slot_is_released_before_the_client_reads_everything(monkeypatch):
+    service, _ = make_service(monkeypatch, parts=["Olá, ", "tudo ", "bem?"])
+    first_tokens = llm_first_token.labels("chat").count
+
+    async def scenario():
+        stream = service.stream_response("oi", "s1")
+        first = await stream.__anext__()
+        # Cliente parado no primeiro trecho: a leitura do modelo termina e solta a vaga
+        for _ in range(20):
+            await asyncio.sleep(0)
+        in_flight = gpt_limiter.in_flight
+        rest = [part async for part in stream]
+        return first, rest, in_flight
+
+    first, rest, in_flight = asyncio.run(scenario())
+
+    assert first + "".join(rest) == "Olá, tudo bem?"
+    assert in_flight == 0
+    assert llm_first_token.labels("chat").count == first_tokens + 1
+
+
+def test_ready_reply_does_not_call_the_model(monkeypatch):
+    service, calls = make_service(monkeypatch, ready_reply="Resposta pronta")
+
+    async def scenario():
+        return [part async for part in service.stream_response("oi", "s1")]
+
+    assert asyncio.run(scenario()) == ["Resposta pronta"]
+    assert calls == []
@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services import profiler as profiler_module
+from app.services.profiler import PROFILE_SUFFIX, ProfileStore, RequestProfiler
+
+
+pytest.importorskip("pyinstrument")
+
+
+def busy(seconds: float) -> None:
+    deadline = asyncio.get_event_loop().time() + seconds
+    while asyncio.get_event_loop().time() < deadline:
+        sum(range(1000))
+
+
+def test_request_profile_is_saved_in_speedscope_format(tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path), max_files=5)
+    monkeypatch.setattr(profiler_module, "profile_store", store)
+
+    async def scenario():
+        profiler = RequestProfiler.begin("POST", "/chat/stream", "abcdef0123456789")
+        # Um perfil por vez: o segundo pedido segue sem profiling
+        assert RequestProfiler.begin("GET", "/health", None) is None
+        busy(0.02)
+        await asyncio.sleep(0.01)
+        await profiler.finish()
+        return profiler
+
+    profiler = asyncio.run(scenario())
+
+    assert profiler.profile_id.endswith(f"-post-chat-stream-abcdef01{PROFILE_SUFFIX}")
+    with open(store.path(profiler.profile_id)) as f:
+        data = json.load(f)
+    assert data["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+    assert data["shared"]["frames"]
+    assert not RequestProfiler._active
+
+
+def test_store_keeps_only_the_newest_files(tmp_path):
+    store = ProfileStore(str(tmp_path), max_files=2)
+    for index in range(3):
+        store.save(f"{index}{PROFILE_SUFFIX}", "{}")
+
+    assert len(store.list()) == 2
+    assert store.path("../etc/passwd") is None
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+from app.models import Conversation, StoredMessage
+from app.services.session_cache import SessionCache
+
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_conversation(session_id: str = "s1", message_count: int = 0) -> Conversation:
+    return Conversation(id=f"conv-{session_id}", session_id=session_id, message_count=message_count)
+
+
+def make_messages(conversation: Conversation, count: int) -> list:
+    return [
+        StoredMessage(
+            id=f"{conversation.id}-{index}",
+            conversation_id=conversation.id,
+            content=f"mensagem {index}",
+            role="user" if index % 2 == 0 else "assistant",
+            timestamp=BASE_TIME + timedelta(seconds=index)
+        )
+        for index in range(count)
+    ]
+
+
+def test_get_returns_recent_messages_after_put():
+    cache = SessionCache(max_sessions=10, max_messages=5, ttl_seconds=60)
+    conversation = make_conversation(message_count=3)
+    cache.put(conversation, make_messages(conversation, 3), complete=True)
+
+    entry = cache.get("s1", 2)
+
+    assert entry is not None
+    assert [message.content for message in entry.recent(2)] == ["mensagem 1", "mensagem 2"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_incomplete_buffer_misses_reads_beyond_it():
+    cache = SessionCache(max_sessions=10, max_messages=3, ttl_seconds=60)
+    conversation = make_conversation(message_count=5)
+    cache.put(conversation, make_messages(conversation, 5), complete=True)
+
+    # Só as 3 últimas cabem no buffer: a conversa em cache não está completa
+    assert cache.get("s1", 3) is not None
+    assert cache.get("s1", 4) is None
+    assert cache.get("s1", None) is None
+
+
+def test_expired_entry_is_removed(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.session_cache.time.monotonic", lambda: now[0])
+    cache = SessionCache(max_sessions=10, max_messages=5, ttl_seconds=60)
+    cache.put(make_conversation(), [], complete=True)
+
+    now[0] += 61
+
+    assert cache.get("s1") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["sessions"] == 0
+
+
+def test_least_recently_used_session_is_evicted():
+    cache = SessionCache(max_sessions=2, max_messages=5, ttl_seconds=60)
+    for session_id in ("a", "b"):
+        cache.put(make_conversation(session_id), [], complete=True)
+    cache.get("a")
+
+    cache.put(make_conversation("c"), [], complete=True)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_append_message_updates_buffer_and_count():
+    cache = SessionCache(max_sessions=10, max_messages=2, ttl_seconds=60)
+    conversation = make_conversation(message_count=2)
+    messages = make_messages(conversation, 3)
+    cache.put(conversation, messages[:2], complete=True)
+
+    cache.append_message(messages[2])
+
+    entry = cache.get("s1", 2)
+    assert [message.id for message in entry.recent(None)] == [messages[1].id, messages[2].id]
+    assert entry.conversation.message_count == 3
+    # A mais antiga saiu do buffer: leituras da conversa inteira vão ao banco
+    assert not entry.complete
+
+
+def test_invalidate_conversation_removes_session():
+    cache = SessionCache(max_sessions=10, max_messages=5, ttl_seconds=60)
+    conversation = make_conversation()
+    cache.put(conversation, [], complete=True)
+
+    cache.invalidate_conversation(conversation.id)
+
+    assert cache.get("s1") is None
+    assert cache.get_by_conversation(conversation.id) is None
+
+
+def test_zero_capacity_disables_cache():
+    cache = SessionCache(max_sessions=0, max_messages=5, ttl_seconds=60)
+    cache.put(make_conversation(), [], complete=True)
+
+    assert cache.get("s1") is None
+    assert cache.stats() == {
+        "enabled": 0, "sessions": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0
+    }
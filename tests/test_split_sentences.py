@@ -0,0 +1,48 @@
+from app.services.audio_service import split_sentences
+
+
+def test_complete_sentences_are_split_and_rest_kept():
+    sentences, rest = split_sentences("Primeira frase aqui. Segunda frase! Terceira inc", 5)
+
+    assert sentences == ["Primeira frase aqui.", "Segunda frase!"]
+    assert rest == "Terceira inc"
+
+
+def test_sentence_needs_whitespace_after_punctuation():
+    # O stream pode parar no meio de "3.14" ou antes do espaço seguinte
+    sentences, rest = split_sentences("O valor é 3.14 e termina aqui.", 5)
+
+    assert sentences == []
+    assert rest == "O valor é 3.14 e termina aqui."
+
+
+def test_short_sentences_are_joined_with_the_next():
+    sentences, rest = split_sentences("Sim. Claro. Vou explicar isso agora. ", 20)
+
+    assert sentences == ["Sim. Claro. Vou explicar isso agora."]
+    assert rest == ""
+
+
+def test_closing_quotes_and_newlines_end_sentences():
+    sentences, rest = split_sentences('Ele disse "olhe o horizonte!" Depois\nveio o resto', 5)
+
+    assert sentences == ['Ele disse "olhe o horizonte!"', "Depois"]
+    assert rest == "veio o resto"
+
+
+def test_ellipsis_and_repeated_punctuation():
+    sentences, rest = split_sentences("Será mesmo?! Pense bem… E então", 5)
+
+    assert sentences == ["Será mesmo?!", "Pense bem…"]
+    assert rest == "E então"
+
+
+def test_feeding_the_rest_back_loses_no_text():
+    text = "Olá, tudo bem? Hoje vamos falar da água. Ela sempre busca o nível. Fim"
+    buffer, spoken = "", []
+    for index in range(0, len(text), 7):
+        buffer += text[index:index + 7]
+        sentences, buffer = split_sentences(buffer, 10)
+        spoken.extend(sentences)
+
+    assert " ".join(spoken + [buffer.strip()]) == text
@@ -0,0 +1,64 @@
+import pytest
+
+from app.services import token_budget
+from app.services.token_budget import MESSAGE_OVERHEAD_TOKENS, MIN_TRIMMED_TOKENS, count_tokens, fit_history
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # Contagem estimada (~4 caracteres/token): não depende do download do tokenizer
+    monkeypatch.setattr(token_budget, "_get_encoding", lambda: None)
+    count_tokens.cache_clear()
+    yield
+    count_tokens.cache_clear()
+
+
+def message(role: str, tokens: int, marker: str = "x") -> dict:
+    # len // 4 + 1 == tokens
+    return {"role": role, "content": marker * ((tokens - 1) * 4)}
+
+
+def cost(item: dict) -> int:
+    return count_tokens(item["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_history_within_budget_is_unchanged():
+    history = [message("user", 10), message("assistant", 20), message("user", 10)]
+
+    assert fit_history(history, sum(cost(item) for item in history)) == history
+
+
+def test_oldest_messages_are_dropped_first():
+    history = [message("user", 100, "a"), message("assistant", 100, "b"), message("user", 10, "c")]
+    budget = cost(history[1]) + cost(history[2])
+
+    assert fit_history(history, budget) == history[1:]
+
+
+def test_older_message_is_trimmed_keeping_its_end():
+    older = {"role": "assistant", "content": "a" * 400 + "b" * 200}
+    newest = message("user", 10)
+    budget = cost(newest) + MESSAGE_OVERHEAD_TOKENS + 50
+
+    fitted = fit_history([older, newest], budget)
+
+    assert fitted[-1] == newest
+    assert fitted[0]["role"] == "assistant"
+    assert fitted[0]["content"] == older["content"][-200:]
+
+
+def test_small_leftover_is_not_used_for_a_trimmed_message():
+    history = [message("assistant", 200), message("user", 10)]
+    budget = cost(history[1]) + MESSAGE_OVERHEAD_TOKENS + MIN_TRIMMED_TOKENS - 1
+
+    assert fit_history(history, budget) == history[1:]
+
+
+def test_newest_message_is_kept_intact_over_budget():
+    history = [message("assistant", 50), message("user", 500)]
+
+    assert fit_history(history, 100) == history[1:]
+
+
+def test_empty_history():
+    assert fit_history([], 100) == []
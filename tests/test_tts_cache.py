@@ -0,0 +1,96 @@
+import os
+import time
+
+from app.services import tts_cache
+from app.services.tts_cache import TEMP_GRACE_SECONDS, TTSCache
+
+
+def test_least_recently_used_audio_is_evicted(tmp_path):
+    cache = TTSCache(str(tmp_path), max_bytes=20)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    cache.get("a")
+
+    cache.put("c", b"x" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_pinned_audio_is_never_evicted(tmp_path):
+    cache = TTSCache(str(tmp_path), max_bytes=20)
+    cache.put("fixed", b"f" * 10)
+    assert cache.pin("fixed")
+
+    for key in ("a", "b", "c", "d"):
+        cache.put(key, b"x" * 10)
+
+    assert cache.get("fixed") == b"f" * 10
+    stats = cache.stats()
+    assert stats["pinned_entries"] == 1
+    assert stats["pinned_bytes"] == 10
+    # O limite continua valendo para os áudios dinâmicos
+    assert stats["bytes"] == 20
+
+
+def test_pin_of_missing_audio_fails(tmp_path):
+    cache = TTSCache(str(tmp_path), max_bytes=20)
+
+    assert not cache.pin("missing")
+    assert not list(tmp_path.glob("*.pin"))
+
+
+def test_budget_is_shared_between_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_cache, "RESCAN_SECONDS", 0)
+    first = TTSCache(str(tmp_path), max_bytes=30)
+    second = TTSCache(str(tmp_path), max_bytes=30)
+    first.put("a", b"x" * 10)
+    first.put("b", b"x" * 10)
+
+    # O segundo worker não conhecia "a" nem "b": a releitura do diretório os inclui no despejo
+    second.put("c", b"x" * 10)
+    second.put("d", b"x" * 10)
+
+    assert sorted(path.name for path in tmp_path.glob("*.mp3")) == ["b.mp3", "c.mp3", "d.mp3"]
+
+
+def test_audio_pinned_by_one_worker_survives_the_other(tmp_path):
+    first = TTSCache(str(tmp_path), max_bytes=20)
+    second = TTSCache(str(tmp_path), max_bytes=20)
+    first.put("fixed", b"f" * 10)
+    # O segundo worker já tinha o áudio no índice antes da fixação
+    assert second.get("fixed") == b"f" * 10
+    assert first.pin("fixed")
+
+    for key in ("a", "b", "c", "d"):
+        second.put(key, b"x" * 10)
+
+    assert first.get("fixed") == b"f" * 10
+    assert first.stats()["pinned_entries"] == 1
+    assert second.stats()["pinned_entries"] == 1
+    assert second.stats()["bytes"] == 20
+
+
+def test_pins_survive_a_restart(tmp_path):
+    cache = TTSCache(str(tmp_path), max_bytes=20)
+    cache.put("fixed", b"f" * 10)
+    cache.pin("fixed")
+
+    restarted = TTSCache(str(tmp_path), max_bytes=10)
+
+    assert restarted.stats()["pinned_entries"] == 1
+    assert restarted.get("fixed") == b"f" * 10
+
+
+def test_only_stale_temp_files_are_removed_on_start(tmp_path):
+    stale = tmp_path / "old.tmp"
+    stale.write_bytes(b"x")
+    os.utime(stale, (time.time() - TEMP_GRACE_SECONDS - 1,) * 2)
+    fresh = tmp_path / "writing.tmp"
+    fresh.write_bytes(b"x")
+
+    TTSCache(str(tmp_path), max_bytes=20)
+
+    assert not stale.exists()
+    assert fresh.exists()
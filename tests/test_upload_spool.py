@@ -0,0 +1,29 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.formparsers import MultiPartParser
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.middleware import set_upload_spool_threshold
+
+
+async def inspect_upload(request):
+    form = await request.form()
+    upload = form["audio_file"]
+    return JSONResponse({"size": len(await upload.read()), "on_disk": upload.file._rolled})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Restaura o limite global do Starlette ao fim do teste
+    monkeypatch.setattr(MultiPartParser, "max_file_size", MultiPartParser.max_file_size)
+    set_upload_spool_threshold(1024)
+    return TestClient(Starlette(routes=[Route("/upload", inspect_upload, methods=["POST"])]))
+
+
+@pytest.mark.parametrize("size, on_disk", [(1024, False), (1025, True)])
+def test_uploads_above_the_threshold_are_spooled_to_disk(client, size, on_disk):
+    response = client.post("/upload", files={"audio_file": ("clip.webm", b"x" * size, "audio/webm")})
+
+    assert response.json() == {"size": size, "on_disk": on_disk}
@@ -0,0 +1,86 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from app.config import settings
+from app.services import tracing
+from app.services.voice_jobs import FAILED, QUEUED, VoiceJobQueue, VoiceJobQueueFull
+
+
+def make_queue(directory) -> VoiceJobQueue:
+    return VoiceJobQueue(str(directory), max_queue=2, workers=1, ttl_seconds=60)
+
+
+def test_queued_state_is_persisted_before_the_job_is_enqueued(tmp_path):
+    queue = make_queue(tmp_path)
+    persisted = []
+
+    def put_nowait(item):
+        job = item[0]
+        # O que um worker de outro processo leria no instante em que o job fica disponível
+        persisted.append(json.loads((tmp_path / f"{job.job_id}.json").read_text()))
+
+    async def scenario():
+        queue._queue.put_nowait = put_nowait
+        return await queue.submit(io.BytesIO(b"audio"), "clip.webm", "sessao")
+
+    job = asyncio.run(scenario())
+
+    assert [(state["status"], state["version"]) for state in persisted] == [(QUEUED, 1)]
+    assert queue._jobs == {job.job_id: job}
+
+
+def test_job_rejected_by_a_full_queue_leaves_no_state(tmp_path):
+    queue = make_queue(tmp_path)
+
+    def put_nowait(item):
+        # Fila encheu enquanto o estado era gravado
+        raise asyncio.QueueFull()
+
+    async def scenario():
+        queue._queue.put_nowait = put_nowait
+        with pytest.raises(VoiceJobQueueFull):
+            await queue.submit(io.BytesIO(b"audio"), "clip.webm", "sessao")
+
+    asyncio.run(scenario())
+
+    assert queue._jobs == {}
+    assert list(tmp_path.iterdir()) == []
+    assert queue.stats()["rejected"] == 1
+
+
+class NoSpeechAudioService:
+    async def transcribe_audio(self, audio_file, filename):
+        return ""
+
+
+def test_job_span_is_a_child_of_the_request_span(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_ENABLED", True)
+    monkeypatch.setattr(settings, "TRACE_SAMPLE_RATE", 1.0)
+    exported = []
+    monkeypatch.setattr(tracing.span_exporter, "export", lambda spans: exported.extend(span.to_dict() for span in spans))
+    queue = make_queue(tmp_path)
+
+    async def request():
+        root = tracing.start_trace("POST /chat/audio/jobs")
+        job = await queue.submit(io.BytesIO(b"audio"), "clip.webm", "sessao")
+        tracing.end_span(root)
+        return job
+
+    async def scenario():
+        job = await asyncio.create_task(request())
+        queue._audio_service = NoSpeechAudioService()
+        worker = asyncio.create_task(queue._worker())
+        await queue._queue.join()
+        worker.cancel()
+        return job
+
+    job = asyncio.run(scenario())
+
+    spans = {span["name"]: span for span in exported}
+    assert job.status == FAILED
+    assert spans["voice_job"]["traceId"] == spans["POST /chat/audio/jobs"]["traceId"]
+    assert spans["voice_job"]["parentSpanId"] == spans["POST /chat/audio/jobs"]["spanId"]
+    assert [span["parentSpanId"] for span in exported].count(None) == 1
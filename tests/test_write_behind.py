@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+
+from app.services.write_behind import WriteBehindLog
+
+
+def status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://supabase.test/messages")
+    return httpx.HTTPStatusError("erro", request=request, response=httpx.Response(status_code, request=request))
+
+
+def make_log(directory, compact_bytes: int = 0) -> WriteBehindLog:
+    # flush_interval alto: a gravação em segundo plano não roda durante o teste
+    return WriteBehindLog(str(directory), batch_size=100, flush_interval=3600, compact_bytes=compact_bytes)
+
+
+def wal_lines(log: WriteBehindLog) -> list:
+    with open(log._wal_path, "rb") as f:
+        return [json.loads(line) for line in f]
+
+
+async def crash(log: WriteBehindLog) -> None:
+    """Encerrar sem a última gravação: o WAL fica como estava e o flock é solto"""
+    log._task.cancel()
+    try:
+        await log._task
+    except asyncio.CancelledError:
+        pass
+    log._wal_file.close()
+    log._lock_file.close()
+
+
+async def noop_insert(rows):
+    pass
+
+
+def test_pending_messages_are_replayed_after_a_crash(tmp_path):
+    inserted = []
+
+    async def insert(rows):
+        inserted.extend(rows)
+
+    async def scenario():
+        first = make_log(tmp_path)
+        await first.start(noop_insert)
+        messages = [await first.append("conv-1", f"mensagem {index}", "user") for index in range(3)]
+        await crash(first)
+
+        second = make_log(tmp_path)
+        await second.start(insert)
+        assert [message.id for message in second.pending_for("conv-1")] == [message.id for message in messages]
+        await second.flush()
+        await crash(second)
+        return messages, second
+
+    messages, second = asyncio.run(scenario())
+
+    assert [row["id"] for row in inserted] == [message.id for message in messages]
+    assert second.stats()["replayed"] == 3
+    assert second.stats()["pending"] == 0
+
+
+def test_wal_of_a_dead_process_is_claimed(tmp_path):
+    entry = {
+        "id": "msg-1", "conversation_id": "conv-1", "content": "órfã",
+        "role": "user", "timestamp": "2024-01-01T00:00:00+00:00"
+    }
+    (tmp_path / "wal-999999.jsonl").write_text(json.dumps(entry) + "\n" + '{"id": "cortada', encoding="utf-8")
+    (tmp_path / "wal-999999.lock").write_text("")
+
+    async def scenario():
+        log = make_log(tmp_path)
+        await log.start(noop_insert)
+        pending = log.pending_for("conv-1")
+        await crash(log)
+        return log, pending
+
+    log, pending = asyncio.run(scenario())
+
+    assert [message.content for message in pending] == ["órfã"]
+    assert not (tmp_path / "wal-999999.jsonl").exists()
+    assert not (tmp_path / "wal-999999.lock").exists()
+    # Reescrita no WAL do processo antes de o órfão ser apagado
+    assert [line["id"] for line in wal_lines(log)] == ["msg-1"]
+
+
+@pytest.mark.parametrize("status_code", [401, 403, 408, 429, 500, 503])
+def test_service_errors_keep_messages_for_retry(tmp_path, status_code):
+    async def insert(rows):
+        raise status_error(status_code)
+
+    async def scenario():
+        log = make_log(tmp_path)
+        await log.start(insert)
+        await log.append("conv-1", "mensagem", "user")
+        with pytest.raises(httpx.HTTPStatusError):
+            await log.flush()
+        stats = log.stats()
+        await crash(log)
+        return log, stats
+
+    log, stats = asyncio.run(scenario())
+
+    assert stats["pending"] == 1
+    assert stats["dropped"] == 0
+    assert len(wal_lines(log)) == 1
+
+
+@pytest.mark.parametrize("status_code", [400, 409, 422])
+def test_only_rejected_rows_are_dropped(tmp_path, status_code):
+    inserted = []
+
+    async def insert(rows):
+        if any(row["conversation_id"] == "apagada" for row in rows):
+            raise status_error(status_code)
+        inserted.extend(rows)
+
+    async def scenario():
+        log = make_log(tmp_path)
+        await log.start(insert)
+        kept = await log.append("conv-1", "fica", "user")
+        await log.append("apagada", "sai", "user")
+        written = await log.flush()
+        stats = log.stats()
+        await crash(log)
+        return kept, written, stats
+
+    kept, written, stats = asyncio.run(scenario())
+
+    assert written == 1
+    assert [row["id"] for row in inserted] == [kept.id]
+    assert stats["dropped"] == 1
+    assert stats["pending"] == 0
+
+
+def test_wal_is_compacted_only_above_the_threshold(tmp_path):
+    async def scenario(compact_bytes):
+        log = make_log(tmp_path / str(compact_bytes), compact_bytes=compact_bytes)
+        await log.start(noop_insert)
+        await log.append("conv-1", "mensagem", "user")
+        await log.flush()
+        await crash(log)
+        return log
+
+    small = asyncio.run(scenario(1))
+    large = asyncio.run(scenario(1024 * 1024))
+
+    assert wal_lines(small) == []
+    assert small.stats()["compactions"] == 1
+    # Abaixo do limite a linha já gravada fica (o replay é idempotente)
+    assert len(wal_lines(large)) == 1
+    assert large.stats()["compactions"] == 0
+
+
+def test_compaction_skips_when_wal_grew_after_the_snapshot(tmp_path):
+    async def scenario():
+        log = make_log(tmp_path, compact_bytes=1)
+        await log.start(noop_insert)
+        snapshot_bytes = log._wal_bytes
+        # Escrita concorrente entre o retrato da fila (vazia) e a compactação
+        message = await log.append("conv-1", "nova", "user")
+        compacted = log._compact([], snapshot_bytes)
+        await crash(log)
+        return log, message, compacted
+
+    log, message, compacted = asyncio.run(scenario())
+
+    assert not compacted
+    assert [line["id"] for line in wal_lines(log)] == [message.id]